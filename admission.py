@@ -0,0 +1,139 @@
+import asyncio
+import itertools
+import math
+import time
+from contextlib import asynccontextmanager
+
+
+# ==============================
+# Admission Control
+# ==============================
+class Overloaded(Exception):
+    """No slot became free in time; the client should retry after ``retry_after`` seconds"""
+
+    def __init__(self, route: str, reason: str, retry_after: float):
+        super().__init__(f"{route}: {reason}")
+        self.route = route
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class RouteLimit:
+    def __init__(self, limit: int, queue: int, max_wait: float, priority: bool = False):
+        self.limit = limit          # requests of this route running at once
+        self.queue = queue          # requests of this route waiting for a slot
+        self.max_wait = max_wait    # seconds a request may wait before it is turned away
+        self.priority = priority    # served first and may use the reserved slots
+        self.in_flight = 0
+        self.waiting = 0
+        self.avg_seconds = 0.0      # moving average of time in flight, for Retry-After
+
+
+class _Waiter:
+    def __init__(self, route: str, priority: bool, seq: int, future):
+        self.route = route
+        self.rank = (not priority, seq)
+        self.future = future
+
+
+class AdmissionControl:
+    """Per-route concurrency limits with a bounded wait queue in front of them.
+
+    At most ``capacity`` limited requests run at once, and ``reserve`` of those
+    slots are kept for priority routes, so a flood of payments cannot lock out
+    logins. A request that finds no free slot waits up to its route's
+    ``max_wait`` seconds; when the route's queue is already full it is turned
+    away at once. Freed slots go to priority waiters first, then in arrival
+    order. Routes without a limit pass straight through.
+
+    Used from the event loop only, so no locking is needed. Limits are per
+    worker process.
+    """
+
+    def __init__(self, capacity: int, reserve: int = 0):
+        self.capacity = capacity
+        self.reserve = min(reserve, capacity)
+        self.in_flight = 0
+        self.routes = {}
+        self._waiters = []
+        self._seq = itertools.count()
+
+    def limit(self, route: str, limit: int, queue: int, max_wait: float, priority: bool = False):
+        self.routes[route] = RouteLimit(limit, queue, max_wait, priority)
+
+    def _has_room(self, limit: RouteLimit) -> bool:
+        capacity = self.capacity if limit.priority else self.capacity - self.reserve
+        return limit.in_flight < limit.limit and self.in_flight < capacity
+
+    def _start(self, limit: RouteLimit):
+        limit.in_flight += 1
+        self.in_flight += 1
+
+    def _finish(self, limit: RouteLimit, seconds: float):
+        limit.in_flight -= 1
+        self.in_flight -= 1
+        limit.avg_seconds = seconds if not limit.avg_seconds else 0.8 * limit.avg_seconds + 0.2 * seconds
+        self._dispatch()
+
+    def _dispatch(self):
+        """Hand free slots to waiting requests, priority routes first"""
+        for waiter in sorted(self._waiters, key=lambda w: w.rank):
+            limit = self.routes[waiter.route]
+            if waiter.future.done():
+                self._waiters.remove(waiter)
+            elif self._has_room(limit):
+                self._waiters.remove(waiter)
+                limit.waiting -= 1
+                self._start(limit)
+                waiter.future.set_result(True)
+
+    def retry_after(self, route: str) -> int:
+        """Seconds until the queue of ``route`` has likely drained"""
+        limit = self.routes[route]
+        return max(1, math.ceil(limit.avg_seconds * (limit.waiting + 1) / max(1, limit.limit)))
+
+    async def _acquire(self, route: str, limit: RouteLimit):
+        # Queue behind earlier requests of the same route rather than overtaking them
+        if not limit.waiting and self._has_room(limit):
+            self._start(limit)
+            return
+        if limit.waiting >= limit.queue:
+            raise Overloaded(route, "queue_full", self.retry_after(route))
+
+        waiter = _Waiter(route, limit.priority, next(self._seq), asyncio.get_running_loop().create_future())
+        self._waiters.append(waiter)
+        limit.waiting += 1
+        try:
+            await asyncio.wait_for(asyncio.shield(waiter.future), limit.max_wait)
+        except (asyncio.TimeoutError, asyncio.CancelledError) as e:
+            if waiter.future.done():
+                # Granted a slot just as the wait ended
+                if isinstance(e, asyncio.TimeoutError):
+                    return
+                self._finish(limit, 0.0)
+            else:
+                waiter.future.cancel()
+                self._waiters.remove(waiter)
+                limit.waiting -= 1
+            if isinstance(e, asyncio.TimeoutError):
+                raise Overloaded(route, "timeout", self.retry_after(route))
+            raise
+
+    @asynccontextmanager
+    async def slot(self, route: str):
+        """Hold one of the route's slots for the duration of the block; raises Overloaded"""
+        limit = self.routes.get(route)
+        if limit is None:
+            yield
+            return
+        await self._acquire(route, limit)
+        start = time.monotonic()
+        try:
+            yield
+        finally:
+            self._finish(limit, time.monotonic() - start)
+
+    def stats(self) -> dict:
+        return {route: {"limit": limit.limit, "in_flight": limit.in_flight, "waiting": limit.waiting,
+                        "queue": limit.queue, "priority": limit.priority}
+                for route, limit in self.routes.items()}
@@ -0,0 +1,267 @@
+import threading
+import time
+from datetime import datetime
+
+from state import SQLiteDB, file_lock
+from storage import TIME_FORMAT
+
+
+# ==============================
+# Materialized Stats
+# ==============================
+def session_seconds(login: dict) -> float:
+    """Length of a closed login in seconds, from its timestamps (or the hours_spent text)"""
+    try:
+        spent = datetime.strptime(login["logout_time"], TIME_FORMAT) - datetime.strptime(login["login_time"], TIME_FORMAT)
+        return max(0.0, spent.total_seconds())
+    except (KeyError, TypeError, ValueError):
+        pass
+    # "H:MM:SS" or "N day(s), H:MM:SS" as written by hours_spent()
+    try:
+        text = str(login.get("hours_spent") or "")
+        days = 0
+        if "day" in text:
+            day_part, text = text.split(",", 1)
+            days = int(day_part.split()[0])
+        hours, minutes, seconds = text.strip().split(":")
+        return days * 86400 + int(hours) * 3600 + int(minutes) * 60 + float(seconds)
+    except ValueError:
+        return 0.0
+
+
+def payment_amount(payment: dict) -> float:
+    try:
+        return float(str(payment.get("amount", "")).replace(",", "").strip())
+    except ValueError:
+        return 0.0
+
+
+class Aggregates:
+    """Login hours per user and revenue per project, kept up to date as they are written.
+
+    ``add_session`` and ``add_payment`` are called right after a logout or a
+    payment is stored, so reading the stats never scans the records. The
+    totals are built once from the storage with ``bootstrap``.
+    """
+
+    BOOTSTRAP_BATCH = 5000  # records read per storage call while bootstrapping
+
+    def add_session(self, login: dict):
+        raise NotImplementedError
+
+    def add_payment(self, payment: dict):
+        raise NotImplementedError
+
+    def logins(self) -> dict:
+        raise NotImplementedError
+
+    def payments(self) -> dict:
+        raise NotImplementedError
+
+    def bootstrap(self, storage, force: bool = False):
+        """Rebuild the totals from every closed login and payment in ``storage``"""
+        raise NotImplementedError
+
+    def retry_bootstrap(self, storage, interval: float):
+        """Keep calling ``bootstrap`` every ``interval`` seconds in a daemon thread until it succeeds"""
+        def run():
+            while True:
+                time.sleep(interval)
+                try:
+                    self.bootstrap(storage)
+                    return
+                except Exception as e:
+                    print(f"⚠️ Error bootstrapping stats, retrying in {interval:.0f}s:", e)
+
+        thread = threading.Thread(target=run, name="stats-bootstrap", daemon=True)
+        thread.start()
+        return thread
+
+    def _scan(self, storage):
+        """Fold every closed login and every payment in ``storage`` into fresh totals"""
+        users, projects = {}, {}
+        for login in self._all(storage, "loginhistory"):
+            if not login["logout_time"] or not login["email"]:
+                continue
+            user = users.setdefault(login["email"].strip().lower(), {
+                "username": "", "sessions": 0, "seconds": 0.0, "last_logout": ""})
+            _fold_session(user, login)
+        for payment in self._all(storage, "payment"):
+            project = projects.setdefault(str(payment["project"]), {"payments": 0, "revenue": 0.0, "last_payment": ""})
+            _fold_payment(project, payment)
+        return users, projects
+
+    def _all(self, storage, kind: str):
+        after = 0
+        while True:
+            batch = storage.records(kind, after=after, limit=self.BOOTSTRAP_BATCH)
+            for _, record in batch:
+                yield record
+            if len(batch) < self.BOOTSTRAP_BATCH:
+                return
+            after = batch[-1][0]
+
+
+def _fold_session(user: dict, login: dict):
+    user["username"] = login.get("username") or user["username"]
+    user["sessions"] += 1
+    user["seconds"] += session_seconds(login)
+    user["last_logout"] = max(user["last_logout"], login["logout_time"])
+
+
+def _fold_payment(project: dict, payment: dict):
+    project["payments"] += 1
+    project["revenue"] += payment_amount(payment)
+    project["last_payment"] = max(project["last_payment"], str(payment["payment_time"]))
+
+
+def _login_stats(users: dict, built_at) -> dict:
+    per_user = {email: dict(user, hours=round(user["seconds"] / 3600, 2)) for email, user in users.items()}
+    return {
+        "users": len(per_user),
+        "sessions": sum(user["sessions"] for user in per_user.values()),
+        "hours": round(sum(user["seconds"] for user in per_user.values()) / 3600, 2),
+        "bootstrapped_at": built_at,
+        "per_user": per_user,
+    }
+
+
+def _payment_stats(projects: dict, built_at) -> dict:
+    per_project = {name: dict(project, revenue=round(project["revenue"], 2)) for name, project in projects.items()}
+    return {
+        "payments": sum(project["payments"] for project in per_project.values()),
+        "revenue": round(sum(project["revenue"] for project in per_project.values()), 2),
+        "bootstrapped_at": built_at,
+        "per_project": per_project,
+    }
+
+
+class MemoryAggregates(Aggregates):
+    """Totals in process memory – pairs with MemoryStorage"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._users = {}     # {email.lower(): {username, sessions, seconds, last_logout}}
+        self._projects = {}  # {project: {payments, revenue, last_payment}}
+        self._built_at = None
+
+    def bootstrap(self, storage, force: bool = False):
+        if self._built_at is not None and not force:
+            return
+        users, projects = self._scan(storage)
+        with self._lock:
+            self._users, self._projects = users, projects
+            self._built_at = time.time()
+
+    def add_session(self, login: dict):
+        with self._lock:
+            user = self._users.setdefault(login["email"].strip().lower(), {
+                "username": "", "sessions": 0, "seconds": 0.0, "last_logout": ""})
+            _fold_session(user, login)
+
+    def add_payment(self, payment: dict):
+        with self._lock:
+            project = self._projects.setdefault(str(payment["project"]), {
+                "payments": 0, "revenue": 0.0, "last_payment": ""})
+            _fold_payment(project, payment)
+
+    def logins(self) -> dict:
+        with self._lock:
+            return _login_stats({email: dict(user) for email, user in self._users.items()}, self._built_at)
+
+    def payments(self) -> dict:
+        with self._lock:
+            return _payment_stats({name: dict(project) for name, project in self._projects.items()}, self._built_at)
+
+
+class SQLiteAggregates(Aggregates):
+    """Totals in a WAL-mode SQLite file, so every worker on the host adds to the same numbers.
+
+    The bootstrap runs once per state directory: the first worker to start
+    reads the storage under a file lock while the others wait, then skip it.
+    """
+
+    SCHEMA = """
+    CREATE TABLE IF NOT EXISTS login_stats (
+        email TEXT PRIMARY KEY,
+        username TEXT NOT NULL DEFAULT '',
+        sessions INTEGER NOT NULL DEFAULT 0,
+        seconds REAL NOT NULL DEFAULT 0,
+        last_logout TEXT NOT NULL DEFAULT ''
+    );
+    CREATE TABLE IF NOT EXISTS payment_stats (
+        project TEXT PRIMARY KEY,
+        payments INTEGER NOT NULL DEFAULT 0,
+        revenue REAL NOT NULL DEFAULT 0,
+        last_payment TEXT NOT NULL DEFAULT ''
+    );
+    CREATE TABLE IF NOT EXISTS stats_meta (
+        name TEXT PRIMARY KEY,
+        value REAL NOT NULL
+    );
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.db = SQLiteDB(path, self.SCHEMA)
+
+    def _built_at(self):
+        row = self.db.execute("SELECT value FROM stats_meta WHERE name = 'bootstrapped_at'").fetchone()
+        return row[0] if row else None
+
+    def bootstrap(self, storage, force: bool = False):
+        with file_lock(self.path):
+            if self._built_at() is not None and not force:
+                return
+            users, projects = self._scan(storage)
+            conn = self.db.conn()
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                conn.execute("DELETE FROM login_stats")
+                conn.execute("DELETE FROM payment_stats")
+                conn.executemany(
+                    "INSERT INTO login_stats (email, username, sessions, seconds, last_logout) VALUES (?, ?, ?, ?, ?)",
+                    [(email, u["username"], u["sessions"], u["seconds"], u["last_logout"]) for email, u in users.items()],
+                )
+                conn.executemany(
+                    "INSERT INTO payment_stats (project, payments, revenue, last_payment) VALUES (?, ?, ?, ?)",
+                    [(name, p["payments"], p["revenue"], p["last_payment"]) for name, p in projects.items()],
+                )
+                conn.execute("INSERT OR REPLACE INTO stats_meta (name, value) VALUES ('bootstrapped_at', ?)",
+                             (time.time(),))
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+        print(f"ℹ️ Stats bootstrapped ({len(users)} users, {len(projects)} projects).")
+
+    def add_session(self, login: dict):
+        self.db.execute(
+            "INSERT INTO login_stats (email, username, sessions, seconds, last_logout) VALUES (?, ?, 1, ?, ?) "
+            "ON CONFLICT (email) DO UPDATE SET "
+            "username = CASE WHEN excluded.username != '' THEN excluded.username ELSE username END, "
+            "sessions = sessions + 1, seconds = seconds + excluded.seconds, "
+            "last_logout = max(last_logout, excluded.last_logout)",
+            (login["email"].strip().lower(), login.get("username") or "", session_seconds(login), login["logout_time"]),
+        )
+
+    def add_payment(self, payment: dict):
+        self.db.execute(
+            "INSERT INTO payment_stats (project, payments, revenue, last_payment) VALUES (?, 1, ?, ?) "
+            "ON CONFLICT (project) DO UPDATE SET "
+            "payments = payments + 1, revenue = revenue + excluded.revenue, "
+            "last_payment = max(last_payment, excluded.last_payment)",
+            (str(payment["project"]), payment_amount(payment), str(payment["payment_time"])),
+        )
+
+    def logins(self) -> dict:
+        rows = self.db.execute("SELECT email, username, sessions, seconds, last_logout FROM login_stats").fetchall()
+        users = {email: {"username": username, "sessions": sessions, "seconds": seconds, "last_logout": last_logout}
+                 for email, username, sessions, seconds, last_logout in rows}
+        return _login_stats(users, self._built_at())
+
+    def payments(self) -> dict:
+        rows = self.db.execute("SELECT project, payments, revenue, last_payment FROM payment_stats").fetchall()
+        projects = {project: {"payments": payments, "revenue": revenue, "last_payment": last_payment}
+                    for project, payments, revenue, last_payment in rows}
+        return _payment_stats(projects, self._built_at())
@@ -0,0 +1,221 @@
+"""In-memory stand-in for the Google Sheets v4 values API.
+
+Implements values.get / update / append / batchGet / batchUpdate over plain
+HTTP, which is enough for main.py. Point the app at it with
+
+    SHEETS_API_ENDPOINT=http://127.0.0.1:<port>/  GOOGLE_CREDS=anonymous
+
+Every request sleeps ``latency`` seconds first to imitate Google's round trip.
+With ``quota_per_minute`` set, reads and writes beyond that many in the last
+minute get HTTP 429 like the real API.
+"""
+import json
+import re
+import threading
+import time
+import urllib.parse
+from collections import Counter, deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+A1_RE = re.compile(r"^([A-Z]*)(\d*)$")
+
+
+def column_index(letters: str) -> int:
+    index = 0
+    for ch in letters:
+        index = index * 26 + (ord(ch) - ord("A") + 1)
+    return index - 1
+
+
+def column_letters(index: int) -> str:
+    letters = ""
+    index += 1
+    while index:
+        index, rem = divmod(index - 1, 26)
+        letters = chr(ord("A") + rem) + letters
+    return letters
+
+
+def parse_range(a1: str):
+    """'sheet!A2:F' -> (sheet, first_row, last_row, first_col, last_col); rows 1-based, None = open"""
+    sheet, _, cells = a1.partition("!")
+    sheet = sheet.strip("'")
+    if not cells:
+        return sheet, 1, None, 0, None
+    start, _, end = cells.partition(":")
+    start_col, start_row = A1_RE.match(start).groups()
+    if end:
+        end_col, end_row = A1_RE.match(end).groups()
+    else:
+        end_col, end_row = start_col, start_row
+    return (
+        sheet,
+        int(start_row) if start_row else 1,
+        int(end_row) if end_row else None,
+        column_index(start_col) if start_col else 0,
+        column_index(end_col) if end_col else None,
+    )
+
+
+class FakeSheets:
+    """Sheet contents keyed by (spreadsheet_id, sheet_name) -> list of rows"""
+
+    def __init__(self, latency: float = 0.0, quota_per_minute: int = 0):
+        self.latency = latency
+        self.quota_per_minute = quota_per_minute
+        self.sheets = {}
+        self.calls = Counter()
+        self.recent = {"read": deque(), "write": deque()}
+        self.lock = threading.Lock()
+
+    def over_quota(self, kind: str) -> bool:
+        if not self.quota_per_minute:
+            return False
+        now = time.monotonic()
+        recent = self.recent[kind]
+        while recent and now - recent[0] > 60:
+            recent.popleft()
+        if len(recent) >= self.quota_per_minute:
+            self.calls["rate_limited"] += 1
+            return True
+        recent.append(now)
+        return False
+
+    def _rows(self, spreadsheet_id, sheet):
+        return self.sheets.setdefault((spreadsheet_id, sheet), [])
+
+    def get(self, spreadsheet_id, a1):
+        sheet, r1, r2, c1, c2 = parse_range(a1)
+        rows = self._rows(spreadsheet_id, sheet)
+        selected = rows[r1 - 1:r2]
+        values = [row[c1:(c2 + 1 if c2 is not None else None)] for row in selected]
+        # Sheets omits trailing empty cells and rows
+        for row in values:
+            while row and row[-1] in ("", None):
+                row.pop()
+        while values and not values[-1]:
+            values.pop()
+        result = {"range": a1, "majorDimension": "ROWS"}
+        if values:
+            result["values"] = values
+        return result
+
+    def update(self, spreadsheet_id, a1, values):
+        sheet, r1, _, c1, _ = parse_range(a1)
+        rows = self._rows(spreadsheet_id, sheet)
+        for dr, new_row in enumerate(values):
+            while len(rows) < r1 + dr:
+                rows.append([])
+            row = rows[r1 - 1 + dr]
+            while len(row) < c1 + len(new_row):
+                row.append("")
+            row[c1:c1 + len(new_row)] = [str(v) for v in new_row]
+        return {"updatedRange": a1, "updatedRows": len(values)}
+
+    def append(self, spreadsheet_id, a1, values):
+        sheet, _, _, c1, _ = parse_range(a1)
+        rows = self._rows(spreadsheet_id, sheet)
+        while rows and not any(rows[-1]):
+            rows.pop()
+        start = len(rows) + 1
+        width = max(len(v) for v in values)
+        for new_row in values:
+            rows.append([""] * c1 + [str(v) for v in new_row])
+        end = start + len(values) - 1
+        updated = f"{sheet}!{column_letters(c1)}{start}:{column_letters(c1 + width - 1)}{end}"
+        return {"spreadsheetId": spreadsheet_id, "updates": {"updatedRange": updated, "updatedRows": len(values)}}
+
+
+class Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    fake = None  # set by serve()
+
+    def log_message(self, *args):
+        pass
+
+    def _reply(self, status, payload):
+        body = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=UTF-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _body(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        return json.loads(self.rfile.read(length) or b"{}")
+
+    def _route(self, method):
+        fake = self.fake
+        parsed = urllib.parse.urlparse(self.path)
+        query = urllib.parse.parse_qs(parsed.query)
+        path = urllib.parse.unquote(parsed.path)
+
+        if path == "/__stats":
+            return self._reply(200, dict(fake.calls))
+        if path == "/__reset":
+            fake.calls.clear()
+            return self._reply(200, {})
+
+        match = re.match(r"^/v4/spreadsheets/([^/]+)/values(?:/(.+?))?(?::(append|batchGet|batchUpdate))?$", path)
+        if not match:
+            return self._reply(404, {"error": {"code": 404, "message": f"Unknown path {path}"}})
+        spreadsheet_id, a1, action = match.groups()
+        body = self._body() if method in ("POST", "PUT") else {}
+
+        time.sleep(fake.latency)
+        with fake.lock:
+            if fake.over_quota("read" if method == "GET" else "write"):
+                return self._reply(429, {"error": {"code": 429, "status": "RESOURCE_EXHAUSTED",
+                                                   "message": "Quota exceeded"}})
+            if method == "GET" and action == "batchGet":
+                fake.calls["batchGet"] += 1
+                ranges = query.get("ranges", [])
+                return self._reply(200, {"valueRanges": [fake.get(spreadsheet_id, r) for r in ranges]})
+            if method == "POST" and action == "batchUpdate":
+                fake.calls["batchUpdate"] += 1
+                for data in body.get("data", []):
+                    fake.update(spreadsheet_id, data["range"], data["values"])
+                return self._reply(200, {"spreadsheetId": spreadsheet_id})
+            if method == "POST" and action == "append":
+                fake.calls["append"] += 1
+                return self._reply(200, fake.append(spreadsheet_id, a1, body.get("values", [])))
+            if method == "PUT" and a1:
+                fake.calls["update"] += 1
+                return self._reply(200, fake.update(spreadsheet_id, a1, body.get("values", [])))
+            if method == "GET" and a1:
+                fake.calls["get"] += 1
+                return self._reply(200, fake.get(spreadsheet_id, a1))
+        return self._reply(400, {"error": {"code": 400, "message": "Unsupported request"}})
+
+    def do_GET(self):
+        self._route("GET")
+
+    def do_POST(self):
+        self._route("POST")
+
+    def do_PUT(self):
+        self._route("PUT")
+
+
+def serve(latency: float = 0.0, port: int = 0, quota_per_minute: int = 0):
+    """Start the fake server in a daemon thread; returns (server, FakeSheets)"""
+    fake = FakeSheets(latency, quota_per_minute)
+    handler = type("FakeSheetsHandler", (Handler,), {"fake": fake})
+    server = ThreadingHTTPServer(("127.0.0.1", port), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, fake
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--port", type=int, default=8090)
+    parser.add_argument("--latency", type=float, default=0.0)
+    parser.add_argument("--quota", type=int, default=0, help="reads and writes allowed per minute (0 = no limit)")
+    args = parser.parse_args()
+    server, _ = serve(args.latency, args.port, args.quota)
+    print(f"Fake Sheets API on http://127.0.0.1:{server.server_port}/")
+    threading.Event().wait()
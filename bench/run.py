@@ -0,0 +1,369 @@
+"""Offline endpoint benchmark for main.py.
+
+Starts a fake Sheets API (bench/fake_sheets.py), an SMTP sink
+(bench/smtp_sink.py) and the app under uvicorn, then runs every virtual user
+through the flow one endpoint at a time:
+
+    register -> login -> contactus -> apply -> pay -> logout
+             -> forgot-password -> verify-forgot-password -> reset-password
+
+For each endpoint it reports p50/p95/p99 latency, throughput, errors, and
+the Sheets calls, SMTP messages and SMTP connections per request. Calls are
+counted between phases after the write-behind queues have drained.
+
+    python bench/run.py --users 200 --concurrency 20 --sheets-latency 0.15
+    python bench/run.py --save        # store results as bench/baseline.json
+    python bench/run.py --compare     # exit 1 if p95 regressed vs the baseline
+
+A saved baseline records the command, commit and host it was measured with
+under "produced_by"; re-save it on the machine that runs --compare.
+"""
+import argparse
+import email
+import http.client
+import json
+import os
+import platform
+import re
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.parse
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import fake_sheets  # noqa: E402
+import smtp_sink  # noqa: E402
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BASELINE = os.path.join(ROOT, "bench", "baseline.json")
+PHASES = ["register", "login", "contactus", "apply", "pay", "logout",
+          "forgot-password", "verify-forgot-password", "reset-password"]
+RESUME = b"%PDF-1.4\n" + b"0" * 200 * 1024  # 200 KB placeholder PDF
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def percentile(values, pct):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = max(0, min(len(ordered) - 1, int(round(pct / 100 * len(ordered) + 0.5)) - 1))
+    return ordered[index]
+
+
+def multipart(fields: dict, files: dict):
+    boundary = uuid.uuid4().hex
+    body = bytearray()
+    for name, value in fields.items():
+        body += (f"--{boundary}\r\nContent-Disposition: form-data; name=\"{name}\"\r\n\r\n{value}\r\n").encode()
+    for name, (filename, content, content_type) in files.items():
+        body += (f"--{boundary}\r\nContent-Disposition: form-data; name=\"{name}\"; filename=\"{filename}\"\r\n"
+                 f"Content-Type: {content_type}\r\n\r\n").encode()
+        body += content + b"\r\n"
+    body += f"--{boundary}--\r\n".encode()
+    return bytes(body), f"multipart/form-data; boundary={boundary}"
+
+
+class VirtualUser:
+    def __init__(self, port: int, index: int, run_id: str):
+        self.port = port
+        self.email = f"user{index}-{run_id}@bench.local"
+        self.password = "secret-1"
+        self.cookie = None
+        self.otp = None
+        self.reset_token = None
+        self.conn = None
+
+    def request(self, method: str, path: str, body: bytes = b"", content_type: str = None):
+        headers = {}
+        if content_type:
+            headers["Content-Type"] = content_type
+        if self.cookie:
+            headers["Cookie"] = f"session_id={self.cookie}"
+        reused = self.conn is not None
+        while True:
+            if self.conn is None:
+                self.conn = http.client.HTTPConnection("127.0.0.1", self.port, timeout=60)
+            try:
+                self.conn.request(method, path, body=body, headers=headers)
+                resp = self.conn.getresponse()
+                data = resp.read()
+                break
+            except (OSError, http.client.HTTPException) as e:
+                self.conn.close()
+                self.conn = None
+                # uvicorn closes idle keep-alive connections between phases – reconnect once
+                if not (reused and isinstance(e, (http.client.RemoteDisconnected, ConnectionResetError,
+                                                  BrokenPipeError))):
+                    raise
+                reused = False
+        match = re.search(r"session_id=([0-9a-f]+)", resp.getheader("set-cookie") or "")
+        if match:
+            self.cookie = match.group(1)
+        return resp.status, data
+
+    def form(self, path: str, fields: dict):
+        return self.request("POST", path, urllib.parse.urlencode(fields).encode(),
+                            "application/x-www-form-urlencoded")
+
+    def run(self, phase: str, sink):
+        """Run one endpoint; returns True when the response is a success"""
+        if phase == "register":
+            status, _ = self.form("/register", {"email": self.email, "moblie_number": "9999999999",
+                                                "password": self.password, "retype_password": self.password})
+        elif phase == "login":
+            status, _ = self.form("/login", {"email": self.email, "password": self.password})
+        elif phase == "contactus":
+            status, _ = self.form("/contactus", {"name": "Bench", "phone": "9999999999", "email": self.email,
+                                                 "project_type": "Website", "project_description": "Benchmark"})
+        elif phase == "apply":
+            body, content_type = multipart(
+                {"name": "Bench", "email": self.email, "keyskills": "python", "join_us": "yes"},
+                {"resume": ("resume.pdf", RESUME, "application/pdf")})
+            status, _ = self.request("POST", "/apply", body, content_type)
+        elif phase == "pay":
+            status, _ = self.request("POST", "/pay", json.dumps({"SelectedProject": "Website", "Amount": 100}).encode(),
+                                     "application/json")
+        elif phase == "logout":
+            status, _ = self.request("POST", "/logout")
+        elif phase == "forgot-password":
+            status, data = self.form("/forgot-password", {"email": self.email})
+            self.otp = find_otp(sink.last_message_to(self.email))
+            return status == 200 and json.loads(data).get("status") == "success"
+        elif phase == "verify-forgot-password":
+            status, data = self.form("/verify-forgot-password", {"otp": self.otp or ""})
+            self.reset_token = json.loads(data).get("reset_token") if status == 200 else None
+            return status == 200 and json.loads(data).get("status") == "success"
+        elif phase == "reset-password":
+            self.password = "secret-2"
+            status, data = self.form("/reset-password", {"new_password": self.password, "email": self.email,
+                                                          "reset_token": self.reset_token or ""})
+            return status == 200 and json.loads(data).get("status") == "success"
+        else:
+            raise ValueError(phase)
+        return 200 <= status < 300
+
+
+def find_otp(raw: bytes):
+    if not raw:
+        return None
+    for part in email.message_from_bytes(raw).walk():
+        if part.get_content_maintype() == "text":
+            match = re.search(r"OTP is: (\d{6})", part.get_payload(decode=True).decode(errors="replace"))
+            if match:
+                return match.group(1)
+    return None
+
+
+def snapshot(fake, sink):
+    with fake.lock:
+        sheets = sum(fake.calls.values())
+    with sink.lock:
+        return {"sheets": sheets, "smtp_messages": sink.counts["messages"], "smtp_connections": sink.counts["connections"]}
+
+
+def wait_for_quiet(fake, sink, settle: float, timeout: float = 30.0):
+    """Wait until no Sheets call or mail has arrived for ``settle`` seconds"""
+    deadline = time.monotonic() + timeout
+    last, last_change = snapshot(fake, sink), time.monotonic()
+    while time.monotonic() < deadline:
+        time.sleep(0.05)
+        current = snapshot(fake, sink)
+        if current != last:
+            last, last_change = current, time.monotonic()
+        elif time.monotonic() - last_change >= settle:
+            break
+    return last
+
+
+def start_app(port: int, sheets_port: int, smtp_port: int, state_dir: str, workers: int, extra_env: dict):
+    env = dict(os.environ)
+    env.update({
+        "SMTP_SERVER": "127.0.0.1",
+        "SMTP_PORT": str(smtp_port),
+        "SMTP_STARTTLS": "false",
+        "USERNAME": "admin@bench.local",
+        "PASSWORD": "bench",
+        "GOOGLE_CREDS": "anonymous",
+        "SHEETS_API_ENDPOINT": f"http://127.0.0.1:{sheets_port}/",
+        "STATE_DIR": state_dir,
+        "PUBLIC_BASE_URL": f"http://127.0.0.1:{port}",
+        # The fake has no quota unless --sheets-quota is given; don't let the client throttle either
+        "SHEETS_READ_PER_MINUTE": "1000000",
+        "SHEETS_WRITE_PER_MINUTE": "1000000",
+    })
+    env.update(extra_env)
+    proc = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--host", "127.0.0.1", "--port", str(port),
+         "--workers", str(workers), "--log-level", "warning"],
+        cwd=ROOT, env=env,
+    )
+    deadline = time.monotonic() + 60
+    while time.monotonic() < deadline:
+        try:
+            conn = http.client.HTTPConnection("127.0.0.1", port, timeout=1)
+            conn.request("GET", "/")
+            if conn.getresponse().status == 200:
+                return proc
+        except OSError:
+            time.sleep(0.05)
+    proc.terminate()
+    raise TimeoutError("app did not start")
+
+
+def run_benchmark(args) -> dict:
+    sheets_server, fake = fake_sheets.serve(args.sheets_latency, quota_per_minute=args.sheets_quota)
+    smtp_server, sink = smtp_sink.serve(args.smtp_latency)
+    port = free_port()
+    extra_env = dict(item.split("=", 1) for item in args.env)
+
+    with tempfile.TemporaryDirectory() as state_dir:
+        proc = start_app(port, sheets_server.server_port, smtp_server.server_address[1], state_dir,
+                         args.workers, extra_env)
+        try:
+            wait_for_quiet(fake, sink, args.settle)
+            run_id = uuid.uuid4().hex[:8]
+            users = [VirtualUser(port, i, run_id) for i in range(args.users)]
+            results = {}
+
+            with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+                for phase in PHASES:
+                    before = snapshot(fake, sink)
+
+                    def timed(user):
+                        start = time.perf_counter()
+                        try:
+                            ok = user.run(phase, sink)
+                        except Exception:
+                            ok = False
+                        return time.perf_counter() - start, ok
+
+                    started = time.perf_counter()
+                    outcomes = list(pool.map(timed, users))
+                    elapsed = time.perf_counter() - started
+                    after = wait_for_quiet(fake, sink, args.settle)
+
+                    latencies = [latency for latency, _ in outcomes]
+                    n = len(outcomes)
+                    results[phase] = {
+                        "requests": n,
+                        "errors": sum(1 for _, ok in outcomes if not ok),
+                        "p50_ms": round(percentile(latencies, 50) * 1000, 2),
+                        "p95_ms": round(percentile(latencies, 95) * 1000, 2),
+                        "p99_ms": round(percentile(latencies, 99) * 1000, 2),
+                        "throughput_rps": round(n / elapsed, 2) if elapsed else 0.0,
+                        "sheets_calls_per_request": round((after["sheets"] - before["sheets"]) / n, 3),
+                        "smtp_messages_per_request": round((after["smtp_messages"] - before["smtp_messages"]) / n, 3),
+                        "smtp_connections_per_request": round(
+                            (after["smtp_connections"] - before["smtp_connections"]) / n, 3),
+                    }
+        finally:
+            proc.terminate()
+            proc.wait()
+            sheets_server.shutdown()
+            smtp_server.shutdown()
+
+    return {
+        "config": {"users": args.users, "concurrency": args.concurrency, "workers": args.workers,
+                   "sheets_latency": args.sheets_latency, "smtp_latency": args.smtp_latency},
+        "endpoints": results,
+    }
+
+
+def print_report(report: dict, baseline: dict = None):
+    columns = ["requests", "errors", "p50_ms", "p95_ms", "p99_ms", "throughput_rps",
+               "sheets_calls_per_request", "smtp_messages_per_request", "smtp_connections_per_request"]
+    headers = ["endpoint", "n", "err", "p50", "p95", "p99", "rps", "sheets/req", "mail/req", "smtp-conn/req"]
+    line = "{:<24}" + "{:>14}" * len(columns)
+    print(line.format(*headers))
+    for phase, row in report["endpoints"].items():
+        print(line.format(phase, *[row[c] for c in columns]))
+        if baseline and phase in baseline.get("endpoints", {}):
+            old = baseline["endpoints"][phase]
+            print(line.format("  baseline", *[old.get(c, "-") for c in columns]))
+
+
+def compare(report: dict, baseline: dict, tolerance: float) -> bool:
+    """True when no endpoint got slower (p95) or chattier (Sheets/SMTP calls) than allowed"""
+    ok = True
+    for phase, row in report["endpoints"].items():
+        old = baseline.get("endpoints", {}).get(phase)
+        if not old:
+            continue
+        if row["p95_ms"] > old["p95_ms"] * (1 + tolerance):
+            print(f"REGRESSION {phase}: p95 {row['p95_ms']}ms vs baseline {old['p95_ms']}ms")
+            ok = False
+        for key in ("sheets_calls_per_request", "smtp_connections_per_request"):
+            if row[key] > old[key] + 0.01:
+                print(f"REGRESSION {phase}: {key} {row[key]} vs baseline {old[key]}")
+                ok = False
+    return ok
+
+
+def produced_by() -> dict:
+    """How a saved baseline was measured, so a stale one can be recognised"""
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True,
+                                text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = "unknown"
+    return {
+        "command": " ".join(["python", "bench/run.py"] + sys.argv[1:]),
+        "commit": commit,
+        "date": time.strftime("%Y-%m-%d"),
+        "python": platform.python_version(),
+        "cpus": os.cpu_count(),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=50)
+    parser.add_argument("--concurrency", type=int, default=10)
+    parser.add_argument("--workers", type=int, default=1, help="uvicorn worker processes")
+    parser.add_argument("--sheets-latency", type=float, default=0.1, help="seconds added to every Sheets call")
+    parser.add_argument("--sheets-quota", type=int, default=0,
+                        help="fake Sheets answers 429 beyond this many reads/writes a minute; pair with "
+                             "--env SHEETS_READ_PER_MINUTE=... to exercise the client-side limiter")
+    parser.add_argument("--smtp-latency", type=float, default=0.05, help="seconds added to every SMTP DATA")
+    parser.add_argument("--settle", type=float, default=1.0, help="quiet time that ends a phase")
+    parser.add_argument("--env", action="append", default=[], metavar="NAME=VALUE",
+                        help="extra environment for the app, e.g. --env APPEND_FLUSH_SECONDS=0.2")
+    parser.add_argument("--save", action="store_true", help="store the results as the baseline")
+    parser.add_argument("--compare", action="store_true", help="exit 1 on regression vs the baseline")
+    parser.add_argument("--tolerance", type=float, default=0.2)
+    parser.add_argument("--json", help="also write the results to this file")
+    args = parser.parse_args()
+
+    report = run_benchmark(args)
+    baseline = None
+    if os.path.exists(BASELINE):
+        with open(BASELINE) as f:
+            baseline = json.load(f)
+    print_report(report, baseline)
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent=2)
+    if args.save:
+        with open(BASELINE, "w") as f:
+            json.dump(dict(report, produced_by=produced_by()), f, indent=2)
+        print(f"Baseline saved to {BASELINE}")
+    if args.compare:
+        if not baseline:
+            print(f"No baseline at {BASELINE}; create one with --save")
+            return 1
+        return 0 if compare(report, baseline, args.tolerance) else 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,113 @@
+"""Local SMTP server that accepts and keeps every message (no TLS).
+
+Understands EHLO/HELO, AUTH PLAIN/LOGIN (any credentials), MAIL, RCPT, DATA,
+RSET, NOOP and QUIT. Run the app against it with SMTP_STARTTLS=false.
+"""
+import threading
+import time
+import socketserver
+from collections import Counter
+
+
+class SMTPSink:
+    def __init__(self, latency: float = 0.0):
+        self.latency = latency
+        self.messages = []  # [(mail_from, [rcpt], data bytes)]
+        self.counts = Counter()
+        self.lock = threading.Lock()
+
+    def last_message_to(self, address: str):
+        with self.lock:
+            for mail_from, rcpts, data in reversed(self.messages):
+                if address in rcpts:
+                    return data
+        return None
+
+
+class Handler(socketserver.StreamRequestHandler):
+    sink = None  # set by serve()
+
+    def reply(self, line: str):
+        self.wfile.write(line.encode() + b"\r\n")
+        self.wfile.flush()
+
+    def handle(self):
+        sink = self.sink
+        with sink.lock:
+            sink.counts["connections"] += 1
+        self.reply("220 smtp-sink ready")
+        mail_from, rcpts = None, []
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                return
+            command = line.decode(errors="replace").strip()
+            verb = command.split(" ", 1)[0].upper()
+
+            if verb == "EHLO":
+                self.wfile.write(b"250-smtp-sink\r\n250-AUTH PLAIN LOGIN\r\n250 8BITMIME\r\n")
+                self.wfile.flush()
+            elif verb == "HELO":
+                self.reply("250 smtp-sink")
+            elif verb == "AUTH":
+                parts = command.split()
+                if len(parts) >= 2 and parts[1].upper() == "LOGIN":
+                    for prompt in ("334 VXNlcm5hbWU6", "334 UGFzc3dvcmQ6"):
+                        self.reply(prompt)
+                        self.rfile.readline()
+                elif len(parts) == 2:
+                    self.reply("334 ")
+                    self.rfile.readline()
+                with sink.lock:
+                    sink.counts["logins"] += 1
+                self.reply("235 Authentication successful")
+            elif verb == "MAIL":
+                mail_from, rcpts = command[10:].strip(" <>"), []
+                self.reply("250 OK")
+            elif verb == "RCPT":
+                rcpts.append(command[8:].strip(" <>"))
+                self.reply("250 OK")
+            elif verb == "DATA":
+                self.reply("354 End data with <CR><LF>.<CR><LF>")
+                data = bytearray()
+                while True:
+                    chunk = self.rfile.readline()
+                    if not chunk or chunk in (b".\r\n", b".\n"):
+                        break
+                    data += chunk[1:] if chunk.startswith(b"..") else chunk
+                time.sleep(sink.latency)
+                with sink.lock:
+                    sink.messages.append((mail_from, rcpts, bytes(data)))
+                    sink.counts["messages"] += 1
+                self.reply("250 OK queued")
+            elif verb in ("RSET", "NOOP"):
+                with sink.lock:
+                    sink.counts[verb.lower()] += 1
+                self.reply("250 OK")
+            elif verb == "QUIT":
+                self.reply("221 Bye")
+                return
+            else:
+                self.reply("502 Command not implemented")
+
+
+def serve(latency: float = 0.0, port: int = 0):
+    """Start the sink in a daemon thread; returns (server, SMTPSink)"""
+    sink = SMTPSink(latency)
+    handler = type("SMTPSinkHandler", (Handler,), {"sink": sink})
+    server = socketserver.ThreadingTCPServer(("127.0.0.1", port), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, sink
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--port", type=int, default=2525)
+    parser.add_argument("--latency", type=float, default=0.0)
+    args = parser.parse_args()
+    server, _ = serve(args.latency, args.port)
+    print(f"SMTP sink on 127.0.0.1:{server.server_address[1]}")
+    threading.Event().wait()
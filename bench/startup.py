@@ -0,0 +1,113 @@
+"""Startup-time benchmark: import time of main.py and time to first response.
+
+    python bench/startup.py               # measure and compare with the saved baseline
+    python bench/startup.py --save        # measure and store a new baseline
+
+Runs with placeholder SMTP / Google credentials, so it measures our own boot
+cost (imports, lifespan setup with Sheets calls failing fast), not Google's
+latency. Exits with status 1 when a median is more than --tolerance slower
+than the baseline.
+"""
+import argparse
+import base64
+import json
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BASELINE = os.path.join(ROOT, "bench", "startup_baseline.json")
+
+
+def bench_env(state_dir: str) -> dict:
+    env = dict(os.environ)
+    env.setdefault("SMTP_SERVER", "127.0.0.1")
+    env.setdefault("SMTP_PORT", "2525")
+    env.setdefault("USERNAME", "bench@example.com")
+    env.setdefault("PASSWORD", "bench")
+    env.setdefault("GOOGLE_CREDS", base64.b64encode(b"{}").decode())
+    env.setdefault("PUBLIC_BASE_URL", "http://127.0.0.1")
+    env["STATE_DIR"] = state_dir
+    return env
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def measure_import(env: dict) -> float:
+    code = "import time; t = time.perf_counter(); import main; print(time.perf_counter() - t)"
+    out = subprocess.run([sys.executable, "-c", code], cwd=ROOT, env=env,
+                         capture_output=True, text=True, check=True)
+    return float(out.stdout.strip().splitlines()[-1])
+
+
+def measure_first_response(env: dict, timeout: float = 60.0) -> float:
+    port = free_port()
+    start = time.perf_counter()
+    proc = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--host", "127.0.0.1", "--port", str(port)],
+        cwd=ROOT, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    try:
+        while time.perf_counter() - start < timeout:
+            try:
+                with urllib.request.urlopen(f"http://127.0.0.1:{port}/", timeout=1) as resp:
+                    if resp.status == 200:
+                        return time.perf_counter() - start
+            except OSError:
+                time.sleep(0.01)
+        raise TimeoutError("server did not answer GET / in time")
+    finally:
+        proc.terminate()
+        proc.wait()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--save", action="store_true", help="store the result as the new baseline")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="allowed slowdown vs baseline (0.25 = 25%%)")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as state_dir:
+        env = bench_env(state_dir)
+        imports = [measure_import(env) for _ in range(args.runs)]
+        first = [measure_first_response(env) for _ in range(args.runs)]
+
+    result = {
+        "import_seconds": statistics.median(imports),
+        "first_response_seconds": statistics.median(first),
+    }
+    print(json.dumps(result, indent=2))
+
+    if args.save:
+        with open(BASELINE, "w") as f:
+            json.dump(result, f, indent=2)
+        print(f"Baseline saved to {BASELINE}")
+        return 0
+
+    if not os.path.exists(BASELINE):
+        print("No baseline yet – run with --save to create one")
+        return 0
+
+    with open(BASELINE) as f:
+        baseline = json.load(f)
+    failed = False
+    for key, value in result.items():
+        limit = baseline[key] * (1 + args.tolerance)
+        status = "OK" if value <= limit else "REGRESSION"
+        failed |= value > limit
+        print(f"{key}: {value:.3f}s (baseline {baseline[key]:.3f}s, limit {limit:.3f}s) {status}")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,77 @@
+import hashlib
+import json
+import os
+import re
+import uuid
+
+
+# ==============================
+# Content-addressed Blob Store
+# ==============================
+DIGEST_RE = re.compile(r"[0-9a-f]{64}")
+
+
+class BlobStore:
+    """Files on local disk named by the SHA-256 of their content.
+
+    A blob lives at ``root/ab/cd/<digest>`` (two levels of sharding keep
+    directories small) with its metadata beside it in ``<digest>.json``.
+    Uploads are hashed while they are written to a temp file, which is then
+    renamed into place, so a blob is either complete or absent. Storing the
+    same content twice keeps the first copy.
+    """
+
+    def __init__(self, root: str):
+        self.root = root
+
+    def path(self, digest: str) -> str:
+        if not DIGEST_RE.fullmatch(digest or ""):
+            raise ValueError("Not a SHA-256 digest")
+        return os.path.join(self.root, digest[:2], digest[2:4], digest)
+
+    def put(self, chunks, content_type: str, filename: str):
+        """Store a stream of chunks; returns (digest, size, stored) where stored is
+        False if identical content was already there"""
+        tmp_dir = os.path.join(self.root, "tmp")
+        os.makedirs(tmp_dir, exist_ok=True)
+        tmp = os.path.join(tmp_dir, uuid.uuid4().hex)
+        sha = hashlib.sha256()
+        size = 0
+        try:
+            with open(tmp, "wb") as f:
+                for chunk in chunks:
+                    sha.update(chunk)
+                    f.write(chunk)
+                    size += len(chunk)
+                f.flush()
+                os.fsync(f.fileno())
+
+            digest = sha.hexdigest()
+            path = self.path(digest)
+            if os.path.exists(path):
+                return digest, size, False
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            self._write_meta(path, {"content_type": content_type, "filename": os.path.basename(filename or ""),
+                                    "size": size})
+            os.replace(tmp, path)
+            return digest, size, True
+        finally:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+
+    @staticmethod
+    def _write_meta(path: str, meta: dict):
+        tmp = f"{path}.json.{os.getpid()}.tmp"
+        with open(tmp, "w") as f:
+            json.dump(meta, f)
+        os.replace(tmp, f"{path}.json")
+
+    def get(self, digest: str):
+        """Return (path, metadata) of a stored blob, or None"""
+        try:
+            path = self.path(digest)
+            with open(f"{path}.json") as f:
+                meta = json.load(f)
+        except (ValueError, OSError):
+            return None
+        return (path, meta) if os.path.exists(path) else None
@@ -0,0 +1,29 @@
+import asyncio
+import contextvars
+import functools
+from concurrent.futures import ThreadPoolExecutor
+
+
+# ==============================
+# Awaitable Blocking I/O
+# ==============================
+class BlockingExecutor:
+    """A bounded thread pool for blocking client libraries (googleapiclient, smtplib).
+
+    ``await executor.run(fn, *args)`` runs ``fn`` on one of ``max_workers``
+    threads so a slow call never blocks the event loop. Each kind of I/O gets
+    its own executor, so a stalled mail server cannot use up the threads
+    that Sheets calls need.
+    """
+
+    def __init__(self, name: str, max_workers: int):
+        self.name = name
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix=name)
+
+    async def run(self, fn, *args, **kwargs):
+        loop = asyncio.get_running_loop()
+        call = functools.partial(contextvars.copy_context().run, fn, *args, **kwargs)
+        return await loop.run_in_executor(self._executor, call)
+
+    def shutdown(self, wait: bool = True):
+        self._executor.shutdown(wait=wait)
@@ -0,0 +1,67 @@
+import csv
+import io
+import re
+import secrets
+
+
+# ==============================
+# Bulk Registration Import
+# ==============================
+IMPORT_COLUMNS = ("email", "username", "mobile_number", "password")
+
+EMAIL_RE = re.compile(r"[^@\s]+@[^@\s]+\.[^@\s]+")
+
+
+def parse_registrations(data: bytes, max_rows: int) -> list:
+    """Read an uploaded CSV into [{line, email, username, mobile_number, password}].
+
+    Only the "email" column is required; headers are matched case-insensitively
+    ("Mobile Number" works too). Raises ValueError for unreadable files.
+    """
+    reader = csv.reader(io.StringIO(data.decode("utf-8-sig")))
+    header = next(reader, None)
+    if not header:
+        raise ValueError("The CSV file is empty")
+    columns = [name.strip().lower().replace(" ", "_") for name in header]
+    if "email" not in columns:
+        raise ValueError("The CSV file needs an 'email' column")
+
+    rows = []
+    for values in reader:
+        if not any(value.strip() for value in values):
+            continue
+        if len(rows) >= max_rows:
+            raise ValueError(f"At most {max_rows} rows can be imported at once")
+        record = dict(zip(columns, (value.strip() for value in values)))
+        rows.append({"line": reader.line_num, **{column: record.get(column, "") for column in IMPORT_COLUMNS}})
+    return rows
+
+
+def plan_registrations(rows: list, registered: set):
+    """Split parsed rows into the ones to create and a result for every row.
+
+    One pass over the file: each email is checked against ``registered``
+    (lower-cased emails already stored) and against earlier rows of the same
+    file. Rows to create get a username and, if none was given, a random
+    password; their result stays "pending" until they are stored.
+    """
+    results, to_create, seen = [], [], set()
+    for row in rows:
+        email = row["email"]
+        result = {"line": row["line"], "email": email, "status": "pending"}
+        results.append(result)
+        key = email.lower()
+        if not EMAIL_RE.fullmatch(email):
+            result["status"] = "invalid"
+        elif key in seen:
+            result["status"] = "duplicate"
+        elif key in registered:
+            result["status"] = "exists"
+        else:
+            row = dict(row, username=row["username"] or email.split("@")[0])
+            row["password_generated"] = not row["password"]
+            if not row["password"]:
+                row["password"] = secrets.token_urlsafe(12)
+            to_create.append((row, result))
+        seen.add(key)
+    return to_create, results
@@ -0,0 +1,219 @@
+import html
+import json
+import os
+import re
+import threading
+import time
+import uuid
+from email.mime.multipart import MIMEMultipart
+from email.mime.text import MIMEText
+
+from state import file_lock, pid_alive, run_periodically
+
+
+# ==============================
+# Admin Notification Digest
+# ==============================
+class AdminDigest:
+    """Collect admin notifications and mail them as one summary every few minutes.
+
+    ``add`` spools the event to ``spool_dir`` and returns an id; a background
+    thread sends a digest every ``interval_seconds`` or as soon as
+    ``max_events`` are waiting. Events sent more than ``keep_seconds`` ago
+    are removed from the spool by ``sweep``.
+    """
+
+    def __init__(self, mail_queue, from_addr: str, to_addr: str, spool_dir: str,
+                 interval_seconds: float = 300, max_events: int = 20, keep_seconds: float = 86400):
+        self.mail_queue = mail_queue
+        self.from_addr = from_addr
+        self.to_addr = to_addr
+        self.spool_dir = spool_dir
+        self.interval_seconds = interval_seconds
+        self.max_events = max_events
+        self.keep_seconds = keep_seconds
+
+        self._cond = threading.Condition()
+        self._pending = []  # [event] in arrival order
+        self._thread = None
+        self._sweeper = None
+        self._stopping = False
+
+    # ---------- spool files ----------
+    def _path(self, event_id: str, ext: str) -> str:
+        return os.path.join(self.spool_dir, f"{event_id}.{ext}")
+
+    def _save(self, event: dict):
+        path = self._path(event["id"], "json")
+        tmp = f"{path}.{os.getpid()}.tmp"
+        with open(tmp, "w") as f:
+            json.dump(event, f)
+        os.replace(tmp, path)
+
+    def _load(self, event_id: str):
+        if not EVENT_ID_RE.fullmatch(event_id or ""):
+            return None
+        try:
+            with open(self._path(event_id, "json")) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def status(self, event_id: str):
+        """Return {status, message_id} for a digested event, or None if unknown"""
+        event = self._load(event_id)
+        if event is None:
+            return None
+        return {"id": event["id"], "status": event["status"], "message_id": event.get("message_id"),
+                "queued_at": event["at"]}
+
+    # ---------- producer ----------
+    def add(self, kind: str, title: str, fields: dict) -> str:
+        """Queue one notification"""
+        event_id = uuid.uuid4().hex
+        os.makedirs(self.spool_dir, exist_ok=True)
+        event = {"id": event_id, "kind": kind, "title": title, "fields": fields, "at": time.time(),
+                 "status": "pending", "owner": os.getpid()}
+        self._save(event)
+
+        with self._cond:
+            self._pending.append(event)
+            if len(self._pending) >= self.max_events:
+                self._cond.notify()
+        return event_id
+
+    # ---------- sender ----------
+    def start(self):
+        """Adopt events left behind by a dead worker and start the flush thread"""
+        self._stopping = False
+        self._recover()
+        self.sweep()
+        self._thread = threading.Thread(target=self._run, name="admin-digest", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: float = 30.0):
+        """Stop the flush thread, sending whatever is pending first"""
+        with self._cond:
+            self._stopping = True
+            self._cond.notify()
+        if self._thread:
+            self._thread.join(timeout)
+            self._thread = None
+
+    def _recover(self):
+        os.makedirs(self.spool_dir, exist_ok=True)
+        with file_lock(os.path.join(self.spool_dir, "recover")):
+            for name in sorted(os.listdir(self.spool_dir)):
+                if not name.endswith(".json"):
+                    continue
+                event = self._load(name[:-5])
+                if event is None:
+                    continue
+                if event["status"] != "pending":
+                    continue
+                if event["owner"] != os.getpid() and pid_alive(event["owner"]):
+                    continue
+                event["owner"] = os.getpid()
+                self._save(event)
+                with self._cond:
+                    self._pending.append(event)
+        with self._cond:
+            self._pending.sort(key=lambda e: e["at"])
+
+    def start_sweeper(self, interval: float):
+        if not self._sweeper:
+            self._sweeper = run_periodically("admin-digest-sweeper", interval, self.sweep)
+
+    def sweep(self) -> int:
+        """Remove events that went out in a digest more than ``keep_seconds`` ago"""
+        removed = 0
+        for name in os.listdir(self.spool_dir):
+            if not name.endswith(".json"):
+                continue
+            event = self._load(name[:-5])
+            if (event is not None and event["status"] != "pending"
+                    and time.time() - event.get("sent_at", event["at"]) > self.keep_seconds):
+                try:
+                    os.remove(self._path(event["id"], "json"))
+                except OSError:
+                    continue  # swept by another worker
+                removed += 1
+        return removed
+
+    def _run(self):
+        failed = False
+        while True:
+            with self._cond:
+                deadline = time.monotonic() + self.interval_seconds
+                # After a failed send wait the full interval, even if the digest is already full
+                while not self._stopping and (failed or len(self._pending) < self.max_events):
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._cond.wait(remaining)
+                stopping = self._stopping
+            try:
+                self.flush()
+                failed = False
+            except Exception as e:
+                failed = True
+                print("⚠️ Error sending admin digest:", e)
+            if stopping:
+                return
+
+    def flush(self):
+        """Send every pending event now; returns the queued message ids"""
+        with self._cond:
+            events, self._pending = self._pending, []
+        if not events:
+            return []
+        try:
+            message_id = self._send(events)
+        except Exception:
+            # Put them back in front of anything queued meanwhile; try again next round
+            with self._cond:
+                self._pending[:0] = events
+            raise
+        for event in events:
+            event["status"] = "sent_in_digest"
+            event["message_id"] = message_id
+            event["sent_at"] = time.time()
+            self._save(event)
+        print(f"📧 Admin digest with {len(events)} events queued ({message_id})")
+        return [message_id]
+
+    def _send(self, events) -> str:
+        counts = {}
+        for event in events:
+            counts[event["kind"]] = counts.get(event["kind"], 0) + 1
+        subject = "🗂️ Zoona Portal digest: " + ", ".join(f"{n} {kind}" for kind, n in counts.items())
+
+        msg = MIMEMultipart()
+        msg["From"] = self.from_addr
+        msg["To"] = self.to_addr
+        msg["Subject"] = subject
+        msg.attach(MIMEText(self._render(events), "html"))
+        return self.mail_queue.enqueue(self.from_addr, self.to_addr, msg.as_string())
+
+    @staticmethod
+    def _render(events) -> str:
+        sections = []
+        for n, event in enumerate(events, start=1):
+            rows = "".join(f"<tr><td><b>{html.escape(str(k))}</b></td><td>{html.escape(str(v))}</td></tr>"
+                           for k, v in event["fields"].items())
+            when = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(event["at"]))
+            sections.append(f"<h3>{n}. {html.escape(event['title'])} <small>({when})</small></h3>"
+                            f"<table border=\"1\" cellspacing=\"0\" cellpadding=\"5\">{rows}</table>")
+        return f"""
+        <html>
+        <body>
+            <p><b>{len(events)} new notifications</b></p>
+            {''.join(sections)}
+            <br>
+            <p>Regards,<br>Zoona Portal</p>
+        </body>
+        </html>
+        """
+
+
+EVENT_ID_RE = re.compile(r"[0-9a-f]{32}")
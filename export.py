@@ -0,0 +1,139 @@
+import bisect
+import csv
+import io
+import json
+import zlib
+from datetime import datetime
+
+from storage import RECORD_FIELDS, TIME_FORMAT
+
+
+# ==============================
+# Streaming Export
+# ==============================
+# Exported columns per record type: the row's cursor first, passwords never
+EXPORT_FIELDS = {kind: ["cursor"] + [field for field in fields if field != "password"]
+                 for kind, fields in RECORD_FIELDS.items()}
+
+# Timestamp column used by ``since=<timestamp>``
+TIME_FIELDS = {
+    "register": "registered_time",
+    "loginhistory": "login_time",
+    "contactus": "submitted_at",
+    "jobs": "submitted_at",
+    "payment": "payment_time",
+}
+
+MEDIA_TYPES = {"csv": "text/csv; charset=utf-8", "ndjson": "application/x-ndjson"}
+
+
+def parse_since(since: str):
+    """Return (after, not_before) for a ``since`` value.
+
+    A number is a cursor from an earlier export (rows after it are returned);
+    a "YYYY-MM-DD" or "YYYY-MM-DD HH:MM:SS" timestamp keeps rows at or after it.
+    """
+    since = (since or "").strip()
+    if not since:
+        return 0, None
+    if since.isdigit():
+        return int(since), None
+    for fmt in (TIME_FORMAT, "%Y-%m-%d"):
+        try:
+            return 0, datetime.strptime(since, fmt).strftime(TIME_FORMAT)
+        except ValueError:
+            continue
+    raise ValueError("since must be a row cursor or a 'YYYY-MM-DD[ HH:MM:SS]' timestamp")
+
+
+class ExportIndex:
+    """Where a ``since=<timestamp>`` export can start instead of row 0.
+
+    Each window an export reads leaves a checkpoint: (cursor, latest timestamp
+    at or before it). Rows are only ever appended, so an export for a later
+    timestamp can skip every row up to that cursor. The latest time seen so far
+    is kept rather than the row's own, so rows written out of order only make
+    the seek start earlier. Held in memory per process; ``clear()`` it when a
+    sheet was edited by hand (deleted rows shift the cursors).
+    """
+
+    def __init__(self):
+        self._cursors = {}  # {kind: [cursor, ...]} ascending
+        self._latest = {}   # {kind: [timestamp, ...]} non-decreasing
+
+    def seek(self, kind: str, not_before: str):
+        """(cursor, latest) of the last checkpoint before ``not_before``; (0, "") if none"""
+        latest = self._latest.get(kind, [])
+        i = bisect.bisect_left(latest, not_before) - 1
+        if i < 0:
+            return 0, ""
+        return self._cursors[kind][i], latest[i]
+
+    def record(self, kind: str, cursor: int, latest: str):
+        cursors = self._cursors.setdefault(kind, [])
+        if cursors and cursor <= cursors[-1]:
+            return
+        cursors.append(cursor)
+        self._latest.setdefault(kind, []).append(latest)
+
+    def clear(self, kind: str = None):
+        for checkpoints in (self._cursors, self._latest):
+            if kind is None:
+                checkpoints.clear()
+            else:
+                checkpoints.pop(kind, None)
+
+
+def _encode(kind: str, fmt: str, batch) -> bytes:
+    fields = EXPORT_FIELDS[kind]
+    rows = [dict(record, cursor=cursor) for cursor, record in batch]
+    if fmt == "ndjson":
+        return "".join(json.dumps({field: row[field] for field in fields}, default=str) + "\n"
+                       for row in rows).encode()
+    out = io.StringIO()
+    writer = csv.writer(out)
+    for row in rows:
+        writer.writerow([row[field] for field in fields])
+    return out.getvalue().encode()
+
+
+async def export_stream(read_window, kind: str, fmt: str = "csv", after: int = 0, not_before: str = None,
+                        window: int = 1000, compress: bool = False, index: ExportIndex = None):
+    """Yield the records of ``kind`` as CSV or NDJSON, ``window`` rows at a time.
+
+    ``read_window(after, limit)`` is awaited for each window and returns
+    [(cursor, record)] like Storage.records, so only one window is ever held
+    in memory. With ``compress`` the output is one gzip stream, flushed after
+    every window so the client receives data as it is read. With ``index`` a
+    timestamp export starts at the last checkpoint before ``not_before``, and
+    exports read from row 0 or a checkpoint add checkpoints as they go.
+    """
+    gz = zlib.compressobj(wbits=31) if compress else None
+
+    def emit(data: bytes) -> bytes:
+        return gz.compress(data) + gz.flush(zlib.Z_SYNC_FLUSH) if gz else data
+
+    if fmt == "csv":
+        out = io.StringIO()
+        csv.writer(out).writerow(EXPORT_FIELDS[kind])
+        yield emit(out.getvalue().encode())
+
+    time_field = TIME_FIELDS[kind]
+    latest = None  # latest timestamp up to ``after``, known when starting at row 0 or a checkpoint
+    if index is not None and after == 0:
+        after, latest = index.seek(kind, not_before) if not_before else (0, "")
+    while True:
+        batch = await read_window(after, window)
+        if not batch:
+            break
+        after = batch[-1][0]
+        if latest is not None:
+            latest = max([latest] + [str(record[time_field]) for _, record in batch])
+            index.record(kind, after, latest)
+        if not_before:
+            batch = [(cursor, record) for cursor, record in batch if str(record[time_field]) >= not_before]
+        if batch:
+            yield emit(_encode(kind, fmt, batch))
+
+    if gz:
+        yield gz.flush()
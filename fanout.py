@@ -0,0 +1,84 @@
+import asyncio
+import time
+
+
+# ==============================
+# Concurrent Request Side Effects
+# ==============================
+class Step:
+    """One side effect of a request: ``fn(*args)`` run on a BlockingExecutor.
+
+    ``after`` names steps that must succeed first; if one of them fails this
+    step is skipped (e.g. no confirmation mail for a record that wasn't stored).
+    """
+
+    def __init__(self, name: str, executor, fn, *args, timeout: float = None, after=()):
+        self.name = name
+        self.executor = executor
+        self.fn = fn
+        self.args = args
+        self.timeout = timeout
+        self.after = tuple(after)
+
+
+class Outcome:
+    """What happened to one step. The helpers in main.py report errors by
+    returning a falsy value, so that counts as a failure too."""
+
+    def __init__(self, name: str):
+        self.name = name
+        self.value = None
+        self.error = None
+        self.seconds = 0.0
+
+    @property
+    def ok(self) -> bool:
+        return self.error is None and bool(self.value)
+
+
+async def fan_out(steps, timeout: float = None) -> dict:
+    """Run independent steps concurrently and wait for all of them.
+
+    Returns {name: Outcome}; a failing step never cancels the others, so the
+    caller sees every partial failure. A step taking longer than its timeout
+    (or ``timeout``) is reported as failed; its thread cannot be interrupted
+    and finishes in the background with the result dropped. If the request
+    itself is cancelled the pending steps are cancelled with it.
+    """
+    outcomes = {step.name: Outcome(step.name) for step in steps}
+    tasks = {}
+
+    async def run(step: Step):
+        outcome = outcomes[step.name]
+        for name in step.after:
+            await asyncio.shield(tasks[name])
+            if not outcomes[name].ok:
+                outcome.error = f"skipped because '{name}' failed"
+                return
+        limit = step.timeout or timeout
+        start = time.perf_counter()
+        try:
+            outcome.value = await asyncio.wait_for(step.executor.run(step.fn, *step.args), limit)
+        except asyncio.TimeoutError:
+            outcome.error = f"timed out after {limit}s"
+        except Exception as e:
+            outcome.error = f"{type(e).__name__}: {e}"
+        finally:
+            outcome.seconds = time.perf_counter() - start
+        if not outcome.ok:
+            print(f"⚠️ Step '{step.name}' failed:", outcome.error or f"returned {outcome.value!r}")
+
+    for step in steps:
+        tasks[step.name] = asyncio.ensure_future(run(step))
+    try:
+        await asyncio.gather(*tasks.values())
+    except asyncio.CancelledError:
+        for task in tasks.values():
+            task.cancel()
+        raise
+    return outcomes
+
+
+def failed(outcomes: dict) -> list:
+    """Names of the steps that did not succeed"""
+    return [name for name, outcome in outcomes.items() if not outcome.ok]
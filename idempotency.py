@@ -0,0 +1,214 @@
+import hashlib
+import json
+import threading
+import time
+from collections import OrderedDict
+
+from state import SQLiteDB, run_periodically
+
+
+# ==============================
+# Idempotency Key Stores
+# ==============================
+class IdempotencyStore:
+    """Responses of completed requests, keyed by their Idempotency-Key.
+
+    ``begin`` claims a key for the caller that should run the request; later
+    callers with the same key see it "running" until ``complete`` stores the
+    response (kept for ``ttl`` seconds) or ``release`` gives the key up. A
+    claim older than ``lease`` seconds is treated as abandoned by a crashed
+    worker and can be taken over. Each key remembers the ``fingerprint`` of
+    the request that claimed it; reusing the key for a different request
+    gets ("mismatch", None).
+    """
+
+    def __init__(self, ttl: float, lease: float = 120.0):
+        self.ttl = ttl
+        self.lease = lease
+        self._sweeper = None
+
+    def begin(self, key: str, fingerprint: str):
+        """Return ("run", None) if the caller now owns the key, ("running", None)
+        while another request holds it, ("done", response), or ("mismatch", None)"""
+        raise NotImplementedError
+
+    def complete(self, key: str, response: dict):
+        raise NotImplementedError
+
+    def release(self, key: str):
+        """Forget a claim whose request failed, so a retry runs it again"""
+        raise NotImplementedError
+
+    def sweep(self) -> int:
+        """Drop expired entries, returning how many were removed"""
+        raise NotImplementedError
+
+    def start_sweeper(self, interval: float):
+        if not self._sweeper:
+            self._sweeper = run_periodically("idempotency-sweeper", interval, self.sweep)
+
+
+class MemoryIdempotencyStore(IdempotencyStore):
+    """Per-process LRU of at most ``max_entries`` keys"""
+
+    def __init__(self, ttl: float, lease: float = 120.0, max_entries: int = 10000):
+        super().__init__(ttl, lease)
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # {key: (expires_at, fingerprint, response or None while running)}
+
+    def begin(self, key: str, fingerprint: str):
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry and entry[0] > now:
+                self._entries.move_to_end(key)
+                expires_at, claimed_by, response = entry
+                if claimed_by != fingerprint:
+                    return "mismatch", None
+                return ("running", None) if response is None else ("done", response)
+            self._entries[key] = (now + self.lease, fingerprint, None)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+            return "run", None
+
+    def complete(self, key: str, response: dict):
+        with self._lock:
+            entry = self._entries.get(key)
+            self._entries[key] = (time.monotonic() + self.ttl, entry[1] if entry else None, response)
+            self._entries.move_to_end(key)
+
+    def release(self, key: str):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def sweep(self) -> int:
+        now = time.monotonic()
+        with self._lock:
+            expired = [key for key, entry in self._entries.items() if entry[0] <= now]
+            for key in expired:
+                del self._entries[key]
+        return len(expired)
+
+
+class SQLiteIdempotencyStore(IdempotencyStore):
+    """Keys in a WAL-mode SQLite file shared by every worker on the host.
+
+    Claiming is a single INSERT, so two workers racing on the same key cannot
+    both run it. The sweeper also trims the table to the ``max_entries`` most
+    recently used keys.
+    """
+
+    SCHEMA = """
+    CREATE TABLE IF NOT EXISTS idempotency (
+        key TEXT PRIMARY KEY,
+        fingerprint TEXT,
+        response TEXT,
+        expires_at REAL NOT NULL,
+        used_at REAL NOT NULL
+    );
+    CREATE INDEX IF NOT EXISTS idempotency_expires_at ON idempotency (expires_at);
+    CREATE INDEX IF NOT EXISTS idempotency_used_at ON idempotency (used_at);
+    """
+
+    def __init__(self, path: str, ttl: float, lease: float = 120.0, max_entries: int = 100000):
+        super().__init__(ttl, lease)
+        self.max_entries = max_entries
+        self.db = SQLiteDB(path, self.SCHEMA)
+        # Files created before keys were bound to a request fingerprint
+        columns = [row[1] for row in self.db.execute("PRAGMA table_info(idempotency)").fetchall()]
+        if "fingerprint" not in columns:
+            self.db.execute("ALTER TABLE idempotency ADD COLUMN fingerprint TEXT")
+
+    def begin(self, key: str, fingerprint: str):
+        now = time.time()
+        # Insert a claim, or take over one that expired (finished long ago or abandoned)
+        cursor = self.db.execute(
+            "INSERT INTO idempotency (key, fingerprint, response, expires_at, used_at) VALUES (?, ?, NULL, ?, ?) "
+            "ON CONFLICT (key) DO UPDATE SET fingerprint = excluded.fingerprint, response = NULL, "
+            "expires_at = excluded.expires_at, used_at = excluded.used_at WHERE expires_at <= ?",
+            (key, fingerprint, now + self.lease, now, now),
+        )
+        if cursor.rowcount:
+            return "run", None
+        row = self.db.execute("SELECT fingerprint, response FROM idempotency WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            return self.begin(key, fingerprint)  # swept in between
+        if row[0] != fingerprint:
+            return "mismatch", None
+        if row[1] is None:
+            return "running", None
+        self.db.execute("UPDATE idempotency SET used_at = ? WHERE key = ?", (now, key))
+        return "done", json.loads(row[1])
+
+    def complete(self, key: str, response: dict):
+        now = time.time()
+        self.db.execute(
+            "UPDATE idempotency SET response = ?, expires_at = ?, used_at = ? WHERE key = ?",
+            (json.dumps(response), now + self.ttl, now, key),
+        )
+
+    def release(self, key: str):
+        self.db.execute("DELETE FROM idempotency WHERE key = ? AND response IS NULL", (key,))
+
+    def sweep(self) -> int:
+        removed = self.db.execute("DELETE FROM idempotency WHERE expires_at <= ?", (time.time(),)).rowcount
+        removed += self.db.execute(
+            "DELETE FROM idempotency WHERE key IN "
+            "(SELECT key FROM idempotency ORDER BY used_at DESC LIMIT -1 OFFSET ?)",
+            (self.max_entries,),
+        ).rowcount
+        return removed
+
+
+# ==============================
+# Request Body Fingerprint
+# ==============================
+class BodyFingerprint:
+    """SHA-256 of a request body, taken as the ASGI messages pass through ``receive``.
+
+    Nothing is buffered, so an upload keeps its bounded-memory path. The
+    multipart boundary is left out of the hash because clients pick a new
+    one on every attempt; ``carry`` holds back a tail that could be the
+    start of a boundary split across two chunks.
+    """
+
+    def __init__(self, receive, content_type: str = ""):
+        self._receive = receive
+        self._sha = hashlib.sha256()
+        self.boundary = b""
+        if "boundary=" in content_type:
+            boundary = content_type.split("boundary=", 1)[1].split(";", 1)[0].strip().strip('"')
+            self.boundary = boundary.encode("latin-1")
+        self.carry = b""
+        self.complete = False
+        self.disconnected = False
+
+    def update(self, chunk: bytes):
+        data = self.carry + chunk
+        if self.boundary:
+            data = data.replace(self.boundary, b"")
+            keep = min(len(data), len(self.boundary) - 1)
+            self.carry = data[len(data) - keep:]
+            data = data[:len(data) - keep]
+        self._sha.update(data)
+
+    async def receive(self):
+        message = await self._receive()
+        if message["type"] == "http.request":
+            self.update(message.get("body", b""))
+            self.complete = not message.get("more_body", False)
+        else:
+            self.disconnected = True
+        return message
+
+    async def drain(self):
+        """Read (and hash) whatever part of the body the app did not consume"""
+        while not (self.complete or self.disconnected):
+            await self.receive()
+
+    def hexdigest(self) -> str:
+        sha = self._sha.copy()
+        sha.update(self.carry)
+        return sha.hexdigest()
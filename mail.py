@@ -0,0 +1,375 @@
+import heapq
+import json
+import os
+import random
+import re
+import threading
+import time
+import uuid
+
+import metrics
+from state import file_lock, pid_alive, run_periodically
+
+
+# ==============================
+# Pooled SMTP Connections
+# ==============================
+class SMTPPool:
+    """Keep authenticated SMTP sessions open and share them between threads.
+
+    At most ``size`` connections exist at once; callers beyond that wait for
+    one to be returned. Idle connections are closed after ``idle_timeout``
+    seconds and every reused connection is checked with NOOP first.
+    """
+
+    def __init__(self, host: str, port: int, username: str, password: str,
+                 size: int = 4, idle_timeout: float = 60.0, timeout: float = 30.0, starttls: bool = True):
+        self.host = host
+        self.port = port
+        self.username = username
+        self.password = password
+        self.idle_timeout = idle_timeout
+        self.timeout = timeout
+        self.starttls = starttls
+
+        self._slots = threading.BoundedSemaphore(size)
+        self._lock = threading.Lock()
+        self._idle = []  # [(server, last_used)] – most recently used last
+
+    def _connect(self):
+        import smtplib  # deferred: smtplib pulls in ssl and the email package
+        with metrics.timed_call("smtp", self.host, "connect"):
+            server = smtplib.SMTP(self.host, self.port, timeout=self.timeout)
+            try:
+                if self.starttls:
+                    server.starttls()
+                server.login(self.username, self.password)
+            except Exception:
+                self._discard(server)
+                raise
+        return server
+
+    @staticmethod
+    def _discard(server):
+        try:
+            server.quit()
+        except Exception:
+            try:
+                server.close()
+            except Exception:
+                pass
+
+    def _checkout(self):
+        """Return (server, reused) – a healthy idle connection or a new one"""
+        while True:
+            with self._lock:
+                if not self._idle:
+                    break
+                server, last_used = self._idle.pop()
+            if time.monotonic() - last_used > self.idle_timeout:
+                self._discard(server)
+                continue
+            try:
+                if server.noop()[0] == 250:
+                    return server, True
+            except Exception:
+                pass
+            self._discard(server)
+        return self._connect(), False
+
+    def _checkin(self, server):
+        with self._lock:
+            self._idle.append((server, time.monotonic()))
+
+    def _send(self, operation: str, send):
+        import smtplib
+        self._slots.acquire()
+        try:
+            server, reused = self._checkout()
+            try:
+                with metrics.timed_call("smtp", self.host, operation):
+                    result = send(server)
+            except (smtplib.SMTPServerDisconnected, ConnectionError):
+                # Only a dropped connection; SMTPRecipientsRefused etc. are OSErrors too but final
+                self._discard(server)
+                if not reused:
+                    raise
+                # The server dropped a pooled session between NOOP and send – retry once on a fresh one
+                server = self._connect()
+                try:
+                    with metrics.timed_call("smtp", self.host, operation):
+                        result = send(server)
+                except Exception:
+                    self._discard(server)
+                    raise
+            except Exception:
+                # Rejected message – the session state is unknown, so don't reuse it
+                self._discard(server)
+                raise
+            self._checkin(server)
+            return result
+        finally:
+            self._slots.release()
+
+    def sendmail(self, from_addr: str, to_addrs, msg):
+        return self._send("sendmail", lambda server: server.sendmail(from_addr, to_addrs, msg))
+
+    def send_message(self, msg, from_addr: str = None, to_addrs=None):
+        return self._send("send_message", lambda server: server.send_message(msg, from_addr, to_addrs))
+
+    def close(self):
+        """Close every idle connection"""
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for server, _ in idle:
+            self._discard(server)
+
+
+# ==============================
+# Background Mail Queue
+# ==============================
+class MailQueue:
+    """Send mail from background worker threads, retrying with exponential backoff.
+
+    Every message is written to ``spool_dir`` before ``enqueue`` returns:
+    ``<id>.eml`` holds the message and ``<id>.json`` its delivery state, so
+    status can be read from any worker and queued mail survives a restart.
+    The state of a sent or failed message is kept for ``keep_seconds`` so
+    /mail-status can report it, then removed by the sweeper.
+    """
+
+    def __init__(self, pool: SMTPPool, spool_dir: str, workers: int = 2, max_attempts: int = 5,
+                 backoff_seconds: float = 5.0, keep_seconds: float = 86400):
+        self.pool = pool
+        self.spool_dir = spool_dir
+        self.workers = workers
+        self.max_attempts = max_attempts
+        self.backoff_seconds = backoff_seconds
+        self.keep_seconds = keep_seconds
+
+        self._cond = threading.Condition()
+        self._heap = []  # [(due_time, message_id)]
+        self._in_flight = 0
+        self._threads = []
+        self._stopping = False
+        self._sweeper = None
+        self.counters = {"enqueued": 0, "sent": 0, "failed": 0, "retried": 0,
+                         "latency_seconds_sum": 0.0, "latency_seconds_max": 0.0}
+
+    # ---------- spool files ----------
+    def _path(self, message_id: str, ext: str) -> str:
+        return os.path.join(self.spool_dir, f"{message_id}.{ext}")
+
+    def _save(self, state: dict):
+        path = self._path(state["id"], "json")
+        tmp = f"{path}.{os.getpid()}.tmp"
+        with open(tmp, "w") as f:
+            json.dump(state, f)
+        os.replace(tmp, path)
+
+    def _load(self, message_id: str):
+        if not MESSAGE_ID_RE.fullmatch(message_id or ""):
+            return None
+        try:
+            with open(self._path(message_id, "json")) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def status(self, message_id: str):
+        """Return the delivery state of a message, or None if unknown"""
+        state = self._load(message_id)
+        if state is not None:
+            state.pop("owner", None)
+        return state
+
+    # ---------- producer ----------
+    def enqueue(self, from_addr: str, to_addrs, msg) -> str:
+        """Spool a message for delivery and return its id"""
+        data = msg.as_bytes() if hasattr(msg, "as_bytes") else msg
+        if isinstance(data, str):
+            data = data.encode("utf-8")
+
+        message_id = uuid.uuid4().hex
+        os.makedirs(self.spool_dir, exist_ok=True)
+        try:
+            with open(self._path(message_id, "eml"), "wb") as f:
+                f.write(data)
+        except Exception:
+            self._remove(message_id)
+            raise
+
+        if isinstance(to_addrs, str):
+            to_addrs = [to_addrs]
+        self._save({
+            "id": message_id,
+            "from": from_addr,
+            "to": list(to_addrs),
+            "status": "queued",
+            "attempts": 0,
+            "queued_at": time.time(),
+            "updated_at": time.time(),
+            "error": None,
+            "owner": os.getpid(),
+            "endpoint": metrics.endpoint_label(),
+        })
+        with self._cond:
+            self.counters["enqueued"] += 1
+            heapq.heappush(self._heap, (time.monotonic(), message_id))
+            self._cond.notify()
+        return message_id
+
+    # ---------- workers ----------
+    def start(self):
+        """Recover spooled mail and start the worker threads"""
+        self._stopping = False
+        self._recover()
+        self.sweep()
+        for n in range(self.workers):
+            thread = threading.Thread(target=self._work, name=f"mail-worker-{n}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def stop(self, timeout: float = 10.0):
+        """Stop the workers; anything still queued stays in the spool for the next start"""
+        with self._cond:
+            self._stopping = True
+            self._cond.notify_all()
+        for thread in self._threads:
+            thread.join(timeout)
+        self._threads = []
+
+    def start_sweeper(self, interval: float):
+        if not self._sweeper:
+            self._sweeper = run_periodically("mail-spool-sweeper", interval, self.sweep)
+
+    def sweep(self) -> int:
+        """Remove messages that were sent or failed more than ``keep_seconds`` ago"""
+        removed = 0
+        for name in os.listdir(self.spool_dir):
+            if not name.endswith(".json"):
+                continue
+            state = self._load(name[:-5])
+            if (state is not None and state["status"] in ("sent", "failed")
+                    and time.time() - state["updated_at"] > self.keep_seconds):
+                self._remove(state["id"])
+                removed += 1
+        return removed
+
+    def _recover(self):
+        """Requeue spooled mail whose owning process is gone (crash or restart)"""
+        os.makedirs(self.spool_dir, exist_ok=True)
+        with file_lock(os.path.join(self.spool_dir, "recover")):
+            for name in os.listdir(self.spool_dir):
+                if not name.endswith(".json"):
+                    continue
+                state = self._load(name[:-5])
+                if state is None:
+                    continue
+                if state["status"] in ("sent", "failed"):
+                    continue
+                if state.get("owner") != os.getpid() and pid_alive(state.get("owner")):
+                    continue
+                state["owner"] = os.getpid()
+                self._save(state)
+                with self._cond:
+                    heapq.heappush(self._heap, (time.monotonic(), state["id"]))
+                print(f"ℹ️ Requeued spooled mail {state['id']}")
+
+    def _remove(self, message_id: str):
+        for ext in ("json", "eml"):
+            try:
+                os.remove(self._path(message_id, ext))
+            except OSError:
+                pass
+
+    def _next(self):
+        with self._cond:
+            while True:
+                if self._stopping:
+                    return None
+                if self._heap:
+                    due, message_id = self._heap[0]
+                    wait = due - time.monotonic()
+                    if wait <= 0:
+                        heapq.heappop(self._heap)
+                        self._in_flight += 1
+                        return message_id
+                    self._cond.wait(wait)
+                else:
+                    self._cond.wait()
+
+    def _work(self):
+        while True:
+            message_id = self._next()
+            if message_id is None:
+                return
+            try:
+                self._deliver(message_id)
+            finally:
+                with self._cond:
+                    self._in_flight -= 1
+
+    def _deliver(self, message_id: str):
+        state = self._load(message_id)
+        if state is None:
+            return
+        state["owner"] = os.getpid()
+        state["status"] = "sending"
+        state["attempts"] += 1
+        state["updated_at"] = time.time()
+        self._save(state)
+
+        try:
+            with open(self._path(message_id, "eml"), "rb") as f:
+                data = f.read()
+            with metrics.attributed_to(state.get("endpoint")):
+                self.pool.sendmail(state["from"], state["to"], data)
+        except Exception as e:
+            state["error"] = str(e)
+            state["updated_at"] = time.time()
+            if state["attempts"] >= self.max_attempts:
+                state["status"] = "failed"
+                self._save(state)
+                with self._cond:
+                    self.counters["failed"] += 1
+                print(f"❌ Giving up on mail {message_id} to {state['to']}:", e)
+                return
+            delay = self.backoff_seconds * 2 ** (state["attempts"] - 1) * random.uniform(0.8, 1.2)
+            state["status"] = "retrying"
+            state["next_attempt_at"] = time.time() + delay
+            self._save(state)
+            with self._cond:
+                self.counters["retried"] += 1
+                heapq.heappush(self._heap, (time.monotonic() + delay, message_id))
+                self._cond.notify()
+            print(f"⚠️ Mail {message_id} failed (attempt {state['attempts']}), retrying in {delay:.0f}s:", e)
+            return
+
+        latency = time.time() - state["queued_at"]
+        state["status"] = "sent"
+        state["error"] = None
+        state["sent_at"] = time.time()
+        state["updated_at"] = state["sent_at"]
+        self._save(state)
+        try:
+            os.remove(self._path(message_id, "eml"))
+        except OSError:
+            pass
+        with self._cond:
+            self.counters["sent"] += 1
+            self.counters["latency_seconds_sum"] += latency
+            self.counters["latency_seconds_max"] = max(self.counters["latency_seconds_max"], latency)
+        print(f"📧 Mail {message_id} sent to {state['to']}")
+
+    def stats(self) -> dict:
+        with self._cond:
+            stats = dict(self.counters)
+            stats["queue_depth"] = len(self._heap)
+            stats["in_flight"] = self._in_flight
+        stats["latency_seconds_avg"] = stats["latency_seconds_sum"] / stats["sent"] if stats["sent"] else 0.0
+        return stats
+
+
+MESSAGE_ID_RE = re.compile(r"[0-9a-f]{32}")
+
@@ -5,20 +5,44 @@ import app
 from dotenv import load_dotenv
 from fastapi import FastAPI, Form, File, UploadFile, HTTPException,Request,Response
 from datetime import datetime, timedelta
-import smtplib
 from email.message import EmailMessage
 from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
-from email.mime.application import MIMEApplication
-from googleapiclient.discovery import build
-from google.oauth2.service_account import Credentials
 from fastapi.middleware.cors import CORSMiddleware
 from typing import Optional
 import secrets
 from pydantic import BaseModel
-import os,json,base64
+import os
 import asyncio
-from fastapi.responses import FileResponse
+import hashlib
+import html
+import json
+import time
+from fastapi.responses import FileResponse, JSONResponse, PlainTextResponse, StreamingResponse
+from starlette.concurrency import run_in_threadpool
+from starlette.routing import Match
+import metrics
+from sheets_batch import AppendCoalescer
+from serials import SerialAllocator
+from mail import SMTPPool, MailQueue
+from digest import AdminDigest
+from state import STATE_DIR, state_path
+from session_store import MemorySessionStore, SQLiteSessionStore
+from otp_store import MemoryOTPStore, SQLiteOTPStore
+from blocking import BlockingExecutor
+from fanout import Step, fan_out, failed
+from sheets_client import LazySheetsService
+from sheets_quota import SheetsQuota, SheetsQuotaExhausted
+from sheet_schemas import SchemaRegistry
+from storage import MemoryStorage, SQLiteStorage
+from sheets_storage import SheetsStorage
+from aggregates import MemoryAggregates, SQLiteAggregates
+from export import EXPORT_FIELDS, MEDIA_TYPES, ExportIndex, export_stream, parse_since
+from bulk_import import parse_registrations, plan_registrations
+from idempotency import BodyFingerprint, MemoryIdempotencyStore, SQLiteIdempotencyStore
+from blobs import BlobStore
+from admission import AdmissionControl, Overloaded
+from uploads import UploadRejected, inspect_upload, iter_upload
 
 # ==============================
 # Email Configuration
@@ -31,22 +55,60 @@ PASSWORD = os.getenv("PASSWORD")
 if not all([SMTP_SERVER, SMTP_PORT, USERNAME, PASSWORD]):
     raise ValueError("SMTP credentials are not set!")
 
+SMTP_POOL_SIZE = int(os.getenv("SMTP_POOL_SIZE", 4))                 # max open SMTP sessions per worker
+SMTP_IDLE_TIMEOUT = float(os.getenv("SMTP_IDLE_TIMEOUT", 60))        # close sessions unused for this long
+SMTP_STARTTLS = os.getenv("SMTP_STARTTLS", "true").lower() != "false"  # false only for local test servers
 
+smtp_pool = SMTPPool(SMTP_SERVER, SMTP_PORT, USERNAME, PASSWORD, size=SMTP_POOL_SIZE,
+                     idle_timeout=SMTP_IDLE_TIMEOUT, starttls=SMTP_STARTTLS)
+
+# Outgoing mail is spooled to disk and delivered by background workers
+MAIL_SPOOL_DIR = os.getenv("MAIL_SPOOL_DIR", os.path.join(STATE_DIR, "mail-spool"))
+MAIL_WORKERS = int(os.getenv("MAIL_WORKERS", 2))
+MAIL_MAX_ATTEMPTS = int(os.getenv("MAIL_MAX_ATTEMPTS", 5))
+MAIL_BACKOFF_SECONDS = float(os.getenv("MAIL_BACKOFF_SECONDS", 5))   # first retry delay, doubled per attempt
+MAIL_STATUS_KEEP_SECONDS = int(os.getenv("MAIL_STATUS_KEEP_SECONDS", 86400))  # /mail-status history, also for digested events
+MAIL_SWEEP_SECONDS = int(os.getenv("MAIL_SWEEP_SECONDS", 600))
+
+mail_queue = MailQueue(smtp_pool, MAIL_SPOOL_DIR, workers=MAIL_WORKERS, max_attempts=MAIL_MAX_ATTEMPTS,
+                       backoff_seconds=MAIL_BACKOFF_SECONDS, keep_seconds=MAIL_STATUS_KEEP_SECONDS)
+
+# Admin notifications for these event types (contact, application, payment) are
+# collected into one digest mail; the others are sent to the admin immediately
+ADMIN_DIGEST_EVENTS = {e.strip() for e in os.getenv("ADMIN_DIGEST_EVENTS", "contact,application").split(",") if e.strip()}
+ADMIN_DIGEST_INTERVAL_SECONDS = int(os.getenv("ADMIN_DIGEST_INTERVAL_SECONDS", 300))  # send at least this often
+ADMIN_DIGEST_MAX_EVENTS = int(os.getenv("ADMIN_DIGEST_MAX_EVENTS", 20))                # or once this many are waiting
+
+admin_digest = AdminDigest(mail_queue, USERNAME, USERNAME, os.path.join(STATE_DIR, "admin-digest"),
+                           interval_seconds=ADMIN_DIGEST_INTERVAL_SECONDS, max_events=ADMIN_DIGEST_MAX_EVENTS,
+                           keep_seconds=MAIL_STATUS_KEEP_SECONDS)
+
+
+
+# Where records are kept: "sheets" (Google Sheets), "sqlite" (local file shared by
+# the workers on this host) or "memory" (per process, for tests and offline runs)
+STORAGE_BACKEND = os.getenv("STORAGE_BACKEND", "sheets")
 
 creds_b64 = os.getenv("GOOGLE_CREDS")
-if not creds_b64:
+if STORAGE_BACKEND == "sheets" and not creds_b64:
     raise ValueError("GOOGLE_CREDS_B64 environment variable not set!")
 
-# Decode Base64 to JSON string
-creds_json = base64.b64decode(creds_b64).decode("utf-8")
+# Client-side Sheets quota (Google's default is 60 reads and 60 writes a minute per service account)
+SHEETS_READ_PER_MINUTE = int(os.getenv("SHEETS_READ_PER_MINUTE", 60))
+SHEETS_WRITE_PER_MINUTE = int(os.getenv("SHEETS_WRITE_PER_MINUTE", 60))
+SHEETS_QUOTA_RESERVE = float(os.getenv("SHEETS_QUOTA_RESERVE", 0.25))  # share of each bucket kept for interactive calls
+SHEETS_QUOTA_MAX_WAIT = float(os.getenv("SHEETS_QUOTA_MAX_WAIT", 10))    # seconds a request waits for quota before 503
+SHEETS_MAX_ATTEMPTS = int(os.getenv("SHEETS_MAX_ATTEMPTS", 5))           # tries per call on 429 / 5xx
+
+sheets_quota = SheetsQuota(state_path("sheets-quota.json"), read_per_minute=SHEETS_READ_PER_MINUTE,
+                           write_per_minute=SHEETS_WRITE_PER_MINUTE, reserve=SHEETS_QUOTA_RESERVE,
+                           max_wait=SHEETS_QUOTA_MAX_WAIT, max_attempts=SHEETS_MAX_ATTEMPTS)
 
-# Convert JSON string to dict
-creds_dict = json.loads(creds_json)
+# Sheets API service – credentials are decoded and the client built on first use
+SHEETS_POOL_SIZE = int(os.getenv("SHEETS_POOL_SIZE", 10))           # keep-alive connections to Sheets per worker
+SHEETS_HTTP_TIMEOUT = float(os.getenv("SHEETS_HTTP_TIMEOUT", 60))   # socket timeout of each Sheets call
 
-# Build credentials and Sheets API service
-SCOPES = ["https://www.googleapis.com/auth/spreadsheets"]
-creds = Credentials.from_service_account_info(creds_dict, scopes=SCOPES)
-service = build("sheets", "v4", credentials=creds)
+service = LazySheetsService(quota=sheets_quota, pool_size=SHEETS_POOL_SIZE, http_timeout=SHEETS_HTTP_TIMEOUT)
 
 SPREADSHEET_ID = "1EiIjWBXG01SHMnz8aXechn95OJisLaNDhm2SN2nYYQ0"
 SHEET_NAME = "loginhistroy"
@@ -66,33 +128,166 @@ REGISTER_SHEET_NAME = "register"
 PAYMENT_EXCEL_ID="1PAAj8FyA3nKaSgeb07zDN0TBPPp0vCXTXLoaB1p1gdU"
 PAYMENT_EXCEL_NAME="payment"
 
+# How often (seconds) the in-memory user directory is reloaded from the register sheet
+USER_CACHE_REFRESH_SECONDS = int(os.getenv("USER_CACHE_REFRESH_SECONDS", 300))
+# Minimum gap (seconds) between reloads triggered by a lookup miss
+USER_CACHE_MISS_RELOAD_SECONDS = int(os.getenv("USER_CACHE_MISS_RELOAD_SECONDS", 30))
+# Wait (seconds) after a failed reload before the register sheet is downloaded again
+USER_CACHE_RETRY_SECONDS = int(os.getenv("USER_CACHE_RETRY_SECONDS", 30))
+
+# Write-behind batching of sheet appends
+APPEND_FLUSH_SECONDS = float(os.getenv("APPEND_FLUSH_SECONDS", 0.5))   # max time a row waits before being written
+APPEND_BATCH_ROWS = int(os.getenv("APPEND_BATCH_ROWS", 50))            # flush early once this many rows are queued
+APPEND_QUEUE_LIMIT = int(os.getenv("APPEND_QUEUE_LIMIT", 1000))        # callers block once this many rows are pending
+APPEND_SUBMIT_TIMEOUT = float(os.getenv("APPEND_SUBMIT_TIMEOUT", 5))   # seconds to wait for space before failing
+APPEND_MAX_ATTEMPTS = int(os.getenv("APPEND_MAX_ATTEMPTS", 5))          # tries per batch before its rows are dead-lettered
+
+sheet_appender = AppendCoalescer(
+    lambda: service,
+    flush_seconds=APPEND_FLUSH_SECONDS,
+    max_rows=APPEND_BATCH_ROWS,
+    max_pending=APPEND_QUEUE_LIMIT,
+    submit_timeout=APPEND_SUBMIT_TIMEOUT,
+    max_attempts=APPEND_MAX_ATTEMPTS,
+    backoff=sheets_quota.backoff,
+    dead_letter_path=state_path("sheets-dead-letter.jsonl"),
+)
+
+# Serial numbers are re-checked against the sheets this often (seconds)
+SERIAL_RESYNC_SECONDS = int(os.getenv("SERIAL_RESYNC_SECONDS", 600))
+SERIAL_RETRY_SECONDS = int(os.getenv("SERIAL_RETRY_SECONDS", 60))  # after a failed re-check, keep the local counter this long
+
+serials = SerialAllocator(lambda: service, resync_seconds=SERIAL_RESYNC_SECONDS, retry_seconds=SERIAL_RETRY_SECONDS)
+serials.register("contactus", CONTACTUSSPREADSHEET_ID, CONTACTUSSHEET_NAME)
+serials.register("loginhistory", SPREADSHEET_ID, SHEET_NAME)
+serials.register("jobs", JOBSPREADSHEET_ID, JOBSHEET_NAME)
+serials.register("register", REGISTER_SPREADSHEET_ID, REGISTER_SHEET_NAME)
+serials.register("payment", PAYMENT_EXCEL_ID, PAYMENT_EXCEL_NAME)
+
+# Threads available to async endpoints for blocking Sheets / SMTP calls
+SHEETS_IO_THREADS = int(os.getenv("SHEETS_IO_THREADS", 8))
+MAIL_IO_THREADS = int(os.getenv("MAIL_IO_THREADS", 4))
+
+sheets_io = BlockingExecutor("sheets-io", SHEETS_IO_THREADS)
+mail_io = BlockingExecutor("mail-io", MAIL_IO_THREADS)
+
+# Longest a single side effect (sheet write, queued mail) may take inside a request
+STEP_TIMEOUT_SECONDS = float(os.getenv("STEP_TIMEOUT_SECONDS", 20))
+
+# Largest resume accepted by /apply
+MAX_RESUME_BYTES = int(os.getenv("MAX_RESUME_BYTES", 10 * 1024 * 1024))
+
+# Resumes are kept on local disk by content hash and linked from the job sheet and admin mail
+RESUME_STORE_DIR = os.getenv("RESUME_STORE_DIR", os.path.join(STATE_DIR, "resumes"))
+# Links in mail and sheets need an absolute URL, which is never taken from the Host header
+PUBLIC_BASE_URL = os.getenv("PUBLIC_BASE_URL", "").rstrip("/")  # e.g. https://api.example.com
+
+if not PUBLIC_BASE_URL:
+    raise ValueError("PUBLIC_BASE_URL is not set!")
+
+resume_store = BlobStore(RESUME_STORE_DIR)
+
+# Header rows of every sheet, verified once per deployment (see sheet_schemas.py)
+SCHEMA_VERIFY_TTL_SECONDS = int(os.getenv("SCHEMA_VERIFY_TTL_SECONDS", 24 * 3600))
+DEPLOYMENT_ID = os.getenv("DEPLOYMENT_ID", os.getenv("RENDER_GIT_COMMIT", ""))
+
+sheet_schemas = SchemaRegistry(lambda: service, state_path("sheet-headers.json"),
+                               ttl=SCHEMA_VERIFY_TTL_SECONDS, deployment_id=DEPLOYMENT_ID)
+sheet_schemas.register("ContactUs", CONTACTUSSPREADSHEET_ID, CONTACTUSSHEET_NAME,
+                       ["S.No", "Name", "Phone", "Email", "ProjectType", "ProjectDescription", "SubmittedAt"])
+sheet_schemas.register("Login history", SPREADSHEET_ID, SHEET_NAME,
+                       ["S.No", "Username", "Email", "LoginTime", "LogoutTime", "HoursSpent"])
+sheet_schemas.register("Jobs", JOBSPREADSHEET_ID, JOBSHEET_NAME,
+                       ["S.No", "Name", "Email", "KeySkills", "JoinUs", "ResumeLink", "SubmittedAt"])
+sheet_schemas.register("Register", REGISTER_SPREADSHEET_ID, REGISTER_SHEET_NAME,
+                       ["S.No", "Username", "Email", "Password","mobile number", "Registered Time"])
+sheet_schemas.register("Payment", PAYMENT_EXCEL_ID, PAYMENT_EXCEL_NAME,
+                       ["S.No", "MailId", "SelectedProject", "Amount", "PaymentTime"])
+
+# Metrics label spreadsheets by name instead of id
+metrics.label_spreadsheet(SPREADSHEET_ID, "loginhistory")
+metrics.label_spreadsheet(CONTACTUSSPREADSHEET_ID, "contactus")
+metrics.label_spreadsheet(JOBSPREADSHEET_ID, "jobs")
+metrics.label_spreadsheet(REGISTER_SPREADSHEET_ID, "register")
+metrics.label_spreadsheet(PAYMENT_EXCEL_ID, "payment")
+
+# Sheet row of each user's latest open login is remembered so /logout can update it directly
+LOGOUT_INDEX_MAX_ENTRIES = int(os.getenv("LOGOUT_INDEX_MAX_ENTRIES", 10000))
+LOGOUT_ROW_WAIT_SECONDS = float(os.getenv("LOGOUT_ROW_WAIT_SECONDS", 10))  # wait for a still-queued login row
+LOGOUT_TAIL_ROWS = int(os.getenv("LOGOUT_TAIL_ROWS", 2000))                # rows scanned when the index misses
+
+if STORAGE_BACKEND == "memory":
+    storage = MemoryStorage()
+elif STORAGE_BACKEND == "sqlite":
+    storage = SQLiteStorage(state_path("portal.db"))
+else:
+    storage = SheetsStorage(
+        lambda: service,
+        {
+            "register": (REGISTER_SPREADSHEET_ID, REGISTER_SHEET_NAME),
+            "loginhistory": (SPREADSHEET_ID, SHEET_NAME),
+            "contactus": (CONTACTUSSPREADSHEET_ID, CONTACTUSSHEET_NAME),
+            "jobs": (JOBSPREADSHEET_ID, JOBSHEET_NAME),
+            "payment": (PAYMENT_EXCEL_ID, PAYMENT_EXCEL_NAME),
+        },
+        sheet_appender, serials, sheet_schemas,
+        user_refresh_seconds=USER_CACHE_REFRESH_SECONDS,
+        user_miss_reload_seconds=USER_CACHE_MISS_RELOAD_SECONDS,
+        user_retry_seconds=USER_CACHE_RETRY_SECONDS,
+        logout_index_size=LOGOUT_INDEX_MAX_ENTRIES,
+        logout_row_wait=LOGOUT_ROW_WAIT_SECONDS,
+        logout_tail_rows=LOGOUT_TAIL_ROWS,
+    )
+
+# Login hours per user and revenue per project, updated on every logout / payment
+if STORAGE_BACKEND == "memory":
+    stats = MemoryAggregates()
+else:
+    stats = SQLiteAggregates(state_path("stats.db"))
+STATS_BOOTSTRAP_RETRY_SECONDS = int(os.getenv("STATS_BOOTSTRAP_RETRY_SECONDS", 60))  # retry gap if the startup build fails
+
+# Key for the /admin endpoints (sent as X-Admin-Key); they are disabled while unset
+ADMIN_API_KEY = os.getenv("ADMIN_API_KEY", "")
+EXPORT_WINDOW_ROWS = int(os.getenv("EXPORT_WINDOW_ROWS", 1000))  # rows read per storage call by /admin/export
+export_index = ExportIndex()  # where since=<timestamp> exports start, learned from earlier exports
+IMPORT_MAX_BYTES = int(os.getenv("IMPORT_MAX_BYTES", 2 * 1024 * 1024))  # largest CSV /admin/import/register accepts
+IMPORT_MAX_ROWS = int(os.getenv("IMPORT_MAX_ROWS", 5000))                # users per import (one Sheets append)
+
+# Add a Server-Timing header (Sheets/SMTP time per request) to every response
+SERVER_TIMING = os.getenv("SERVER_TIMING", "true").lower() != "false"
+
 # ==============================
 # FastAPI Setup
 # ==============================
-setup_done = False   # Global flag to ensure setup runs only once
-setup_lock = asyncio.Lock()  # Prevents race conditions
-
 @asynccontextmanager
 async def lifespan(app: FastAPI):
-    global setup_done
-    async with setup_lock:   # Ensure only one worker does the setup
-        if not setup_done:
-            loop = asyncio.get_running_loop()
-
-            # Run all setup functions concurrently in background threads
-            tasks = [
-                loop.run_in_executor(None, contactus_setup_sheet),
-                loop.run_in_executor(None, setup_sheet),
-                loop.run_in_executor(None, jobs_setup_sheet),
-                loop.run_in_executor(None, register_setup_sheet),
-                loop.run_in_executor(None, setup_payment_sheet),
-            ]
-            await asyncio.gather(*tasks)
-
-            setup_done = True  # ✅ Ensures setup runs only once
+    mail_queue.start()
+    mail_queue.start_sweeper(MAIL_SWEEP_SECONDS)
+    admin_digest.start()
+    admin_digest.start_sweeper(MAIL_SWEEP_SECONDS)
+    sessions.start_sweeper(SESSION_SWEEP_SECONDS)
+    otp_store.start_sweeper(OTP_SWEEP_SECONDS)
+    idempotency.start_sweeper(IDEMPOTENCY_SWEEP_SECONDS)
+
+    # Sheets: verify headers, load the user directory and seed serial numbers
+    await sheets_io.run(storage.start)
+    # Stats are built from the stored records once per state directory
+    try:
+        await sheets_io.run(stats.bootstrap, storage)
+    except Exception as e:
+        print(f"⚠️ Error bootstrapping stats, retrying in {STATS_BOOTSTRAP_RETRY_SECONDS}s:", e)
+        stats.retry_bootstrap(storage, STATS_BOOTSTRAP_RETRY_SECONDS)
 
     yield
 
+    # Write out any rows still waiting to be stored
+    await sheets_io.run(storage.close)
+    await mail_io.run(admin_digest.stop)
+    await mail_io.run(mail_queue.stop)
+    smtp_pool.close()
+    sheets_io.shutdown(wait=False)
+    mail_io.shutdown(wait=False)
+
 app = FastAPI(title="Zoona Portal API",lifespan=lifespan)
 
 #==============================================================================
@@ -106,6 +301,244 @@ async def favicon():
     return FileResponse("static/favicon.ico")
 #==============================================================================
 
+@app.middleware("http")
+async def limit_upload_size(request: Request, call_next):
+    """Reject oversized /apply bodies from Content-Length before they are read"""
+    if request.url.path == "/apply":
+        content_length = request.headers.get("content-length")
+        # allow some room for the form fields and multipart boundaries
+        if content_length and content_length.isdigit() and int(content_length) > MAX_RESUME_BYTES + 64 * 1024:
+            return JSONResponse(status_code=413, content={"detail": "File too large"})
+    return await call_next(request)
+
+
+def route_label(request: Request) -> str:
+    """The route template (e.g. /mail-status/{message_id}) so labels stay bounded"""
+    for route in request.app.router.routes:
+        match, _ = route.matches(request.scope)
+        if match == Match.FULL:
+            return route.path
+    return "unmatched"
+
+
+# ==============================
+# Idempotency Keys
+# ==============================
+# A retried POST with the same Idempotency-Key gets the stored response instead of running again.
+# Responses that set a session (Set-Cookie or a session_id in the body) are never stored, so
+# /register is deduplicated while it runs but a later retry runs again.
+IDEMPOTENT_ROUTES = {"/pay", "/contactus", "/apply", "/register"}
+IDEMPOTENCY_BACKEND = os.getenv("IDEMPOTENCY_BACKEND", "sqlite")          # "sqlite" (shared) or "memory"
+IDEMPOTENCY_TTL_SECONDS = int(os.getenv("IDEMPOTENCY_TTL_SECONDS", 24 * 3600))  # how long responses are kept
+IDEMPOTENCY_MAX_ENTRIES = int(os.getenv("IDEMPOTENCY_MAX_ENTRIES", 10000))
+IDEMPOTENCY_LEASE_SECONDS = int(os.getenv("IDEMPOTENCY_LEASE_SECONDS", 120))    # a claim older than this was abandoned
+IDEMPOTENCY_WAIT_SECONDS = float(os.getenv("IDEMPOTENCY_WAIT_SECONDS", 30))     # duplicates wait this long for the first
+IDEMPOTENCY_SWEEP_SECONDS = int(os.getenv("IDEMPOTENCY_SWEEP_SECONDS", 300))
+IDEMPOTENCY_MAX_BODY_BYTES = 64 * 1024  # larger responses are not stored
+
+if IDEMPOTENCY_BACKEND == "memory":
+    idempotency = MemoryIdempotencyStore(IDEMPOTENCY_TTL_SECONDS, lease=IDEMPOTENCY_LEASE_SECONDS,
+                                         max_entries=IDEMPOTENCY_MAX_ENTRIES)
+else:
+    idempotency = SQLiteIdempotencyStore(state_path("idempotency.db"), IDEMPOTENCY_TTL_SECONDS,
+                                         lease=IDEMPOTENCY_LEASE_SECONDS, max_entries=IDEMPOTENCY_MAX_ENTRIES)
+
+
+def replay_response(stored: dict) -> Response:
+    response = Response(content=stored["body"].encode("latin-1"), status_code=stored["status"])
+    response.raw_headers = [(name.encode("latin-1"), value.encode("latin-1")) for name, value in stored["headers"]]
+    response.headers["Idempotent-Replayed"] = "true"
+    return response
+
+
+def request_fingerprint(request: Request) -> str:
+    """Hash of the request line and media type; the body is compared separately (BodyFingerprint)"""
+    media_type = request.headers.get("content-type", "").split(";", 1)[0].strip().lower()
+    return hashlib.sha256("\n".join([request.method, request.url.path, media_type]).encode()).hexdigest()
+
+
+def sets_session(response: Response, body: bytes) -> bool:
+    return any(name.lower() == b"set-cookie" for name, _ in response.raw_headers) or b'"session_id"' in body
+
+
+@app.middleware("http")
+async def idempotency_keys(request: Request, call_next):
+    """Run each (route, client, Idempotency-Key) once; retries get the first response"""
+    key = request.headers.get("idempotency-key")
+    if request.method != "POST" or request.url.path not in IDEMPOTENT_ROUTES or key is None:
+        return await call_next(request)
+    if not 0 < len(key) <= 255:
+        return JSONResponse(status_code=400, content={"detail": "Invalid Idempotency-Key"})
+    content_length = request.headers.get("content-length")
+    if content_length and content_length.isdigit() and int(content_length) > MAX_RESUME_BYTES + 64 * 1024:
+        return await call_next(request)  # rejected by limit_upload_size, nothing to deduplicate
+    fingerprint = request_fingerprint(request)
+    # The body is hashed as it streams to the endpoint (or is drained for a replay), never buffered.
+    # Chunked bodies without Content-Length are covered the same way.
+    body_hash = BodyFingerprint(request._receive, request.headers.get("content-type", ""))
+    request._receive = body_hash.receive
+
+    # Scoped to the route and session, so one client can never replay another's response.
+    # Without a session, keys are bound to the client's address and User-Agent instead.
+    session_id = request.cookies.get("session_id", "")
+    client = "" if session_id else "\n".join([request.client.host if request.client else "",
+                                               request.headers.get("user-agent", "")])
+    scope = "\n".join([request.url.path, session_id, client, key])
+    scoped_key = hashlib.sha256(scope.encode()).hexdigest()
+
+    deadline = time.monotonic() + IDEMPOTENCY_WAIT_SECONDS
+    delay = 0.05
+    while True:
+        state, stored = await run_in_threadpool(idempotency.begin, scoped_key, fingerprint)
+        if state == "mismatch":
+            return JSONResponse(status_code=422,
+                                content={"detail": "Idempotency-Key was already used for a different request"})
+        if state == "done":
+            await body_hash.drain()
+            if stored.get("body_sha256", body_hash.hexdigest()) != body_hash.hexdigest():
+                return JSONResponse(status_code=422,
+                                    content={"detail": "Idempotency-Key was already used for a different request"})
+            return replay_response(stored)
+        if state == "run":
+            break
+        # A request with this key is still running – wait for its response
+        if time.monotonic() + delay > deadline:
+            return JSONResponse(status_code=409, headers={"Retry-After": "1"},
+                                content={"detail": "A request with this Idempotency-Key is still in progress"})
+        await asyncio.sleep(delay)
+        delay = min(delay * 2, 0.5)
+
+    try:
+        response = await call_next(request)
+        body = b""
+        async for chunk in response.body_iterator:
+            body += chunk
+        await body_hash.drain()
+    except BaseException:
+        await run_in_threadpool(idempotency.release, scoped_key)
+        raise
+
+    stored = {"status": response.status_code, "body": body.decode("latin-1"), "body_sha256": body_hash.hexdigest(),
+              "headers": [(name.decode("latin-1"), value.decode("latin-1")) for name, value in response.raw_headers]}
+    # Server errors are not final: let the client's retry run the request again.
+    # Session credentials are never stored, so a replay can't hand them to someone else.
+    if (response.status_code >= 500 or len(body) > IDEMPOTENCY_MAX_BODY_BYTES or sets_session(response, body)
+            or not body_hash.complete):
+        await run_in_threadpool(idempotency.release, scoped_key)
+    else:
+        await run_in_threadpool(idempotency.complete, scoped_key, stored)
+    rebuilt = Response(content=body, status_code=response.status_code, background=response.background)
+    rebuilt.raw_headers = response.raw_headers
+    return rebuilt
+
+
+# ==============================
+# Admission Control
+# ==============================
+# Sheets-bound routes may only use part of the request threadpool, so a slow Google API
+# cannot stall cheap endpoints like / and /me. Extra requests wait briefly, then get a 503.
+ADMISSION_CAPACITY = int(os.getenv("ADMISSION_CAPACITY", 24))    # Sheets-bound requests running per worker
+ADMISSION_RESERVE = int(os.getenv("ADMISSION_RESERVE", 4))       # of those, slots only priority routes may take
+ADMISSION_QUEUE = int(os.getenv("ADMISSION_QUEUE", 32))          # requests waiting per route before 503
+ADMISSION_MAX_WAIT = float(os.getenv("ADMISSION_MAX_WAIT", 5))   # seconds a request waits for a slot before 503
+# Latency-critical routes: served first when slots free up and allowed into the reserve
+ADMISSION_PRIORITY_ROUTES = {r.strip() for r in os.getenv("ADMISSION_PRIORITY_ROUTES", "/login,/logout").split(",") if r.strip()}
+
+# Concurrent requests per route; "/pay=4,/apply=2" in ADMISSION_LIMITS overrides these
+ADMISSION_LIMITS = {
+    "/login": 8,
+    "/logout": 4,
+    "/register": 6,
+    "/pay": 6,
+    "/contactus": 6,
+    "/apply": 4,
+    "/forgot-password": 4,
+    "/verify-forgot-password": 4,
+    "/reset-password": 4,
+}
+for item in os.getenv("ADMISSION_LIMITS", "").split(","):
+    if "=" in item:
+        route, limit = item.split("=", 1)
+        ADMISSION_LIMITS[route.strip()] = int(limit)
+
+admission = AdmissionControl(ADMISSION_CAPACITY, reserve=ADMISSION_RESERVE)
+for route, limit in ADMISSION_LIMITS.items():
+    admission.limit(route, limit, queue=ADMISSION_QUEUE, max_wait=ADMISSION_MAX_WAIT,
+                    priority=route in ADMISSION_PRIORITY_ROUTES)
+
+admission_rejected = metrics.Counter(
+    "admission_rejected_total", "Requests turned away by admission control", ("route", "reason"))
+
+
+@app.middleware("http")
+async def admission_control(request: Request, call_next):
+    """Bound the Sheets-bound requests in flight; shed load with 503 + Retry-After"""
+    route = route_label(request)
+    try:
+        async with admission.slot(route):
+            return await call_next(request)
+    except Overloaded as e:
+        admission_rejected.inc(route, e.reason)
+        return JSONResponse(status_code=503, content={"detail": "Service busy, please try again shortly"},
+                            headers={"Retry-After": str(e.retry_after)})
+
+
+@app.middleware("http")
+async def record_metrics(request: Request, call_next):
+    """Request histograms plus the Sheets/SMTP time spent on behalf of each request"""
+    route = route_label(request)
+    timings = metrics.RequestTimings(route)
+    token = metrics.current_request.set(timings)
+    start = time.perf_counter()
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+    finally:
+        elapsed = time.perf_counter() - start
+        metrics.current_request.reset(token)
+        metrics.http_requests.inc(request.method, route, str(status))
+        metrics.http_request_duration.observe(elapsed, request.method, route)
+    if SERVER_TIMING:
+        response.headers["Server-Timing"] = timings.server_timing(elapsed)
+    return response
+
+
+@app.exception_handler(SheetsQuotaExhausted)
+async def sheets_quota_exhausted(request: Request, exc: SheetsQuotaExhausted):
+    return JSONResponse(status_code=503, content={"detail": "Service busy, please try again shortly"},
+                        headers={"Retry-After": str(max(1, round(exc.retry_after)))})
+
+
+def quota_gauge(field: str):
+    def collect():
+        headroom = sheets_quota.headroom()
+        return {(kind,): headroom[kind][field] for kind in ("read", "write")}
+    return collect
+
+
+metrics.REGISTRY += [
+    metrics.Gauge("sheets_quota_tokens", "Sheets requests that can be made right now",
+                  ("bucket",), quota_gauge("tokens")),
+    metrics.Gauge("sheets_quota_effective_per_minute", "Current Sheets rate after 429 slow-downs",
+                  ("bucket",), quota_gauge("effective_per_minute")),
+    metrics.Gauge("sheets_quota_paused_seconds", "Time left in a 429 pause",
+                  ("bucket",), quota_gauge("paused_for")),
+    metrics.Gauge("sheets_pool_connections", "Pooled Sheets connections by state",
+                  ("state",), lambda: {(state,): service.pool.stats()[state] for state in ("idle", "in_use")}),
+    metrics.Gauge("admission_in_flight", "Requests holding an admission slot",
+                  ("route",), lambda: {(route,): s["in_flight"] for route, s in admission.stats().items()}),
+    metrics.Gauge("admission_waiting", "Requests waiting for an admission slot",
+                  ("route",), lambda: {(route,): s["waiting"] for route, s in admission.stats().items()}),
+    admission_rejected,
+]
+
+
+@app.get("/metrics")
+def prometheus_metrics():
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
+
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["*"],  # Allow your HTML file origin if needed
@@ -117,75 +550,7 @@ app.add_middleware(
 # Google Sheets Helpers
 # ==============================
 
-def setup_sheet():
-    """Ensure headers exist in Google Sheet"""
-    try:
-        result = service.spreadsheets().values().get(
-            spreadsheetId=SPREADSHEET_ID,
-            range=f"{SHEET_NAME}!A1:F1"
-        ).execute()
-
-        if 'values' not in result or len(result['values']) == 0:
-            headers = [["S.No", "Username", "Email", "LoginTime", "LogoutTime", "HoursSpent"]]
-            service.spreadsheets().values().update(
-                spreadsheetId=SPREADSHEET_ID,
-                range=f"{SHEET_NAME}!A1:F1",
-                valueInputOption="RAW",
-                body={"values": headers}
-            ).execute()
-            print("✅ Headers created successfully.")
-    except Exception as e:
-        print("⚠️ Error setting up headers:", e)
-
-
-
-# Setup sheet headers at startup
-
-
-def contactus_setup_sheet():
-    """Ensure headers exist in ContactUs Google Sheet"""
-    try:
-        result = service.spreadsheets().values().get(
-            spreadsheetId=CONTACTUSSPREADSHEET_ID,
-            range=f"{CONTACTUSSHEET_NAME}!A1:G1"
-        ).execute()
-
-        if "values" not in result or len(result["values"]) == 0:
-            headers = [["S.No", "Name", "Phone", "Email", "ProjectType", "ProjectDescription", "SubmittedAt"]]
-            service.spreadsheets().values().update(
-                spreadsheetId=CONTACTUSSPREADSHEET_ID,
-                range=f"{CONTACTUSSHEET_NAME}!A1:G1",
-                valueInputOption="RAW",
-                body={"values": headers}
-            ).execute()
-            print("✅ ContactUs headers created successfully.")
-        else:
-            print("ℹ️ ContactUs headers already exist.")
-    except Exception as e:
-        print("⚠️ Error setting up ContactUs headers:", e)
-
-
-def jobs_setup_sheet():
-    """Ensure headers exist in Job Applications Google Sheet"""
-    try:
-        result = service.spreadsheets().values().get(
-            spreadsheetId=JOBSPREADSHEET_ID,
-            range=f"{JOBSHEET_NAME}!A1:E1"
-        ).execute()
-
-        if "values" not in result or len(result["values"]) == 0:
-            headers = [["S.No", "Name", "Email", "KeySkills", "JoinUs", "ResumeLink", "SubmittedAt"]]
-            service.spreadsheets().values().update(
-                spreadsheetId=JOBSPREADSHEET_ID,
-                range=f"{JOBSHEET_NAME}!A1:G1",
-                valueInputOption="RAW",
-                body={"values": headers}
-            ).execute()
-            print("✅ Jobs headers created successfully.")
-        else:
-            print("ℹ️ Jobs headers already exist.")
-    except Exception as e:
-        print("⚠️ Error setting up Jobs headers:", e)
+# Sheet headers are set up at startup by sheet_schemas.ensure_all()
 
 
 # ==============================
@@ -214,20 +579,21 @@ def send_thankyou_email(to_email: str, name: str, project_type: str):
         msg["Subject"] = subject
         msg.attach(MIMEText(body, "html"))
 
-        with smtplib.SMTP(SMTP_SERVER, SMTP_PORT) as server:
-            server.starttls()
-            server.login(USERNAME, PASSWORD)
-            server.sendmail(USERNAME, to_email, msg.as_string())
-
-        return True
+        return mail_queue.enqueue(USERNAME, to_email, msg.as_string())
     except Exception as e:
         print("Email Error (User):", e)
-        return False
+        return None
 
 
 def send_admin_notification(name: str, phone: str, email: str, project_type: str, project_description: str):
     """Send project details to admin"""
     try:
+        if "contact" in ADMIN_DIGEST_EVENTS:
+            return admin_digest.add("contact", "📩 New Contact Request", {
+                "Name": name, "Email": email, "Phone": phone,
+                "Service": project_type, "Message": project_description,
+            })
+
         subject = "📩 New Contact Request"
         body = f"""
         <html>
@@ -250,58 +616,40 @@ def send_admin_notification(name: str, phone: str, email: str, project_type: str
         msg["Subject"] = subject
         msg.attach(MIMEText(body, "html"))
 
-        with smtplib.SMTP(SMTP_SERVER, SMTP_PORT) as server:
-            server.starttls()
-            server.login(USERNAME, PASSWORD)
-            server.sendmail(USERNAME, USERNAME, msg.as_string())
-
-        return True
+        return mail_queue.enqueue(USERNAME, USERNAME, msg.as_string())
     except Exception as e:
         print("Email Error (Admin):", e)
-        return False
+        return None
 
 
-def send_resume_email(name: str, email: str, keyskills: str, join_us: str, resume: UploadFile):
-    """Send job application + resume to admin"""
+def send_resume_email(name: str, email: str, keyskills: str, join_us: str, resume_filename: str, resume_url: str):
+    """Send job application + resume link to admin"""
     try:
+        if "application" in ADMIN_DIGEST_EVENTS:
+            return admin_digest.add("application", "📄 New Job Application", {
+                "Name": name, "Email": email, "Key Skills": keyskills, "Join Us?": join_us,
+                "Resume": f"{resume_filename} – {resume_url}",
+            })
+
         subject = "📄 New Job Application"
         body = f"""
         <html>
         <body>
             <p><b>📩 New Job Application Received</b></p>
-            <p><b>Name:</b> {name}</p>
-            <p><b>Email:</b> {email}</p>
-            <p><b>Key Skills:</b> {keyskills}</p>
-            <p><b>Join Us?:</b> {join_us}</p>
-            <br>
-            <p>Resume is attached with this email.</p>
+            <p><b>Name:</b> {html.escape(name)}</p>
+            <p><b>Email:</b> {html.escape(email)}</p>
+            <p><b>Key Skills:</b> {html.escape(keyskills)}</p>
+            <p><b>Join Us?:</b> {html.escape(join_us)}</p>
+            <p><b>Resume:</b> <a href="{html.escape(resume_url)}">{html.escape(resume_filename or "")}</a></p>
             <br>
             <p>Regards,<br>Zoona Careers Portal</p>
         </body>
         </html>
         """
-
-        msg = MIMEMultipart()
-        msg["From"] = USERNAME
-        msg["To"] = USERNAME
-        msg["Subject"] = subject
-        msg.attach(MIMEText(body, "html"))
-
-        # Attach resume file
-        file_content = resume.file.read()
-        part = MIMEApplication(file_content, Name=resume.filename)
-        part["Content-Disposition"] = f'attachment; filename="{resume.filename}"'
-        msg.attach(part)
-
-        with smtplib.SMTP(SMTP_SERVER, SMTP_PORT) as server:
-            server.starttls()
-            server.login(USERNAME, PASSWORD)
-            server.sendmail(USERNAME, USERNAME, msg.as_string())
-
-        return True
+        return send_email(USERNAME, subject, body)
     except Exception as e:
         print("Email Error (Resume):", e)
-        return False
+        return None
 
 
 def send_thankyou_resume(name: str, email: str):
@@ -322,73 +670,145 @@ def send_thankyou_resume(name: str, email: str):
         HR Team
         """)
 
-        with smtplib.SMTP(SMTP_SERVER, SMTP_PORT) as server:
-            server.starttls()
-            server.login(USERNAME, PASSWORD)
-            server.send_message(msg)
-
-        return True
+        return mail_queue.enqueue(USERNAME, email, msg)
     except Exception as e:
         print("Error sending thank-you email:", e)
-        return False
+        return None
 
 
 # ==============================
 # API Endpoints
 # ==============================
+@app.get("/mail-status/{message_id}")
+def mail_status(message_id: str):
+    """Delivery state of a queued email: queued, sending, retrying, sent or failed.
+    Admin notifications held for the digest report pending / sent_in_digest instead."""
+    status = mail_queue.status(message_id) or admin_digest.status(message_id)
+    if status is None:
+        raise HTTPException(status_code=404, detail="Unknown mail id")
+    return status
 
 
+@app.get("/mail-queue")
+def mail_queue_stats():
+    """Queue depth, delivery counters and latency for this worker's mail queue"""
+    return mail_queue.stats()
 
 
-def append_user_details(name: str, phone: str, email: str, project_type: str, project_description: str):
-    """Append user details into Google Sheet with auto incremented S.No"""
+@app.get("/sheets-quota")
+def sheets_quota_headroom():
+    """Tokens left in the Sheets read/write buckets and this worker's throttling counters"""
+    return sheets_quota.headroom()
+
+
+def require_admin(request: Request):
+    if not ADMIN_API_KEY:
+        raise HTTPException(status_code=403, detail="Admin API is disabled")
+    if not secrets.compare_digest(request.headers.get("x-admin-key", ""), ADMIN_API_KEY):
+        raise HTTPException(status_code=401, detail="Invalid admin key")
+
+
+@app.get("/admin/stats/logins")
+def login_stats(request: Request):
+    """Sessions and hours spent per user, from the materialized totals (no Sheets reads)"""
+    require_admin(request)
+    return stats.logins()
+
+
+@app.get("/admin/stats/payments")
+def payment_stats(request: Request):
+    """Payment count and revenue per project, from the materialized totals (no Sheets reads)"""
+    require_admin(request)
+    return stats.payments()
+
+
+@app.post("/admin/stats/rebuild")
+def rebuild_stats(request: Request):
+    """Recount the totals from the stored records, e.g. after the sheets were edited by hand"""
+    require_admin(request)
+    stats.bootstrap(storage, force=True)
+    export_index.clear()
+    return {"logins": stats.logins()["sessions"], "payments": stats.payments()["payments"]}
+
+
+@app.get("/admin/export/{sheet}")
+async def export_sheet(request: Request, sheet: str, format: str = "csv", since: str = "", gzip: bool = False):
+    """Stream every record of one sheet (register, loginhistory, contactus, jobs, payment).
+
+    Rows are read EXPORT_WINDOW_ROWS at a time and written out as they arrive.
+    Each row carries its cursor; pass the last one back as ``since`` to fetch
+    only newer rows, or give ``since`` as a timestamp. A timestamp starts from
+    the checkpoints earlier exports left in ``export_index``, so only the first
+    export after a restart reads the sheet from the top.
+    """
+    require_admin(request)
+    if sheet not in EXPORT_FIELDS:
+        raise HTTPException(status_code=404, detail="Unknown sheet")
+    if format not in MEDIA_TYPES:
+        raise HTTPException(status_code=400, detail="format must be csv or ndjson")
     try:
-        result = service.spreadsheets().values().get(
-            spreadsheetId=CONTACTUSSPREADSHEET_ID,
-            range=f"{CONTACTUSSHEET_NAME}!A:A"
-        ).execute()
+        after, not_before = parse_since(since)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    def read(after: int, limit: int):
+        # Counted as background work so a long export leaves quota for logins
+        with metrics.attributed_to("/admin/export/{sheet}"):
+            return storage.records(sheet, after=after, limit=limit)
+
+    async def read_window(after: int, limit: int):
+        return await sheets_io.run(read, after, limit)
+
+    headers = {"Content-Disposition": f'attachment; filename="{sheet}.{format}"', "Cache-Control": "no-store"}
+    if gzip:
+        headers["Content-Encoding"] = "gzip"
+    return StreamingResponse(
+        export_stream(read_window, sheet, format, after=after, not_before=not_before,
+                      window=EXPORT_WINDOW_ROWS, compress=gzip, index=export_index),
+        media_type=MEDIA_TYPES[format], headers=headers,
+    )
 
-        num_rows = len(result.get("values", []))
-        serial_no = num_rows  # header included
 
-        submitted_at = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
 
-        values = [[serial_no, name, phone, email, project_type, project_description, submitted_at]]
-        service.spreadsheets().values().append(
-            spreadsheetId=CONTACTUSSPREADSHEET_ID,
-            range=f"{CONTACTUSSHEET_NAME}!A:G",
-            valueInputOption="RAW",
-            insertDataOption="INSERT_ROWS",
-            body={"values": values}
-        ).execute()
 
+def append_user_details(name: str, phone: str, email: str, project_type: str, project_description: str):
+    """Store a contact request (S.No is assigned by the storage)"""
+    try:
+        storage.add("contactus", {
+            "name": name,
+            "phone": phone,
+            "email": email,
+            "project_type": project_type,
+            "project_description": project_description,
+            "submitted_at": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+        })
         return True
     except Exception as e:
-        print("Google Sheets Error:", e)
+        print("Storage Error:", e)
         return False
 
 
 
 @app.post("/contactus")
-def submit_user(
+async def submit_user(
     name: str = Form(...),
     phone: str = Form(...),
     email: str = Form(...),
     project_type: str = Form(...),
     project_description: str = Form(...)
 ):
+    # Store the request, thank the user and notify the admin at the same time
+    outcomes = await fan_out([
+        Step("sheet", sheets_io, append_user_details, name, phone, email, project_type, project_description),
+        Step("user_mail", mail_io, send_thankyou_email, email, name, project_type),
+        Step("admin_mail", mail_io, send_admin_notification, name, phone, email, project_type, project_description),
+    ], timeout=STEP_TIMEOUT_SECONDS)
 
-    sheet_status = append_user_details(name, phone, email, project_type, project_description)
-    # Send thank you email to user
-    email_status_user = send_thankyou_email(email, name, project_type)
+    if failed(outcomes):
+        raise HTTPException(status_code=500, detail=f"Failed to process the request: {', '.join(failed(outcomes))}")
 
-    # Send project details to admin
-    email_status_admin = send_admin_notification(name, phone, email, project_type, project_description)
-
-    if not (email_status_user and email_status_admin and sheet_status):
-        raise HTTPException(status_code=500, detail="Failed to send one or more emails")
-
-    return {"message": "User details received successfully!"}
+    return {"message": "User details received successfully!",
+            "mail_ids": [outcomes["user_mail"].value, outcomes["admin_mail"].value]}
 
 @app.post("/apply")
 async def apply_job(
@@ -398,119 +818,129 @@ async def apply_job(
     join_us: str = Form(...),
     resume: UploadFile = File(...)
 ):
-    if not resume.filename.lower().endswith((".pdf", ".doc", ".docx")):
-        raise HTTPException(status_code=400, detail="Only PDF, DOC, DOCX files are allowed")
+    # Check size and real file type (magic bytes) without reading the file into memory
+    try:
+        content_type = await mail_io.run(inspect_upload, resume, MAX_RESUME_BYTES)
+    except UploadRejected as e:
+        raise HTTPException(status_code=e.status_code, detail=e.detail)
 
-    # Send emails
-    if not send_resume_email(name, email, keyskills, join_us, resume):
+    # Keep the resume on disk by content hash; the sheet and admin mail only carry a link to it
+    try:
+        digest, size, stored = await mail_io.run(
+            resume_store.put, iter_upload(resume, MAX_RESUME_BYTES), content_type, resume.filename)
+    except OSError as e:
+        print("❌ Error storing resume:", e)
+        raise HTTPException(status_code=500, detail="Failed to store resume")
+    if not stored:
+        print(f"ℹ️ Resume {digest[:12]} already stored, reusing it")
+    resume_url = f"{PUBLIC_BASE_URL}/resumes/{digest}"
+
+    # The applicant is only thanked once the resume has reached the admin
+    outcomes = await fan_out([
+        Step("resume_mail", mail_io, send_resume_email, name, email, keyskills, join_us, resume.filename, resume_url),
+        Step("thankyou_mail", mail_io, send_thankyou_resume, name, email, after=["resume_mail"]),
+        Step("sheet", sheets_io, append_job_application, name, email, keyskills, join_us, resume_url),
+    ], timeout=STEP_TIMEOUT_SECONDS)
+
+    if not outcomes["resume_mail"].ok:
         raise HTTPException(status_code=500, detail="Failed to send job application email")
-
-    if not send_thankyou_resume(name, email):
+    if not outcomes["thankyou_mail"].ok:
         raise HTTPException(status_code=500, detail="Failed to send thank-you email to applicant")
 
-    # ==============================
-    # Save details in Google Sheet
-    # ==============================
-    try:
-        # Get existing rows to calculate S.No
-        result = service.spreadsheets().values().get(
-            spreadsheetId=JOBSPREADSHEET_ID,
-            range=f"{JOBSHEET_NAME}!A:A"
-        ).execute()
-
-        rows = result.get("values", [])
-        sno = len(rows)  # auto increment based on row count
+    return {
+        "message": "Job application submitted successfully!",
+        "resume_filename": resume.filename,
+        "resume_url": resume_url,
+        "mail_ids": [outcomes["resume_mail"].value, outcomes["thankyou_mail"].value]
+    }
 
-        submitted_at = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
 
-        # Create a clickable link formula
-        resume_link = f'=HYPERLINK("https://drive.google.com/your_resume_folder/{resume.filename}", "View Resume")'
+@app.get("/resumes/{digest}")
+def get_resume(digest: str):
+    """Serve a stored resume by its SHA-256; Range requests are supported"""
+    blob = resume_store.get(digest)
+    if blob is None:
+        raise HTTPException(status_code=404, detail="Resume not found")
+    path, meta = blob
+    return FileResponse(
+        path,
+        media_type=meta.get("content_type") or "application/octet-stream",
+        filename=meta.get("filename") or None,
+        content_disposition_type="inline",
+        # Content never changes for a given hash
+        headers={"ETag": f'"{digest}"', "Cache-Control": "private, max-age=31536000, immutable"},
+    )
 
-        new_row = [sno, name, email, keyskills, join_us, resume_link, submitted_at]
 
-        service.spreadsheets().values().append(
-            spreadsheetId=JOBSPREADSHEET_ID,
-            range=f"{JOBSHEET_NAME}!A:G",
-            valueInputOption="USER_ENTERED",
-            body={"values": [new_row]}
-        ).execute()
+def append_job_application(name: str, email: str, keyskills: str, join_us: str, resume_url: str):
+    """Save job application details"""
+    try:
+        storage.add("jobs", {
+            "name": name,
+            "email": email,
+            "keyskills": keyskills,
+            "join_us": join_us,
+            "resume_link": resume_url,
+            "submitted_at": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+        })
 
-        print("✅ Job application stored in Google Sheets.")
+        print("✅ Job application stored.")
+        return True
 
     except Exception as e:
         print("⚠️ Error storing job application:", e)
+        return False
+
+# "sqlite" shares sessions between all workers on the host, "memory" keeps them per process
+SESSION_BACKEND = os.getenv("SESSION_BACKEND", "sqlite")
+SESSION_TTL_SECONDS = int(os.getenv("SESSION_TTL_SECONDS", 8 * 3600))      # idle time before a session expires
+SESSION_MAX_ENTRIES = int(os.getenv("SESSION_MAX_ENTRIES", 10000))        # memory backend only
+SESSION_SWEEP_SECONDS = int(os.getenv("SESSION_SWEEP_SECONDS", 300))
 
-    return {"message": "Job application submitted successfully!", "resume_filename": resume.filename}
+if SESSION_BACKEND == "memory":
+    sessions = MemorySessionStore(SESSION_TTL_SECONDS, max_sessions=SESSION_MAX_ENTRIES)
+else:
+    sessions = SQLiteSessionStore(state_path("sessions.db"), SESSION_TTL_SECONDS)
 
-sessions = {}
 
 def create_session(username: str, email: str):
-    session_id = secrets.token_hex(16)
-    sessions[session_id] = {
+    return sessions.create({
         "username": username,
         "email": email,
         "login_time": datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-    }
-    return session_id
+    })
 
 def get_current_user(request: Request) -> Optional[dict]:
     session_id = request.cookies.get("session_id")
-    if session_id and session_id in sessions:
-        return sessions[session_id]
+    if session_id:
+        return sessions.get(session_id)
     return None
 
 
 # ------------------ EXISTING LOGIN ------------------
 def append_login_history(username: str, email: str, login_time: str):
-    """Append a new row with auto-incremented S.No"""
+    """Store a new login with empty LogoutTime & HoursSpent"""
     try:
-        result = service.spreadsheets().values().get(
-            spreadsheetId=SPREADSHEET_ID,
-            range=f"{SHEET_NAME}!A:A"
-        ).execute()
-
-        num_rows = len(result.get('values', []))
-        serial_no = num_rows  # Row count includes header
-
-        # Append row with empty LogoutTime & HoursSpent
-        values = [[serial_no, username, email, login_time, "", ""]]
-
-        service.spreadsheets().values().append(
-            spreadsheetId=SPREADSHEET_ID,
-            range=f"{SHEET_NAME}!A:F",
-            valueInputOption="RAW",
-            insertDataOption="INSERT_ROWS",
-            body={"values": values}
-        ).execute()
-
+        storage.add("loginhistory", {"username": username, "email": email, "login_time": login_time})
         return True
+    except SheetsQuotaExhausted:
+        raise  # answered with 503 + Retry-After
     except Exception as e:
-        print("Google Sheets Error:", e)
+        print("Storage Error:", e)
         return False
 
 
 @app.post("/login")
 def login_user(email: str = Form(...), password: str = Form(...), response: Response = Response()):
     try:
-        # 1. Fetch registered users from register sheet
-        result = service.spreadsheets().values().get(
-            spreadsheetId=REGISTER_SPREADSHEET_ID,
-            range=f"{REGISTER_SHEET_NAME}!A1:F"
-        ).execute()
-
-        rows = result.get("values", [])[1:]  # Skip header row
-
-        # 2. Find matching user
-        matched_user = None
-        for row in rows:
-            if len(row) >= 4 and row[2] == email and row[3] == password:
-                matched_user = row
-                break
-
-        if not matched_user:
+        # 1. Look up the registered user
+        matched_user = storage.get_user(email)
+
+        # 2. Check password
+        if not matched_user or not secrets.compare_digest(matched_user["password"], password):
             raise HTTPException(status_code=401, detail="Invalid email or password")
 
-        username = matched_user[1]
+        username = matched_user["username"]
 
         # 3. Record login history
         login_time = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
@@ -533,6 +963,8 @@ def login_user(email: str = Form(...), password: str = Form(...), response: Resp
             "login_time": login_time
         }
 
+    except SheetsQuotaExhausted:
+        raise
     except Exception as e:
         print("Error during login:", e)
         raise HTTPException(status_code=500, detail="Login process failed email or password must not be correct")
@@ -540,41 +972,21 @@ def login_user(email: str = Form(...), password: str = Form(...), response: Resp
 
 # ------------------ EXISTING LOGOUT ------------------
 def update_logout_history(username: str, email: str, logout_time: str):
-    """Update the latest login row of a user with logout time and hours spent"""
+    """Close the user's latest login with logout time and hours spent"""
     try:
-        result = service.spreadsheets().values().get(
-            spreadsheetId=SPREADSHEET_ID,
-            range=f"{SHEET_NAME}!A:F"
-        ).execute()
-
-        values = result.get("values", [])
-        if not values or len(values) <= 1:
-            return False
-
-        # Search from bottom to find last login for email
-        for row_idx in range(len(values) - 1, 0, -1):
-            row = values[row_idx]
-            if len(row) >= 3 and row[2] == email:  # email matches
-                if len(row) < 5 or row[4] == "":   # no logout yet
-                    login_time_str = row[3]
-                    login_dt = datetime.strptime(login_time_str, "%Y-%m-%d %H:%M:%S")
-                    logout_dt = datetime.strptime(logout_time, "%Y-%m-%d %H:%M:%S")
-                    time_diff = logout_dt - login_dt
-                    hours_spent = str(time_diff)   # Store as HH:MM:SS
-
-                    update_range = f"{SHEET_NAME}!E{row_idx+1}:F{row_idx+1}"
-                    service.spreadsheets().values().update(
-                        spreadsheetId=SPREADSHEET_ID,
-                        range=update_range,
-                        valueInputOption="RAW",
-                        body={"values": [[logout_time, hours_spent]]}
-                    ).execute()
-
-                    return True
-        return False
+        login = storage.record_logout(email, logout_time)
+    except SheetsQuotaExhausted:
+        raise  # answered with 503 + Retry-After
     except Exception as e:
-        print("Google Sheets Error:", e)
+        print("Storage Error:", e)
+        return False
+    if not login:
         return False
+    try:
+        stats.add_session(login)
+    except Exception as e:
+        print("⚠️ Error updating login stats:", e)
+    return True
 
 
 @app.post("/logout")
@@ -591,9 +1003,7 @@ def logout_user(request: Request, response: Response):
         raise HTTPException(status_code=500, detail="Failed to update logout history")
 
     # ✅ remove session
-    session_id = request.cookies.get("session_id")
-    if session_id in sessions:
-        del sessions[session_id]
+    sessions.delete(request.cookies.get("session_id"))
 
     response.delete_cookie("session_id")
 
@@ -611,75 +1021,25 @@ def get_me(request: Request):
 
 
 
-def register_setup_sheet():
-    """Ensure headers exist in Register Google Sheet"""
-    try:
-        result = service.spreadsheets().values().get(
-            spreadsheetId=REGISTER_SPREADSHEET_ID,
-            range=f"{REGISTER_SHEET_NAME}!A1:F1"
-        ).execute()
-
-        if "values" not in result or len(result["values"]) == 0:
-            headers = [["S.No", "Username", "Email", "Password","mobile number", "Registered Time"]]
-            service.spreadsheets().values().update(
-                spreadsheetId=REGISTER_SPREADSHEET_ID,
-                range=f"{REGISTER_SHEET_NAME}!A1:F1",
-                valueInputOption="RAW",
-                body={"values": headers}
-            ).execute()
-            print("✅ Register headers created successfully.")
-        else:
-            print("ℹ️ Register headers already exist.")
-    except Exception as e:
-        print("⚠️ Error setting up Register headers:", e)
-
-
 def check_email_exists(email: str) -> bool:
-    """Check if email already exists in Register Google Sheet"""
-    try:
-        result = service.spreadsheets().values().get(
-            spreadsheetId=REGISTER_SPREADSHEET_ID,
-            range=f"{REGISTER_SHEET_NAME}!C2:C"
-        ).execute()
-        existing_emails = result.get("values", [])
-        return any(email.lower() == row[0].lower() for row in existing_emails)
-    except Exception as e:
-        print("⚠️ Error checking email:", e)
-        return False
-
-
-def get_next_sno() -> int:
-    """Get next serial number based on existing rows"""
-    try:
-        result = service.spreadsheets().values().get(
-            spreadsheetId=REGISTER_SPREADSHEET_ID,
-            range=f"{REGISTER_SHEET_NAME}!A2:A"
-        ).execute()
-        rows = result.get("values", [])
-        return len(rows) + 1
-    except Exception as e:
-        print("⚠️ Error getting next S.No:", e)
-        return 1
+    """Check if email is already registered"""
+    return storage.get_user(email) is not None
 
 
 def add_register_data(username: str, email: str, password: str,mobile_number: str):
-    """Append a new registration record to Google Sheet"""
-    sno = get_next_sno()
-    registered_time = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-
-    values = [[sno, username, email, password,mobile_number, registered_time]]
-
-    service.spreadsheets().values().append(
-        spreadsheetId=REGISTER_SPREADSHEET_ID,
-        range=f"{REGISTER_SHEET_NAME}!A:F",
-        valueInputOption="RAW",
-        insertDataOption="INSERT_ROWS",
-        body={"values": values}
-    ).execute()
-    print(f"✅ Registered {email} added.")
+    """Store a new registration record"""
+    storage.add("register", {
+        "username": username,
+        "email": email,
+        "password": password,
+        "mobile_number": mobile_number,
+        "registered_time": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+    })
+    print(f"✅ Registered {email}.")
+    return True
 
 
-def send_thankyou_mail(email, username):
+def send_thankyou_mail(email, username, note=""):
     try:
         subject = "Registration Successful"
         body = f"""
@@ -687,7 +1047,7 @@ def send_thankyou_mail(email, username):
 
         ✅ Thank you for registering with us!
         We're excited to have you on board.
-
+        {note}
         Regards,
         Zoona Portal Team
         """
@@ -698,17 +1058,12 @@ def send_thankyou_mail(email, username):
         msg["Subject"] = subject
         msg.attach(MIMEText(body, "plain"))
 
-        server = smtplib.SMTP(SMTP_SERVER, SMTP_PORT)
-        server.starttls()
-        server.login(USERNAME, PASSWORD)
-        server.send_message(msg)
-        server.quit()
-
-        print(f"📧 Thank-you email sent to {email}")
-        return True
+        message_id = mail_queue.enqueue(USERNAME, email, msg)
+        print(f"📧 Thank-you email queued for {email}")
+        return message_id
     except Exception as e:
         print("❌ Error sending email:", e)
-        return False
+        return None
 
 
 # ==============================
@@ -730,22 +1085,23 @@ async def register_user(
     username = email.split("@")[0]
 
     # Check if email already exists
-    if check_email_exists(email):
+    if await sheets_io.run(check_email_exists, email):
         raise HTTPException(status_code=400, detail="You are already registered with us, please log in")
 
-    # Add data into Google Sheet (existing code)
-    add_register_data(username, email, password, moblie_number)
-
-    # Send thank you email (existing code)
-    send_thankyou_mail(email, username)
-
-    # ------------------- NEW ADDITION -------------------
-    # Record login history automatically after registration
+    # Store the user, then welcome them and record the automatic login at the same time
     login_time = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-    append_login_history(username, email, login_time)  # existing function
+    outcomes = await fan_out([
+        Step("register", sheets_io, add_register_data, username, email, password, moblie_number),
+        Step("mail", mail_io, send_thankyou_mail, email, username, after=["register"]),
+        Step("login_history", sheets_io, append_login_history, username, email, login_time, after=["register"]),
+    ], timeout=STEP_TIMEOUT_SECONDS)
+
+    if not outcomes["register"].ok:
+        raise HTTPException(status_code=500, detail="Registration failed, please try again")
+    mail_id = outcomes["mail"].value
 
     # Create session for the new user automatically
-    session_id = create_session(username, email)  # existing function
+    session_id = await run_in_threadpool(create_session, username, email)  # SQLite write, kept off the event loop
 
     # ✅ Set cookie so /me can detect user
     response.set_cookie(
@@ -761,33 +1117,105 @@ async def register_user(
         "username": username,
         "email": email,
         "login_time": login_time,
-        "session_id": session_id
+        "session_id": session_id,
+        "mail_id": mail_id
     }
 
 
+# ==============================
+# Bulk Registration Import
+# ==============================
+# Running imports; they finish even if the admin's connection drops
+import_jobs = set()
+
+IMPORTED_PASSWORD_NOTE = """
+        Your account was created for you. Use "Forgot password" on the login page to choose your password.
+"""
 
 
-def setup_payment_sheet():
-    """Ensure headers exist in Payment Google Sheet"""
+async def run_registration_import(rows: list, send_welcome: bool, report):
+    """Register every new user from an import, calling ``report(event)`` as it goes"""
     try:
-        result = service.spreadsheets().values().get(
-            spreadsheetId=PAYMENT_EXCEL_ID,
-            range=f"{PAYMENT_EXCEL_NAME}!A1:E1"
-        ).execute()
-
-        if 'values' not in result or len(result['values']) == 0:
-            headers = [["S.No", "MailId", "SelectedProject", "Amount", "PaymentTime"]]
-            service.spreadsheets().values().update(
-                spreadsheetId=PAYMENT_EXCEL_ID,
-                range=f"{PAYMENT_EXCEL_NAME}!A1:E1",
-                valueInputOption="RAW",
-                body={"values": headers}
-            ).execute()
-            print("✅ Payment sheet headers created successfully.")
-        else:
-            print("payment headers are already created")
+        report({"phase": "parsed", "rows": len(rows)})
+
+        # One read of the register email column, then one pass over the file
+        registered = await sheets_io.run(storage.registered_emails)
+        to_create, results = plan_registrations(rows, registered)
+        report({"phase": "checked", "new": len(to_create), "skipped": len(rows) - len(to_create)})
+
+        registered_time = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        records = [{"username": row["username"], "email": row["email"], "password": row["password"],
+                    "mobile_number": row["mobile_number"], "registered_time": registered_time}
+                   for row, _ in to_create]
+        stored = await sheets_io.run(storage.add_many, "register", records)
+        created = []
+        for (row, result), record in zip(to_create, stored):
+            if record is None:
+                result["status"] = "exists"
+                continue
+            result.update(status="created", sno=record["sno"], username=record["username"])
+            created.append((row, result))
+        print(f"✅ Imported {len(created)} registrations.")
+        report({"phase": "stored", "created": len(created)})
+
+        if send_welcome:
+            # Queued in chunks; the mail workers deliver them over their pooled SMTP sessions
+            for start in range(0, len(created), 100):
+                chunk = created[start:start + 100]
+
+                def queue_mails():
+                    for row, result in chunk:
+                        note = IMPORTED_PASSWORD_NOTE if row["password_generated"] else ""
+                        result["mail_id"] = send_thankyou_mail(row["email"], row["username"], note)
+
+                await mail_io.run(queue_mails)
+                report({"phase": "mailing", "queued": start + len(chunk), "total": len(created)})
+
+        for result in results:
+            report(result)
+        counts = {}
+        for result in results:
+            counts[result["status"]] = counts.get(result["status"], 0) + 1
+        report({"phase": "done", **counts})
     except Exception as e:
-        print("⚠️ Error setting up payment headers:", e)
+        print("❌ Registration import failed:", e)
+        report({"phase": "failed", "detail": str(e)})
+    finally:
+        report(None)
+
+
+@app.post("/admin/import/register")
+async def import_registrations(request: Request, file: UploadFile = File(...), send_welcome: bool = Form(True)):
+    """Register every user in a CSV (email, username, mobile_number, password columns).
+
+    Streams NDJSON: progress events with a "phase", then one result per row
+    (created, exists, duplicate or invalid) and a final "done" summary.
+    """
+    require_admin(request)
+    data = await file.read(IMPORT_MAX_BYTES + 1)
+    if len(data) > IMPORT_MAX_BYTES:
+        raise HTTPException(status_code=413, detail="File too large")
+    try:
+        rows = parse_registrations(data, IMPORT_MAX_ROWS)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    events = asyncio.Queue()
+    job = asyncio.create_task(run_registration_import(rows, send_welcome, events.put_nowait))
+    import_jobs.add(job)
+    job.add_done_callback(import_jobs.discard)
+
+    async def progress():
+        while True:
+            event = await events.get()
+            if event is None:
+                return
+            yield json.dumps(event) + "\n"
+
+    return StreamingResponse(progress(), media_type="application/x-ndjson")
+
+
+
 
 # ---------- Input Model ----------
 class PaymentRequest(BaseModel):
@@ -800,7 +1228,6 @@ class PaymentRequest(BaseModel):
 # ---------- Helper: Send Email ----------
 def send_email(to_email, subject, body):
 
-
     msg = MIMEMultipart()
     msg["From"] = f"Zoona Technologies <{USERNAME}>"
     msg["To"] = to_email
@@ -809,19 +1236,27 @@ def send_email(to_email, subject, body):
     msg.attach(MIMEText(body, "html"))
 
     try:
-        server = smtplib.SMTP(SMTP_SERVER, SMTP_PORT)
-        server.starttls()
-        server.login(USERNAME, PASSWORD)
-        server.sendmail(msg["From"], [to_email], msg.as_string())
-        server.quit()
-        print(f"📧 Mail sent to {to_email}")
+        message_id = mail_queue.enqueue(USERNAME, [to_email], msg.as_string())
+        print(f"📧 Mail queued for {to_email}")
+        return message_id
     except Exception as e:
         print("⚠️ Mail error:", e)
+        return None
 
 # ---------- Payment API ----------
+def store_payment(email: str, project: str, amount: float, payment_time: str):
+    """Store a payment record and add it to the revenue totals"""
+    payment = storage.add("payment", {"email": email, "project": project, "amount": amount, "payment_time": payment_time})
+    try:
+        stats.add_payment(payment)
+    except Exception as e:
+        print("⚠️ Error updating payment stats:", e)
+    return payment
+
+
 @app.post("/pay")
-def make_payment(request: Request, data: PaymentRequest):
-    user = get_current_user(request)
+async def make_payment(request: Request, data: PaymentRequest):
+    user = await run_in_threadpool(get_current_user, request)
     if not user:
         raise HTTPException(status_code=401, detail="User not logged in")
 
@@ -830,23 +1265,6 @@ def make_payment(request: Request, data: PaymentRequest):
     amount = data.Amount
     payment_time = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
 
-    # Fetch existing rows to calculate S.No
-    sheet_data = service.spreadsheets().values().get(
-        spreadsheetId=PAYMENT_EXCEL_ID,
-        range=f"{PAYMENT_EXCEL_NAME}!A2:A"
-    ).execute()
-
-    sno = len(sheet_data.get("values", [])) + 1
-
-    # Append new payment record
-    new_row = [[sno, email, project, amount, payment_time]]
-    service.spreadsheets().values().append(
-        spreadsheetId=PAYMENT_EXCEL_ID,
-        range=PAYMENT_EXCEL_NAME,
-        valueInputOption="USER_ENTERED",
-        body={"values": new_row}
-    ).execute()
-
     # --------- Admin Mail ---------
     admin_body = f"""
     <html>
@@ -863,7 +1281,13 @@ def make_payment(request: Request, data: PaymentRequest):
     </body>
     </html>
     """
-    send_email(USERNAME, "🔔 New Payment Notification - Zoona Technologies", admin_body)
+
+    def send_admin_mail():
+        if "payment" in ADMIN_DIGEST_EVENTS:
+            return admin_digest.add("payment", "🔔 New Payment", {
+                "Email": email, "Project": project, "Amount": amount, "Payment Time": payment_time,
+            })
+        return send_email(USERNAME, "🔔 New Payment Notification - Zoona Technologies", admin_body)
 
     # --------- Thank-you Mail to User ---------
     user_body = f"""
@@ -880,9 +1304,24 @@ def make_payment(request: Request, data: PaymentRequest):
     </body>
     </html>
     """
-    send_email(email, "✅ Payment Confirmation - Zoona Technologies", user_body)
 
-    return {"status": "success", "message": "Payment recorded and emails sent."}
+    # Both mails go out together once the payment is stored
+    outcomes = await fan_out([
+        Step("payment", sheets_io, store_payment, email, project, amount, payment_time),
+        Step("admin_mail", mail_io, send_admin_mail, after=["payment"]),
+        Step("user_mail", mail_io, send_email, email, "✅ Payment Confirmation - Zoona Technologies", user_body,
+             after=["payment"]),
+    ], timeout=STEP_TIMEOUT_SECONDS)
+
+    if not outcomes["payment"].ok:
+        raise HTTPException(status_code=500, detail="Failed to record payment")
+
+    return {
+        "status": "success",
+        "message": "Payment recorded and emails queued.",
+        "mail_ids": [outcomes["admin_mail"].value, outcomes["user_mail"].value]
+    }
+
 
 
 
@@ -894,8 +1333,15 @@ def make_payment(request: Request, data: PaymentRequest):
 
 
 
+OTP_BACKEND = os.getenv("OTP_BACKEND", SESSION_BACKEND)                 # "sqlite" (shared) or "memory"
+OTP_TTL_SECONDS = int(os.getenv("OTP_TTL_SECONDS", 120))
+OTP_VERIFIED_TTL_SECONDS = int(os.getenv("OTP_VERIFIED_TTL_SECONDS", 600))  # time allowed to reset after verifying
+OTP_SWEEP_SECONDS = int(os.getenv("OTP_SWEEP_SECONDS", 30))
 
-otp_store = {}  # {email: {otp, expires, verified}}
+if OTP_BACKEND == "memory":
+    otp_store = MemoryOTPStore(verified_ttl=OTP_VERIFIED_TTL_SECONDS)
+else:
+    otp_store = SQLiteOTPStore(state_path("otp.db"), verified_ttl=OTP_VERIFIED_TTL_SECONDS)
 
 # ------------------ STEP 1: REQUEST OTP -------------------
 @app.post("/forgot-password")
@@ -907,23 +1353,16 @@ async def forgot_password(request: Request):
     if not email:
         return {"status": "error", "message": "Email is required"}
 
-    # Check email exists in register sheet
-    result = service.spreadsheets().values().get(
-        spreadsheetId=REGISTER_SPREADSHEET_ID,
-        range=f"{REGISTER_SHEET_NAME}!A2:F"
-    ).execute()
-    rows = result.get("values", [])
-
-    email_found = any(len(row) > 2 and row[2] == email for row in rows)
-    if not email_found:
+    # Check email exists in register directory
+    if not await sheets_io.run(check_email_exists, email):
         return {"status": "error", "message": "Email not registered"}
 
     # Generate OTP
     otp = str(random.randint(100000, 999999))
-    expiry_time = datetime.now() + timedelta(minutes=2)
-    otp_store[email] = {"otp": otp, "expires": expiry_time, "verified": False}
+    while not await run_in_threadpool(otp_store.issue, email, otp, OTP_TTL_SECONDS):
+        otp = str(random.randint(100000, 999999))  # OTP already in use by another email
 
-    if send_otp_email(email, otp):
+    if await mail_io.run(send_otp_email, email, otp):
         return {"status": "success", "message": f"OTP sent to {email}"}
     else:
         return {"status": "error", "message": "Failed to send OTP"}
@@ -931,83 +1370,56 @@ async def forgot_password(request: Request):
 
 # ------------------ STEP 2: VERIFY OTP -------------------
 @app.post("/verify-forgot-password")
-async def verify_forgot_password(request: Request):
+async def verify_forgot_password(request: Request, response: Response):
     """Verify OTP before allowing password reset"""
     form = await request.form()
     otp = form.get("otp")
     if not otp:
         return {"status": "error", "message": "OTP is required"}
 
-    # Find which email this OTP belongs to
-    email = None
-    for e, data in otp_store.items():
-        if data["otp"] == otp:
-            email = e
-            break
+    # Find which email this OTP belongs to and mark it verified
+    status, email, reset_token = await run_in_threadpool(otp_store.verify, otp)
 
-    if not email:
+    if status == "invalid":
         return {"status": "error", "message": "Invalid OTP or no request found"}
 
-    stored_data = otp_store[email]
-    if datetime.now() > stored_data["expires"]:
-        del otp_store[email]
+    if status == "expired":
         return {"status": "error", "message": "OTP expired. Please request again."}
 
-    # Mark email as verified
-    otp_store[email]["verified"] = True
-    return {"status": "success", "message": f"OTP verified for {email}. You can now reset password.", "email": email}
+    # The reset is bound to this email and token; browsers get them as cookies
+    for key, value in (("reset_email", email), ("reset_token", reset_token)):
+        response.set_cookie(key=key, value=value, max_age=OTP_VERIFIED_TTL_SECONDS, httponly=True, samesite="Lax")
+    return {"status": "success", "message": f"OTP verified for {email}. You can now reset password.",
+            "email": email, "reset_token": reset_token}
 
 
 # ------------------ STEP 3: RESET PASSWORD -------------------
 @app.post("/reset-password")
-async def reset_password(request: Request):
+async def reset_password(request: Request, response: Response):
     """Update password in Google Sheet after OTP verified"""
     form = await request.form()
     new_password = form.get("new_password")
     if not new_password:
         return {"status": "error", "message": "New password is required"}
 
-    # Find verified email
-    email = None
-    for e, data in otp_store.items():
-        if data.get("verified"):
-            email = e
-            break
-
-    if not email:
+    # The email and token handed out by /verify-forgot-password, as form fields or cookies
+    email = form.get("email") or request.cookies.get("reset_email")
+    reset_token = form.get("reset_token") or request.cookies.get("reset_token")
+    if not email or not await run_in_threadpool(otp_store.verified_email, email, reset_token):
         return {"status": "error", "message": "No verified email found. Verify OTP first."}
 
     try:
-        # Get all rows
-        result = service.spreadsheets().values().get(
-            spreadsheetId=REGISTER_SPREADSHEET_ID,
-            range=f"{REGISTER_SHEET_NAME}!A2:F"
-        ).execute()
-        rows = result.get("values", [])
-
-        row_index = 2
-        email_found = False
-        for row in rows:
-            if len(row) > 2 and row[2] == email:
-                email_found = True
-                break
-            row_index += 1
-
-        if not email_found:
+        if not await sheets_io.run(update_register_password, email, new_password):
             return {"status": "error", "message": "Email not registered"}
 
-        # Update password (Column D)
-        service.spreadsheets().values().update(
-            spreadsheetId=REGISTER_SPREADSHEET_ID,
-            range=f"{REGISTER_SHEET_NAME}!D{row_index}",
-            valueInputOption="RAW",
-            body={"values": [[new_password]]}
-        ).execute()
-
-        # Clean up OTP store
-        del otp_store[email]
+        # One reset per verified OTP
+        await run_in_threadpool(otp_store.consume_verified, email, reset_token)
+        response.delete_cookie("reset_email")
+        response.delete_cookie("reset_token")
         return {"status": "success", "message": "Password reset successful"}
 
+    except SheetsQuotaExhausted:
+        raise  # answered with 503 + Retry-After
     except Exception as e:
         return {"status": "error", "message": f"Error updating Google Sheet: {e}"}
 
@@ -1015,6 +1427,11 @@ async def reset_password(request: Request):
 
 
 
+def update_register_password(email: str, new_password: str) -> bool:
+    """Store a new password for a registered user"""
+    return storage.set_password(email, new_password)
+
+
 def send_otp_email(email: str, otp: str):
     try:
         subject = "Your OTP for Password Reset"
@@ -1026,11 +1443,7 @@ def send_otp_email(email: str, otp: str):
         msg["Subject"] = subject
         msg.attach(MIMEText(body, "plain"))
 
-        server = smtplib.SMTP(SMTP_SERVER, SMTP_PORT)
-        server.starttls()
-        server.login(USERNAME, PASSWORD)
-        server.send_message(msg)
-        server.quit()
+        smtp_pool.send_message(msg)
         return True
     except Exception as e:
         print("Error sending OTP email:", e)
@@ -0,0 +1,196 @@
+import contextvars
+import threading
+import time
+from contextlib import contextmanager
+
+
+# ==============================
+# Prometheus Metrics
+# ==============================
+# Metrics live in process memory, so with several uvicorn/gunicorn workers each
+# scrape of /metrics sees the worker that answered it.
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names, values, extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class Counter:
+    def __init__(self, name: str, help_text: str, labelnames=()):
+        self.name = name
+        self.help_text = help_text
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *labels, amount: float = 1.0):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0.0) + amount
+
+    def render(self):
+        yield f"# HELP {self.name} {self.help_text}"
+        yield f"# TYPE {self.name} counter"
+        with self._lock:
+            values = sorted(self._values.items())
+        for labels, value in values:
+            yield f"{self.name}{_labels(self.labelnames, labels)} {value}"
+
+
+class Histogram:
+    def __init__(self, name: str, help_text: str, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        self._series = {}  # {labels: [bucket counts..., sum, count]}
+        self._lock = threading.Lock()
+
+    def observe(self, seconds: float, *labels):
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [0] * len(self.buckets) + [0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if seconds <= bound:
+                    series[i] += 1
+            series[-2] += seconds
+            series[-1] += 1
+
+    def render(self):
+        yield f"# HELP {self.name} {self.help_text}"
+        yield f"# TYPE {self.name} histogram"
+        with self._lock:
+            series = sorted((labels, list(values)) for labels, values in self._series.items())
+        for labels, values in series:
+            for bound, count in zip(self.buckets + ("+Inf",), values[:-2] + [values[-1]]):
+                le = f'le="{bound}"'
+                yield f"{self.name}_bucket{_labels(self.labelnames, labels, le)} {count}"
+            yield f"{self.name}_sum{_labels(self.labelnames, labels)} {values[-2]}"
+            yield f"{self.name}_count{_labels(self.labelnames, labels)} {values[-1]}"
+
+
+class Gauge:
+    """Values read at scrape time from ``collect()``, which returns {labels: value}"""
+
+    def __init__(self, name: str, help_text: str, labelnames, collect):
+        self.name = name
+        self.help_text = help_text
+        self.labelnames = tuple(labelnames)
+        self.collect = collect
+
+    def render(self):
+        yield f"# HELP {self.name} {self.help_text}"
+        yield f"# TYPE {self.name} gauge"
+        try:
+            values = sorted(self.collect().items())
+        except Exception as e:
+            print(f"⚠️ Error collecting {self.name}:", e)
+            return
+        for labels, value in values:
+            yield f"{self.name}{_labels(self.labelnames, labels)} {value}"
+
+
+http_requests = Counter(
+    "http_requests_total", "HTTP requests by route and status", ("method", "route", "status"))
+http_request_duration = Histogram(
+    "http_request_duration_seconds", "HTTP request latency", ("method", "route"))
+downstream_calls = Counter(
+    "downstream_calls_total", "Calls to Google Sheets and SMTP",
+    ("system", "endpoint", "target", "operation", "outcome"))
+downstream_duration = Histogram(
+    "downstream_call_duration_seconds", "Latency of calls to Google Sheets and SMTP",
+    ("system", "endpoint", "target", "operation"))
+
+REGISTRY = [http_requests, http_request_duration, downstream_calls, downstream_duration]
+
+
+def render() -> str:
+    """All metrics in the Prometheus text exposition format"""
+    lines = []
+    for metric in REGISTRY:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+# ==============================
+# Per-request Attribution
+# ==============================
+class RequestTimings:
+    """Downstream time spent on behalf of one endpoint, summed per system"""
+
+    def __init__(self, endpoint: str, background: bool = False):
+        self.endpoint = endpoint
+        self.background = background  # queued work done after the request returned
+        self.totals = {}  # {system: [calls, seconds]}
+        self._lock = threading.Lock()
+
+    def add(self, system: str, seconds: float):
+        with self._lock:
+            total = self.totals.setdefault(system, [0, 0.0])
+            total[0] += 1
+            total[1] += seconds
+
+    def server_timing(self, total_seconds: float) -> str:
+        """Value for the Server-Timing response header"""
+        with self._lock:
+            totals = sorted(self.totals.items())
+        parts = [f'{system};dur={seconds * 1000:.1f};desc="{calls} calls"' for system, (calls, seconds) in totals]
+        parts.append(f"total;dur={total_seconds * 1000:.1f}")
+        return ", ".join(parts)
+
+
+# Set by the request middleware and copied into worker threads with the context
+current_request = contextvars.ContextVar("current_request", default=None)
+
+# Friendly names for spreadsheet ids in labels
+SPREADSHEET_LABELS = {}
+
+
+def label_spreadsheet(spreadsheet_id: str, name: str):
+    SPREADSHEET_LABELS[spreadsheet_id] = name
+
+
+def endpoint_label() -> str:
+    """The route being served, or 'background' outside a request"""
+    timings = current_request.get()
+    return timings.endpoint if timings else "background"
+
+
+@contextmanager
+def attributed_to(endpoint: str):
+    """Label downstream calls made by background work with the endpoint that queued it"""
+    token = current_request.set(RequestTimings(endpoint or "background", background=True))
+    try:
+        yield
+    finally:
+        current_request.reset(token)
+
+
+def observe_downstream(system: str, target: str, operation: str, seconds: float, ok: bool = True):
+    timings = current_request.get()
+    endpoint = timings.endpoint if timings else "background"
+    target = SPREADSHEET_LABELS.get(target, target)
+    downstream_calls.inc(system, endpoint, target, operation, "ok" if ok else "error")
+    downstream_duration.observe(seconds, system, endpoint, target, operation)
+    if timings:
+        timings.add(system, seconds)
+
+
+@contextmanager
+def timed_call(system: str, target: str, operation: str):
+    """Time the wrapped block as one downstream call"""
+    start = time.perf_counter()
+    ok = False
+    try:
+        yield
+        ok = True
+    finally:
+        observe_downstream(system, target, operation, time.perf_counter() - start, ok)
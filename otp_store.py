@@ -0,0 +1,213 @@
+import heapq
+import secrets
+import sqlite3
+import threading
+import time
+
+from state import SQLiteDB, run_periodically
+
+
+# ==============================
+# Password-reset OTP Stores
+# ==============================
+class OTPStore:
+    """One pending OTP per email, looked up by OTP value and evicted at its deadline.
+
+    After a successful ``verify`` the entry stays "verified" for
+    ``verified_ttl`` seconds so the user has time to submit a new password,
+    which needs the email together with the reset token handed out by
+    ``verify``.
+    """
+
+    def __init__(self, verified_ttl: float = 600):
+        self.verified_ttl = verified_ttl
+        self._sweeper = None
+
+    def issue(self, email: str, otp: str, ttl: float) -> bool:
+        """Store a new OTP for an email; False if another email already holds that OTP"""
+        raise NotImplementedError
+
+    def verify(self, otp: str):
+        """Return ("ok" | "expired" | "invalid", email, reset_token or None)"""
+        raise NotImplementedError
+
+    def verified_email(self, email: str, token: str):
+        """Return the email if its OTP was verified and ``token`` is its reset token, else None"""
+        raise NotImplementedError
+
+    def consume_verified(self, email: str, token: str) -> bool:
+        """Forget a verified OTP, once; False if ``email``/``token`` don't match a verified entry"""
+        raise NotImplementedError
+
+    def consume(self, email: str):
+        """Forget an email's OTP once the password has been reset"""
+        raise NotImplementedError
+
+    def sweep(self) -> int:
+        """Drop entries past their deadline, returning how many were removed"""
+        raise NotImplementedError
+
+    def start_sweeper(self, interval: float):
+        if not self._sweeper:
+            self._sweeper = run_periodically("otp-sweeper", interval, self.sweep)
+
+
+class MemoryOTPStore(OTPStore):
+    """Per-process store: dict indexes plus a min-heap of deadlines"""
+
+    def __init__(self, verified_ttl: float = 600):
+        super().__init__(verified_ttl)
+        self._lock = threading.Lock()
+        self._by_email = {}   # {email: {"otp", "expires", "token" once verified}}
+        self._by_otp = {}     # {otp: email}
+        self._deadlines = []  # [(expires, email, otp)] – stale entries skipped lazily
+
+    def _drop(self, email: str):
+        entry = self._by_email.pop(email, None)
+        if entry:
+            self._by_otp.pop(entry["otp"], None)
+
+    def _evict(self, now: float) -> int:
+        removed = 0
+        while self._deadlines and self._deadlines[0][0] <= now:
+            expires, email, otp = heapq.heappop(self._deadlines)
+            entry = self._by_email.get(email)
+            if entry and entry["otp"] == otp and entry["expires"] == expires:
+                self._drop(email)
+                removed += 1
+        return removed
+
+    def issue(self, email: str, otp: str, ttl: float) -> bool:
+        now = time.time()
+        with self._lock:
+            self._evict(now)
+            if self._by_otp.get(otp, email) != email:
+                return False
+            self._drop(email)
+            expires = now + ttl
+            self._by_email[email] = {"otp": otp, "expires": expires, "token": None}
+            self._by_otp[otp] = email
+            heapq.heappush(self._deadlines, (expires, email, otp))
+            return True
+
+    def verify(self, otp: str):
+        now = time.time()
+        with self._lock:
+            email = self._by_otp.get(otp)
+            if email is None:
+                return "invalid", None, None
+            entry = self._by_email[email]
+            if entry["expires"] <= now:
+                self._drop(email)
+                return "expired", email, None
+            entry["token"] = secrets.token_urlsafe(32)
+            entry["expires"] = now + self.verified_ttl
+            heapq.heappush(self._deadlines, (entry["expires"], email, otp))
+            return "ok", email, entry["token"]
+
+    def _verified_entry(self, email: str, token: str):
+        self._evict(time.time())
+        entry = self._by_email.get(email)
+        if entry and entry["token"] and token and secrets.compare_digest(entry["token"], token):
+            return entry
+        return None
+
+    def verified_email(self, email: str, token: str):
+        with self._lock:
+            return email if self._verified_entry(email, token) else None
+
+    def consume_verified(self, email: str, token: str) -> bool:
+        with self._lock:
+            if not self._verified_entry(email, token):
+                return False
+            self._drop(email)
+            return True
+
+    def consume(self, email: str):
+        with self._lock:
+            self._drop(email)
+
+    def sweep(self) -> int:
+        with self._lock:
+            return self._evict(time.time())
+
+
+class SQLiteOTPStore(OTPStore):
+    """OTPs in a WAL-mode SQLite file shared by every worker on the host.
+
+    The unique index on ``otp`` is the reverse index, reset lookups go by
+    the ``email`` key and the ``expires_at`` index drives eviction.
+    """
+
+    SCHEMA = """
+    CREATE TABLE IF NOT EXISTS otps (
+        email TEXT PRIMARY KEY,
+        otp TEXT NOT NULL UNIQUE,
+        expires_at REAL NOT NULL,
+        verified INTEGER NOT NULL DEFAULT 0,
+        reset_token TEXT
+    );
+    CREATE INDEX IF NOT EXISTS otps_expires_at ON otps (expires_at);
+    """
+
+    def __init__(self, path: str, verified_ttl: float = 600):
+        super().__init__(verified_ttl)
+        self.db = SQLiteDB(path, self.SCHEMA)
+        # Files created before resets were bound to a token
+        columns = [row[1] for row in self.db.execute("PRAGMA table_info(otps)").fetchall()]
+        if "reset_token" not in columns:
+            self.db.execute("ALTER TABLE otps ADD COLUMN reset_token TEXT")
+
+    def issue(self, email: str, otp: str, ttl: float) -> bool:
+        now = time.time()
+        self.sweep()
+        try:
+            # Upsert on email only, so a clash on the otp column raises instead of replacing
+            self.db.execute(
+                "INSERT INTO otps (email, otp, expires_at, verified) VALUES (?, ?, ?, 0) "
+                "ON CONFLICT (email) DO UPDATE SET otp = excluded.otp, "
+                "expires_at = excluded.expires_at, verified = 0, reset_token = NULL",
+                (email, otp, now + ttl),
+            )
+        except sqlite3.IntegrityError:
+            return False  # OTP value already held by another email
+        return True
+
+    def verify(self, otp: str):
+        now = time.time()
+        row = self.db.execute("SELECT email, expires_at FROM otps WHERE otp = ?", (otp,)).fetchone()
+        if row is None:
+            return "invalid", None, None
+        email, expires_at = row
+        if expires_at <= now:
+            self.consume(email)
+            return "expired", email, None
+        token = secrets.token_urlsafe(32)
+        self.db.execute(
+            "UPDATE otps SET verified = 1, reset_token = ?, expires_at = ? WHERE email = ?",
+            (token, now + self.verified_ttl, email),
+        )
+        return "ok", email, token
+
+    def verified_email(self, email: str, token: str):
+        row = self.db.execute(
+            "SELECT reset_token FROM otps WHERE email = ? AND verified = 1 AND expires_at > ?",
+            (email, time.time()),
+        ).fetchone()
+        if row and row[0] and token and secrets.compare_digest(row[0], token):
+            return email
+        return None
+
+    def consume_verified(self, email: str, token: str) -> bool:
+        if not self.verified_email(email, token):
+            return False
+        # The token in the WHERE clause makes this one-shot across workers
+        return self.db.execute(
+            "DELETE FROM otps WHERE email = ? AND reset_token = ?", (email, token)
+        ).rowcount == 1
+
+    def consume(self, email: str):
+        self.db.execute("DELETE FROM otps WHERE email = ?", (email,))
+
+    def sweep(self) -> int:
+        return self.db.execute("DELETE FROM otps WHERE expires_at <= ?", (time.time(),)).rowcount
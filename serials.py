@@ -0,0 +1,118 @@
+import json
+import os
+import threading
+import time
+
+from state import file_lock, state_path
+
+
+# ==============================
+# Serial Number Allocator
+# ==============================
+class SerialAllocator:
+    """Hand out "S.No" values per sheet without reading the sheet on every insert.
+
+    The next number for each sheet lives in a small counter file under
+    STATE_DIR, guarded by a file lock so every gunicorn worker on the host
+    draws from the same sequence. The counter is seeded from the sheet's
+    row count and re-checked every ``resync_seconds``; rows added to the
+    sheet by hand move the counter forward, numbers are never reused. If
+    a re-check fails the local counter keeps being used and the sheet is
+    tried again after ``retry_seconds``.
+    """
+
+    def __init__(self, get_service, resync_seconds=600, retry_seconds=60):
+        self.get_service = get_service
+        self.resync_seconds = resync_seconds
+        self.retry_seconds = retry_seconds
+        self._sheets = {}  # {name: (spreadsheet_id, sheet_name)}
+        self._lock = threading.Lock()
+        self._seed_locks = {}  # {name: Lock}, so only one thread re-syncs a counter at a time
+        self._retry_at = {}  # {name: monotonic time of the next re-sync attempt after a failure}
+
+    def register(self, name: str, spreadsheet_id: str, sheet_name: str):
+        self._sheets[name] = (spreadsheet_id, sheet_name)
+        self._seed_locks[name] = threading.Lock()
+
+    def _path(self, name: str) -> str:
+        return state_path(f"serial-{name}.json")
+
+    def _sheet_next(self, name: str) -> int:
+        spreadsheet_id, sheet_name = self._sheets[name]
+        result = self.get_service().spreadsheets().values().get(
+            spreadsheetId=spreadsheet_id,
+            range=f"{sheet_name}!A2:A"
+        ).execute()
+        return len(result.get("values", [])) + 1
+
+    @staticmethod
+    def _read(path: str):
+        try:
+            with open(path) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    @staticmethod
+    def _write(path: str, state: dict):
+        tmp = f"{path}.{os.getpid()}.tmp"
+        with open(tmp, "w") as f:
+            json.dump(state, f)
+        os.replace(tmp, path)
+
+    def seed(self, name: str):
+        """Sync one counter with its sheet (called at startup and on resync)"""
+        path = self._path(name)
+        sheet_next = self._sheet_next(name)
+        with self._lock, file_lock(path):
+            state = self._read(path) or {"next": 1}
+            state["next"] = max(state["next"], sheet_next)
+            state["synced_at"] = time.time()
+            self._write(path, state)
+
+    def seed_all(self):
+        for name in self._sheets:
+            try:
+                self.seed(name)
+            except Exception as e:
+                print(f"⚠️ Error seeding serial counter '{name}':", e)
+
+    def peek(self, name: str) -> int:
+        """Return the number the next allocation would get, without allocating it"""
+        state = self._read(self._path(name))
+        return state["next"] if state else self._sheet_next(name)
+
+    def next(self, name: str) -> int:
+        """Atomically allocate the next serial number for a sheet"""
+        return self.next_block(name, 1)
+
+    def _is_fresh(self, state) -> bool:
+        return state is not None and time.time() - state.get("synced_at", 0) <= self.resync_seconds
+
+    def _resync_if_stale(self, name: str, path: str):
+        if self._is_fresh(self._read(path)):
+            return
+        with self._seed_locks[name]:
+            # Another thread may have re-synced while this one waited
+            state = self._read(path)
+            if self._is_fresh(state) or state is not None and time.monotonic() < self._retry_at.get(name, 0):
+                return
+            try:
+                self.seed(name)
+            except Exception as e:
+                if state is None:
+                    raise  # no local counter to fall back on
+                self._retry_at[name] = time.monotonic() + self.retry_seconds
+                print(f"⚠️ Error re-syncing serial counter '{name}', continuing from the local counter:", e)
+
+    def next_block(self, name: str, count: int) -> int:
+        """Atomically allocate ``count`` consecutive serial numbers; returns the first"""
+        path = self._path(name)
+        self._resync_if_stale(name, path)
+
+        with self._lock, file_lock(path):
+            state = self._read(path)
+            sno = state["next"]
+            state["next"] = sno + count
+            self._write(path, state)
+        return sno
@@ -0,0 +1,135 @@
+import json
+import secrets
+import threading
+import time
+from collections import OrderedDict
+
+from state import SQLiteDB, run_periodically
+
+
+# ==============================
+# Session Stores
+# ==============================
+class SessionStore:
+    """Sessions keyed by an opaque id, with sliding expiry after ``ttl`` seconds idle"""
+
+    def __init__(self, ttl: float):
+        self.ttl = ttl
+        self._sweeper = None
+
+    def create(self, data: dict) -> str:
+        session_id = secrets.token_hex(16)
+        self.put(session_id, data)
+        return session_id
+
+    def put(self, session_id: str, data: dict):
+        raise NotImplementedError
+
+    def get(self, session_id: str):
+        raise NotImplementedError
+
+    def delete(self, session_id: str):
+        raise NotImplementedError
+
+    def sweep(self) -> int:
+        """Drop expired sessions, returning how many were removed"""
+        raise NotImplementedError
+
+    def start_sweeper(self, interval: float):
+        """Sweep expired sessions every ``interval`` seconds in a daemon thread"""
+        if not self._sweeper:
+            self._sweeper = run_periodically("session-sweeper", interval, self.sweep)
+
+
+class MemorySessionStore(SessionStore):
+    """Per-process LRU of at most ``max_sessions`` sessions, least recently used first"""
+
+    def __init__(self, ttl: float, max_sessions: int = 10000):
+        super().__init__(ttl)
+        self.max_sessions = max_sessions
+        self._lock = threading.Lock()
+        self._sessions = OrderedDict()  # {session_id: (expires_at, data)}
+
+    def put(self, session_id: str, data: dict):
+        with self._lock:
+            self._sessions[session_id] = (time.monotonic() + self.ttl, data)
+            self._sessions.move_to_end(session_id)
+            while len(self._sessions) > self.max_sessions:
+                self._sessions.popitem(last=False)
+
+    def get(self, session_id: str):
+        with self._lock:
+            entry = self._sessions.get(session_id)
+            if entry is None:
+                return None
+            expires_at, data = entry
+            if expires_at < time.monotonic():
+                del self._sessions[session_id]
+                return None
+            # sliding expiry – touching a session moves it to the back of the LRU
+            self._sessions[session_id] = (time.monotonic() + self.ttl, data)
+            self._sessions.move_to_end(session_id)
+            return data
+
+    def delete(self, session_id: str):
+        with self._lock:
+            self._sessions.pop(session_id, None)
+
+    def sweep(self) -> int:
+        # With a fixed TTL the least recently used session always expires first
+        removed = 0
+        now = time.monotonic()
+        with self._lock:
+            while self._sessions:
+                session_id, (expires_at, _) = next(iter(self._sessions.items()))
+                if expires_at >= now:
+                    break
+                del self._sessions[session_id]
+                removed += 1
+        return removed
+
+
+class SQLiteSessionStore(SessionStore):
+    """Sessions in a WAL-mode SQLite file shared by every worker on the host"""
+
+    SCHEMA = """
+    CREATE TABLE IF NOT EXISTS sessions (
+        id TEXT PRIMARY KEY,
+        data TEXT NOT NULL,
+        expires_at REAL NOT NULL
+    );
+    CREATE INDEX IF NOT EXISTS sessions_expires_at ON sessions (expires_at);
+    """
+
+    def __init__(self, path: str, ttl: float, touch_interval: float = 60.0):
+        super().__init__(ttl)
+        # Sliding expiry is written back at most once per touch_interval to keep reads cheap
+        self.touch_interval = min(touch_interval, ttl / 2)
+        self.db = SQLiteDB(path, self.SCHEMA)
+
+    def put(self, session_id: str, data: dict):
+        self.db.execute(
+            "INSERT OR REPLACE INTO sessions (id, data, expires_at) VALUES (?, ?, ?)",
+            (session_id, json.dumps(data), time.time() + self.ttl),
+        )
+
+    def get(self, session_id: str):
+        row = self.db.execute(
+            "SELECT data, expires_at FROM sessions WHERE id = ?", (session_id,)
+        ).fetchone()
+        if row is None:
+            return None
+        data, expires_at = row
+        now = time.time()
+        if expires_at < now:
+            self.delete(session_id)
+            return None
+        if expires_at - now < self.ttl - self.touch_interval:
+            self.db.execute("UPDATE sessions SET expires_at = ? WHERE id = ?", (now + self.ttl, session_id))
+        return json.loads(data)
+
+    def delete(self, session_id: str):
+        self.db.execute("DELETE FROM sessions WHERE id = ?", (session_id,))
+
+    def sweep(self) -> int:
+        return self.db.execute("DELETE FROM sessions WHERE expires_at < ?", (time.time(),)).rowcount
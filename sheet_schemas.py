@@ -0,0 +1,106 @@
+import hashlib
+import json
+import os
+import time
+
+from state import file_lock
+
+
+# ==============================
+# Sheet Header Schemas
+# ==============================
+class SheetSchema:
+    def __init__(self, spreadsheet_id: str, sheet_name: str, headers: list):
+        self.spreadsheet_id = spreadsheet_id
+        self.sheet_name = sheet_name
+        self.headers = headers
+
+    @property
+    def header_range(self) -> str:
+        last_column = chr(ord("A") + len(self.headers) - 1)
+        return f"{self.sheet_name}!A1:{last_column}1"
+
+
+class SchemaRegistry:
+    """Declared header rows for every sheet, verified once per deployment.
+
+    ``ensure_all`` holds a file lock while it runs, so only one worker on the
+    host does the Sheets calls. It then writes a marker file. Other workers,
+    and restarts within ``ttl`` seconds, see the fresh marker and skip the
+    check. Header reads use one batchGet per spreadsheet and the missing
+    headers are written with one batchUpdate.
+    """
+
+    def __init__(self, get_service, marker_path: str, ttl: float, deployment_id: str = ""):
+        self.get_service = get_service
+        self.marker_path = marker_path
+        self.ttl = ttl
+        self.deployment_id = deployment_id
+        self.schemas = {}  # {name: SheetSchema}
+
+    def register(self, name: str, spreadsheet_id: str, sheet_name: str, headers: list):
+        self.schemas[name] = SheetSchema(spreadsheet_id, sheet_name, headers)
+
+    def fingerprint(self) -> str:
+        """Changes whenever a schema or the deployment changes, invalidating the marker"""
+        spec = {name: [s.spreadsheet_id, s.sheet_name, s.headers] for name, s in sorted(self.schemas.items())}
+        spec["deployment"] = self.deployment_id
+        return hashlib.sha256(json.dumps(spec, sort_keys=True).encode()).hexdigest()
+
+    def _marker_is_fresh(self) -> bool:
+        try:
+            with open(self.marker_path) as f:
+                marker = json.load(f)
+        except (OSError, ValueError):
+            return False
+        return marker.get("fingerprint") == self.fingerprint() and time.time() - marker.get("verified_at", 0) < self.ttl
+
+    def ensure_all(self):
+        """Create any missing header rows, unless another worker did so recently"""
+        with file_lock(self.marker_path):
+            if self._marker_is_fresh():
+                print("ℹ️ Sheet headers verified recently – skipping setup.")
+                return
+
+            by_spreadsheet = {}
+            for name, schema in self.schemas.items():
+                by_spreadsheet.setdefault(schema.spreadsheet_id, []).append((name, schema))
+
+            all_ok = True
+            for spreadsheet_id, schemas in by_spreadsheet.items():
+                try:
+                    self._ensure_spreadsheet(spreadsheet_id, schemas)
+                except Exception as e:
+                    all_ok = False
+                    print(f"⚠️ Error setting up headers for {', '.join(n for n, _ in schemas)}:", e)
+
+            if all_ok:
+                tmp = f"{self.marker_path}.{os.getpid()}.tmp"
+                with open(tmp, "w") as f:
+                    json.dump({"fingerprint": self.fingerprint(), "verified_at": time.time()}, f)
+                os.replace(tmp, self.marker_path)
+
+    def _ensure_spreadsheet(self, spreadsheet_id: str, schemas: list):
+        values = self.get_service().spreadsheets().values()
+        result = values.batchGet(
+            spreadsheetId=spreadsheet_id,
+            ranges=[schema.header_range for _, schema in schemas]
+        ).execute()
+
+        missing = []
+        for (name, schema), value_range in zip(schemas, result.get("valueRanges", [])):
+            if value_range.get("values"):
+                print(f"ℹ️ {name} headers already exist.")
+            else:
+                missing.append((name, schema))
+
+        if missing:
+            values.batchUpdate(
+                spreadsheetId=spreadsheet_id,
+                body={
+                    "valueInputOption": "RAW",
+                    "data": [{"range": schema.header_range, "values": [schema.headers]} for _, schema in missing],
+                }
+            ).execute()
+            for name, _ in missing:
+                print(f"✅ {name} headers created successfully.")
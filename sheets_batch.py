@@ -0,0 +1,185 @@
+import json
+import queue
+import re
+import threading
+import time
+from concurrent.futures import Future
+
+import metrics
+from sheets_quota import full_jitter_backoff, retry_after_of
+
+
+# ==============================
+# Write-behind Sheets Appends
+# ==============================
+class AppendCoalescer:
+    """Collect rows per spreadsheet/range and write them with a single append call.
+
+    Rows are flushed when the oldest queued row is ``flush_seconds`` old or when
+    ``max_rows`` rows are waiting for the same range. ``submit`` returns a Future
+    that resolves to the sheet row number the row was written to.
+
+    A failed append is retried after ``backoff(attempt, retry_after)``
+    seconds, during which that range is not written at all. Rows still
+    failing after ``max_attempts`` are logged and, with ``dead_letter_path``,
+    appended to that file as JSON lines so they can be written by hand.
+    """
+
+    def __init__(self, get_service, flush_seconds=0.5, max_rows=50, max_pending=1000,
+                 submit_timeout=5.0, max_attempts=3, backoff=None, dead_letter_path=None):
+        self.get_service = get_service
+        self.flush_seconds = flush_seconds
+        self.max_rows = max_rows
+        self.max_pending = max_pending
+        self.submit_timeout = submit_timeout
+        self.max_attempts = max_attempts
+        self.backoff = backoff or full_jitter_backoff
+        self.dead_letter_path = dead_letter_path
+
+        self._cond = threading.Condition()
+        self._buffers = {}  # {(spreadsheet_id, range, value_input_option, insert_data_option): [item, ...]}
+        self._retry_at = {}  # {key: monotonic time before which a failed range is not retried}
+        self._pending = 0
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, name="sheets-append", daemon=True)
+        self._thread.start()
+
+    def submit(self, spreadsheet_id: str, range_: str, row: list,
+               value_input_option: str = "RAW", insert_data_option: str = "INSERT_ROWS") -> Future:
+        """Queue a row for appending. Blocks while the queue is full, then raises queue.Full"""
+        future = Future()
+        key = (spreadsheet_id, range_, value_input_option, insert_data_option)
+        deadline = time.monotonic() + self.submit_timeout
+
+        with self._cond:
+            if self._closed:
+                raise RuntimeError("Append queue is closed")
+            while self._pending >= self.max_pending:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise queue.Full("Sheets append queue is full")
+                self._cond.wait(remaining)
+
+            self._buffers.setdefault(key, []).append(
+                {"row": row, "future": future, "queued_at": time.monotonic(), "attempts": 0,
+                 "endpoint": metrics.endpoint_label()}
+            )
+            self._pending += 1
+            self._cond.notify_all()
+        return future
+
+    def _due_keys(self, force: bool):
+        now = time.monotonic()
+        return [
+            key for key, items in self._buffers.items()
+            if items and (force or (self._retry_at.get(key, 0.0) <= now
+                                    and (len(items) >= self.max_rows
+                                         or now - items[0]["queued_at"] >= self.flush_seconds)))
+        ]
+
+    def _next_wait(self):
+        if not self._buffers:
+            return None
+        due_at = min(max(items[0]["queued_at"] + self.flush_seconds, self._retry_at.get(key, 0.0))
+                     for key, items in self._buffers.items() if items)
+        return max(0.0, due_at - time.monotonic())
+
+    def _run(self):
+        while True:
+            with self._cond:
+                due = self._due_keys(force=self._closed)
+                while not due:
+                    if self._closed:
+                        return
+                    self._cond.wait(self._next_wait())
+                    due = self._due_keys(force=self._closed)
+                batches = []
+                for key in due:
+                    items = self._buffers[key][:self.max_rows]
+                    del self._buffers[key][:self.max_rows]
+                    if not self._buffers[key]:
+                        del self._buffers[key]
+                    batches.append((key, items))
+
+            for key, items in batches:
+                self._write(key, items)
+
+    def _write(self, key, items):
+        spreadsheet_id, range_, value_input_option, insert_data_option = key
+        try:
+            # A range is normally written by one endpoint, so label the batch with the first row's
+            with metrics.attributed_to(items[0]["endpoint"]):
+                result = self.get_service().spreadsheets().values().append(
+                    spreadsheetId=spreadsheet_id,
+                    range=range_,
+                    valueInputOption=value_input_option,
+                    insertDataOption=insert_data_option,
+                    body={"values": [item["row"] for item in items]}
+                ).execute()
+        except Exception as e:
+            retry = [item for item in items if item["attempts"] + 1 < self.max_attempts]
+            failed = [item for item in items if item["attempts"] + 1 >= self.max_attempts]
+            delay = self.backoff(max(item["attempts"] for item in items), retry_after_of(e))
+            print(f"⚠️ Sheets batch append failed for {range_} ({len(items)} rows), "
+                  f"retrying {len(retry)} in {delay:.1f}s:", e)
+            with self._cond:
+                for item in retry:
+                    item["attempts"] += 1
+                if retry:
+                    self._buffers[key] = retry + self._buffers.get(key, [])
+                self._retry_at[key] = time.monotonic() + delay
+                self._pending -= len(failed)
+                self._cond.notify_all()
+            if failed:
+                self._dead_letter(key, failed, e)
+            for item in failed:
+                item["future"].set_exception(e)
+            return
+
+        first_row = row_from_range(result.get("updates", {}).get("updatedRange"))
+        with self._cond:
+            self._retry_at.pop(key, None)
+            self._pending -= len(items)
+            self._cond.notify_all()
+        for offset, item in enumerate(items):
+            item["future"].set_result(first_row + offset if first_row else None)
+
+    def _dead_letter(self, key, items, error):
+        """Log rows that are given up on and keep them in the dead-letter file"""
+        spreadsheet_id, range_, value_input_option, _ = key
+        print(f"❌ Dropping {len(items)} rows for {range_} after {self.max_attempts} attempts:",
+              [item["row"] for item in items])
+        if not self.dead_letter_path:
+            return
+        try:
+            with open(self.dead_letter_path, "a") as f:
+                for item in items:
+                    f.write(json.dumps({"at": time.time(), "spreadsheet_id": spreadsheet_id, "range": range_,
+                                        "value_input_option": value_input_option, "row": item["row"],
+                                        "error": str(error)}) + "\n")
+        except OSError as e:
+            print("⚠️ Could not write the Sheets dead-letter file:", e)
+
+    def flush(self, timeout: float = 30.0):
+        """Block until every queued row has been written (or failed)"""
+        deadline = time.monotonic() + timeout
+        with self._cond:
+            for items in self._buffers.values():
+                for item in items:
+                    item["queued_at"] = 0.0
+            self._cond.notify_all()
+            while self._pending and time.monotonic() < deadline:
+                self._cond.wait(deadline - time.monotonic())
+
+    def close(self, timeout: float = 30.0):
+        """Flush everything still queued and stop the writer thread"""
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+        self._thread.join(timeout)
+
+
+def row_from_range(a1_range: str):
+    """Return the first row number of an A1 range such as 'register!A12:F12'"""
+    match = re.search(r"![A-Z]+(\d+)", a1_range or "")
+    return int(match.group(1)) if match else None
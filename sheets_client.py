@@ -0,0 +1,204 @@
+import base64
+import json
+import os
+import re
+import threading
+from contextlib import contextmanager
+
+import metrics
+
+
+# ==============================
+# Lazy Google Sheets Client
+# ==============================
+SCOPES = ["https://www.googleapis.com/auth/spreadsheets"]
+
+# Optional path to a sheets.v4 discovery document; by default the copy shipped
+# inside google-api-python-client is used. The document is never fetched over HTTP.
+SHEETS_DISCOVERY_DOC = os.getenv("SHEETS_DISCOVERY_DOC")
+
+# Override the API host, e.g. to run against bench/fake_sheets.py
+SHEETS_API_ENDPOINT = os.getenv("SHEETS_API_ENDPOINT")
+
+
+def load_discovery_document() -> str:
+    if SHEETS_DISCOVERY_DOC:
+        with open(SHEETS_DISCOVERY_DOC) as f:
+            return f.read()
+
+    from googleapiclient.discovery_cache import get_static_doc
+    doc = get_static_doc("sheets", "v4")
+    if doc is None:
+        raise RuntimeError("sheets.v4 discovery document not found – set SHEETS_DISCOVERY_DOC")
+    return doc
+
+
+def credentials_from_env(var: str = "GOOGLE_CREDS"):
+    """Service-account credentials from a base64-encoded JSON key in an env var"""
+    if os.environ[var] == "anonymous":
+        # No auth at all – only useful against a local fake Sheets server
+        from google.auth.credentials import AnonymousCredentials
+        return AnonymousCredentials()
+
+    from google.oauth2.service_account import Credentials
+
+    # Decode Base64 to JSON string, then to dict
+    creds_dict = json.loads(base64.b64decode(os.environ[var]).decode("utf-8"))
+    return Credentials.from_service_account_info(creds_dict, scopes=SCOPES)
+
+
+SPREADSHEET_IN_URI_RE = re.compile(r"/spreadsheets/([^/?:]+)")
+
+
+class SharedTokenCredentials:
+    """Credentials shared by every pooled transport.
+
+    google-auth refreshes an expired token inside ``before_request``; with
+    many transports that would mean one token request per transport. Here
+    the first thread to find the token expired refreshes it under a lock and
+    the others wait for it and reuse the new token.
+    """
+
+    def __init__(self, credentials):
+        self.credentials = credentials
+        self._lock = threading.Lock()
+
+    def before_request(self, request, method, url, headers):
+        if not self.credentials.valid:
+            with self._lock:
+                # refreshes only if no other thread did while we waited
+                self.credentials.before_request(request, method, url, headers)
+                return
+        self.credentials.apply(headers)
+
+    def refresh(self, request):
+        # Called after a 401; skip it if another thread already replaced the token
+        stale_token = self.credentials.token
+        with self._lock:
+            if self.credentials.token == stale_token:
+                self.credentials.refresh(request)
+
+
+class TransportPool:
+    """Up to ``size`` authorized HTTP transports, each keeping its own connection alive.
+
+    httplib2 is not thread-safe, so a transport is used by one request at a
+    time: ``transport()`` checks one out (the most recently returned, whose
+    connection is least likely to have been closed) and puts it back after.
+    New transports are created on demand; when all ``size`` are busy callers
+    wait for one to come back.
+    """
+
+    def __init__(self, make_transport, size: int = 10):
+        self.make_transport = make_transport
+        self.size = size
+        self._idle = []  # LIFO stack of idle transports
+        self._created = 0
+        self._cond = threading.Condition()
+
+    @contextmanager
+    def transport(self):
+        with self._cond:
+            while not self._idle and self._created >= self.size:
+                self._cond.wait()
+            if self._idle:
+                http = self._idle.pop()
+            else:
+                self._created += 1
+                http = None
+        if http is None:
+            try:
+                http = self.make_transport()
+            except Exception:
+                with self._cond:
+                    self._created -= 1
+                    self._cond.notify()
+                raise
+        try:
+            yield http
+        finally:
+            with self._cond:
+                self._idle.append(http)
+                self._cond.notify()
+
+    def stats(self) -> dict:
+        with self._cond:
+            return {"size": self.size, "open": self._created, "idle": len(self._idle),
+                    "in_use": self._created - len(self._idle)}
+
+
+def instrumented_request_class(quota=None, pool=None):
+    """An HttpRequest subclass that records every execute() in the metrics module,
+    runs it through the read/write token buckets of a SheetsQuota (if given)
+    and sends it over a transport checked out of ``pool`` (if given)"""
+    from googleapiclient.http import HttpRequest
+
+    class InstrumentedHttpRequest(HttpRequest):
+        def execute(self, http=None, num_retries=0):
+            match = SPREADSHEET_IN_URI_RE.search(self.uri)
+            # "sheets.spreadsheets.values.get" -> "values.get"
+            operation = (self.methodId or self.method).split("spreadsheets.", 1)[-1]
+            parent = super(InstrumentedHttpRequest, self)
+
+            def execute_once():
+                if http is not None or pool is None:
+                    with metrics.timed_call("sheets", match.group(1) if match else "-", operation):
+                        return parent.execute(http=http, num_retries=num_retries)
+                with pool.transport() as pooled:
+                    with metrics.timed_call("sheets", match.group(1) if match else "-", operation):
+                        return parent.execute(http=pooled, num_retries=num_retries)
+
+            if quota is None:
+                return execute_once()
+            kind = "read" if self.method == "GET" else "write"
+            return quota.call(kind, execute_once, idempotent=not operation.endswith("append"))
+
+    return InstrumentedHttpRequest
+
+
+class LazySheetsService:
+    """Drop-in for the Sheets ``Resource`` that is only built on first use.
+
+    Importing googleapiclient, decoding the credentials and parsing the
+    discovery document all happen on the first ``spreadsheets()`` call
+    instead of at import time, so workers boot and start serving faster.
+
+    One ``Resource`` builds the requests for every thread; each request is
+    sent over a transport from a TransportPool of ``pool_size`` keep-alive
+    connections, all sharing one OAuth token. Every request goes through
+    ``quota`` (a SheetsQuota) when one is given.
+    """
+
+    def __init__(self, get_credentials=credentials_from_env, quota=None, pool_size: int = 10,
+                 http_timeout: float = 60.0):
+        self.get_credentials = get_credentials
+        self.quota = quota
+        self.http_timeout = http_timeout
+        self.pool = TransportPool(self._make_transport, pool_size)
+        self._credentials = None
+        self._service = None
+        self._lock = threading.Lock()
+
+    def _make_transport(self):
+        import google_auth_httplib2
+        import httplib2
+        return google_auth_httplib2.AuthorizedHttp(self._credentials, http=httplib2.Http(timeout=self.http_timeout))
+
+    def _build(self):
+        from googleapiclient.discovery import build_from_document
+        self._credentials = SharedTokenCredentials(self.get_credentials())
+        client_options = {"api_endpoint": SHEETS_API_ENDPOINT} if SHEETS_API_ENDPOINT else None
+        # The resource's own http is never used: every execute() checks a transport out of the pool
+        return build_from_document(json.loads(load_discovery_document()), http=self._make_transport(),
+                                   client_options=client_options,
+                                   requestBuilder=instrumented_request_class(self.quota, self.pool))
+
+    def get(self):
+        if self._service is None:
+            with self._lock:
+                if self._service is None:
+                    self._service = self._build()
+        return self._service
+
+    def spreadsheets(self):
+        return self.get().spreadsheets()
@@ -0,0 +1,229 @@
+import json
+import os
+import random
+import threading
+import time
+
+import metrics
+from state import file_lock
+
+
+# ==============================
+# Sheets Quota Limiter
+# ==============================
+RETRYABLE_STATUSES = {429, 500, 502, 503, 504}
+
+
+class SheetsQuotaExhausted(Exception):
+    """Raised when a Sheets call could not get quota (or kept getting 429) in time"""
+
+    def __init__(self, kind: str, retry_after: float):
+        super().__init__(f"Google Sheets {kind} quota exhausted, retry in {retry_after:.1f}s")
+        self.kind = kind
+        self.retry_after = retry_after
+
+
+class SheetsQuota:
+    """Client-side token buckets for the Sheets read and write quotas.
+
+    Google counts requests per minute per project and per service account, so
+    the buckets live in one small state file shared by every worker on the
+    host. A bucket refills continuously at ``per_minute`` tokens a minute and
+    holds at most ``burst_seconds`` worth of them. Background work (write-behind appends, cache reloads,
+    resyncs) must leave ``reserve`` of the bucket untouched, so interactive
+    requests such as /login and /logout still find quota during a burst.
+
+    On a 429 the bucket's rate is halved and it pauses for the backoff delay;
+    every success wins back a little rate, so throughput settles just under
+    whatever Google actually allows.
+    """
+
+    def __init__(self, path: str, read_per_minute: int = 60, write_per_minute: int = 60,
+                 burst_seconds: float = 10.0, reserve: float = 0.25, max_wait: float = 10.0,
+                 background_max_wait: float = 60.0, max_attempts: int = 5,
+                 backoff_seconds: float = 1.0, max_backoff_seconds: float = 32.0):
+        self.path = path
+        self.per_minute = {"read": read_per_minute, "write": write_per_minute}
+        self.burst_seconds = burst_seconds
+        self.reserve = reserve
+        self.max_wait = max_wait
+        self.background_max_wait = background_max_wait
+        self.max_attempts = max_attempts
+        self.backoff_seconds = backoff_seconds
+        self.max_backoff_seconds = max_backoff_seconds
+        self._lock = threading.Lock()
+        self._slowed = set()  # kinds this worker has slowed down and not yet seen recover
+        self.counters = {"throttled_seconds": 0.0, "retries": 0, "rate_limited": 0, "exhausted": 0}
+
+    # ---------- shared bucket state ----------
+    def _capacity(self, kind: str) -> float:
+        return max(1.0, self.per_minute[kind] * self.burst_seconds / 60)
+
+    def _read(self) -> dict:
+        try:
+            with open(self.path) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def _write(self, state: dict):
+        tmp = f"{self.path}.{os.getpid()}.tmp"
+        with open(tmp, "w") as f:
+            json.dump(state, f)
+        os.replace(tmp, self.path)
+
+    def _bucket(self, state: dict, kind: str, now: float) -> dict:
+        """Return the bucket for ``kind`` refilled up to ``now``"""
+        bucket = state.setdefault(kind, {})
+        capacity = self._capacity(kind)
+        bucket.setdefault("tokens", capacity)
+        bucket.setdefault("scale", 1.0)
+        bucket.setdefault("paused_until", 0.0)
+        updated_at = bucket.get("updated_at", now)
+        rate = self.per_minute[kind] * bucket["scale"] / 60
+        bucket["tokens"] = min(capacity, bucket["tokens"] + max(0.0, now - updated_at) * rate)
+        bucket["updated_at"] = now
+        return bucket
+
+    def _update(self, kind: str, change):
+        """Apply ``change(bucket, now)`` to a bucket under the cross-process lock"""
+        with self._lock, file_lock(self.path):
+            state = self._read()
+            now = time.time()
+            bucket = self._bucket(state, kind, now)
+            result = change(bucket, now)
+            self._write(state)
+            return result
+
+    # ---------- callers ----------
+    @staticmethod
+    def interactive() -> bool:
+        """True while serving a request; queued and periodic work counts as background"""
+        timings = metrics.current_request.get()
+        return timings is not None and not timings.background
+
+    def acquire(self, kind: str):
+        """Take one token, waiting for the bucket to refill if needed"""
+        interactive = self.interactive()
+        floor = 0.0 if interactive else self._capacity(kind) * self.reserve
+        started = time.monotonic()
+        deadline = started + (self.max_wait if interactive else self.background_max_wait)
+
+        def take(bucket, now):
+            if now < bucket["paused_until"]:
+                return bucket["paused_until"] - now
+            if bucket["tokens"] - 1 >= floor:
+                bucket["tokens"] -= 1
+                return 0.0
+            rate = self.per_minute[kind] * bucket["scale"] / 60
+            return (floor + 1 - bucket["tokens"]) / rate
+
+        throttled = False
+        while True:
+            wait = self._update(kind, take)
+            if wait <= 0:
+                break
+            throttled = True
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                with self._lock:
+                    self.counters["exhausted"] += 1
+                raise SheetsQuotaExhausted(kind, wait)
+            # Wake up early now and then: other workers may have returned quota
+            time.sleep(min(wait, remaining, 1.0))
+
+        if throttled:
+            with self._lock:
+                self.counters["throttled_seconds"] += time.monotonic() - started
+
+    def succeeded(self, kind: str):
+        if kind not in self._slowed:
+            return
+
+        def recover(bucket, now):
+            bucket["scale"] = min(1.0, bucket["scale"] + 0.05)
+            if bucket["scale"] >= 1.0:
+                self._slowed.discard(kind)
+        self._update(kind, recover)
+
+    def rate_limited(self, kind: str, delay: float):
+        """Google said 429: slow the bucket down and pause it for ``delay`` seconds"""
+        def slow_down(bucket, now):
+            bucket["scale"] = max(0.1, bucket["scale"] / 2)
+            bucket["tokens"] = min(bucket["tokens"], 0.0)
+            bucket["paused_until"] = max(bucket["paused_until"], now + delay)
+        self._update(kind, slow_down)
+        with self._lock:
+            self._slowed.add(kind)
+            self.counters["rate_limited"] += 1
+
+    def backoff(self, attempt: int, retry_after: float = None) -> float:
+        """Full-jitter exponential backoff, never shorter than Retry-After"""
+        return full_jitter_backoff(attempt, self.backoff_seconds, self.max_backoff_seconds, retry_after)
+
+    def call(self, kind: str, execute, idempotent: bool = True):
+        """Run ``execute()`` within the quota, retrying 429 and 5xx responses.
+
+        Non-idempotent calls (values.append) are only retried on 429, which
+        Google returns before doing any work; a 5xx might have written the row.
+        """
+        from googleapiclient.errors import HttpError
+
+        for attempt in range(self.max_attempts):
+            self.acquire(kind)
+            try:
+                result = execute()
+            except HttpError as e:
+                status = e.resp.status
+                if status not in RETRYABLE_STATUSES or (status != 429 and not idempotent):
+                    raise
+                delay = self.backoff(attempt, retry_after_of(e))
+                if status == 429:
+                    self.rate_limited(kind, delay)
+                if attempt + 1 >= self.max_attempts:
+                    if status == 429:
+                        with self._lock:
+                            self.counters["exhausted"] += 1
+                        raise SheetsQuotaExhausted(kind, delay) from e
+                    raise
+                with self._lock:
+                    self.counters["retries"] += 1
+                print(f"⚠️ Sheets {kind} got HTTP {status}, retrying in {delay:.1f}s")
+                time.sleep(delay)
+                continue
+            self.succeeded(kind)
+            return result
+
+    def headroom(self) -> dict:
+        """Tokens left, current rate and pause for each bucket"""
+        with self._lock, file_lock(self.path):
+            state = self._read()
+            now = time.time()
+            buckets = {kind: dict(self._bucket(state, kind, now)) for kind in self.per_minute}
+        headroom = {}
+        for kind, bucket in buckets.items():
+            headroom[kind] = {
+                "tokens": round(bucket["tokens"], 2),
+                "capacity": self._capacity(kind),
+                "per_minute": self.per_minute[kind],
+                "effective_per_minute": round(self.per_minute[kind] * bucket["scale"], 2),
+                "paused_for": round(max(0.0, bucket["paused_until"] - now), 2),
+            }
+        with self._lock:
+            headroom.update(self.counters)
+        return headroom
+
+
+def full_jitter_backoff(attempt: int, base: float = 1.0, cap: float = 32.0, retry_after: float = None) -> float:
+    delay = random.uniform(0, min(cap, base * 2 ** attempt))
+    return max(delay, retry_after or 0.0)
+
+
+def retry_after_of(error):
+    """Seconds the server (or the client-side quota) asked to wait, if any"""
+    if isinstance(error, SheetsQuotaExhausted):
+        return error.retry_after
+    try:
+        return float(error.resp.get("retry-after"))
+    except (AttributeError, TypeError, ValueError):
+        return None
@@ -0,0 +1,409 @@
+import re
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional
+
+from sheets_batch import row_from_range
+from sheets_quota import SheetsQuotaExhausted
+from storage import RECORD_FIELDS, Storage, hours_spent
+
+
+# ==============================
+# User Directory Cache
+# ==============================
+class UserDirectory:
+    """In-memory copy of the register sheet, indexed by lower-cased email.
+
+    Loaded once at startup and reloaded in the background every
+    ``refresh_seconds`` so lookups never wait on Google Sheets. Only one
+    download runs at a time; threads that miss while it runs wait for it
+    instead of starting their own. An email that is still unknown after a
+    reload is remembered as missing for ``miss_reload_seconds``, and after a
+    failed download no reload is tried for ``retry_seconds``. A download
+    refused for lack of quota raises SheetsQuotaExhausted to the caller.
+    """
+
+    def __init__(self, get_service, spreadsheet_id: str, sheet_name: str,
+                 refresh_seconds: int, miss_reload_seconds: int, retry_seconds: int = 30,
+                 max_misses: int = 10000):
+        self.get_service = get_service
+        self.spreadsheet_id = spreadsheet_id
+        self.sheet_name = sheet_name
+        self.refresh_seconds = refresh_seconds
+        self.miss_reload_seconds = miss_reload_seconds
+        self.retry_seconds = retry_seconds
+        self.max_misses = max_misses
+        self._lock = threading.Lock()
+        self._load_lock = threading.Lock()  # held for the whole download
+        self._by_email = {}  # {email.lower(): {row, sno, username, email, password, mobile_number, registered_time}}
+        self._added_at = {}  # {email.lower(): time added by this worker}, kept until a download includes it
+        self._misses = OrderedDict()  # {email.lower(): time until which it is known to be missing}
+        self._loaded_at = None
+        self._retry_at = 0.0
+        self._refreshing = False
+
+    def load(self) -> bool:
+        """Download the register sheet and rebuild the email index"""
+        waited_since = time.monotonic()
+        with self._load_lock:
+            # Another thread finished a download while this one waited for the lock
+            if self._loaded_at is not None and self._loaded_at >= waited_since:
+                return True
+            if time.monotonic() < self._retry_at:
+                return False
+            started = time.monotonic()
+            try:
+                result = self.get_service().spreadsheets().values().get(
+                    spreadsheetId=self.spreadsheet_id,
+                    range=f"{self.sheet_name}!A2:F"
+                ).execute()
+            except Exception as e:
+                self._retry_at = time.monotonic() + self.retry_seconds
+                print("⚠️ Error loading user directory:", e)
+                if isinstance(e, SheetsQuotaExhausted):
+                    raise
+                return False
+
+            index = {}
+            for row_number, row in enumerate(result.get("values", []), start=2):
+                row = row + [""] * (6 - len(row))
+                if not row[2]:
+                    continue
+                index.setdefault(row[2].strip().lower(), {
+                    "row": row_number,
+                    "sno": row[0],
+                    "username": row[1],
+                    "email": row[2],
+                    "password": row[3],
+                    "mobile_number": row[4],
+                    "registered_time": row[5],
+                })
+
+            with self._lock:
+                # Users registered here whose rows may not have reached the sheet yet stay in the index
+                for key, added_at in list(self._added_at.items()):
+                    user = self._by_email.get(key)
+                    if user is not None and key not in index and (added_at >= started or not user["row"]):
+                        index[key] = user
+                    else:
+                        del self._added_at[key]
+                self._by_email = index
+                self._misses.clear()
+                self._loaded_at = time.monotonic()
+            print(f"ℹ️ User directory loaded ({len(index)} users).")
+            return True
+
+    def _refresh_if_stale(self):
+        if self._loaded_at is None:
+            # Nothing cached yet (startup load failed) – load inline, at most once per retry window
+            self.load()
+            return
+        if time.monotonic() - self._loaded_at < self.refresh_seconds:
+            return
+        with self._lock:
+            if self._refreshing:
+                return
+            self._refreshing = True
+        threading.Thread(target=self._background_load, daemon=True).start()
+
+    def refresh(self):
+        """load() for startup and background reloads, where errors are only logged"""
+        try:
+            self.load()
+        except SheetsQuotaExhausted:
+            pass  # already logged; the next lookup or refresh tries again
+
+    def _background_load(self):
+        try:
+            self.refresh()
+        finally:
+            self._refreshing = False
+
+    def _known_missing(self, key: str) -> bool:
+        with self._lock:
+            until = self._misses.get(key)
+            return until is not None and until > time.monotonic()
+
+    def _remember_missing(self, key: str):
+        with self._lock:
+            self._misses[key] = time.monotonic() + self.miss_reload_seconds
+            self._misses.move_to_end(key)
+            while len(self._misses) > self.max_misses:
+                self._misses.popitem(last=False)
+
+    def get(self, email: str) -> Optional[dict]:
+        """Return the cached register record for an email (case-insensitive)"""
+        self._refresh_if_stale()
+        key = email.strip().lower()
+        user = self._by_email.get(key)
+        if user is not None or self._known_missing(key):
+            return user
+        if time.monotonic() - (self._loaded_at or 0) > self.miss_reload_seconds:
+            # The user may have registered through another worker – reload at most once per window
+            if not self.load():
+                return None  # the sheet could not be checked, so the miss is not remembered
+            user = self._by_email.get(key)
+        if user is None:
+            self._remember_missing(key)
+        return user
+
+    def add(self, record: dict):
+        """Add a freshly registered user to the index"""
+        key = record["email"].strip().lower()
+        with self._lock:
+            self._by_email[key] = record
+            self._added_at[key] = time.monotonic()
+            self._misses.pop(key, None)
+
+    def discard(self, record: dict):
+        """Drop a user added here whose row never reached the sheet"""
+        key = record["email"].strip().lower()
+        with self._lock:
+            if self._by_email.get(key) is record:
+                del self._by_email[key]
+                self._added_at.pop(key, None)
+
+    def emails(self) -> set:
+        with self._lock:
+            return set(self._by_email)
+
+    def set_password(self, email: str, password: str):
+        """Update the cached password after a reset"""
+        with self._lock:
+            user = self._by_email.get(email.strip().lower())
+            if user:
+                user["password"] = password
+
+
+# ==============================
+# Google Sheets Storage
+# ==============================
+class SheetsStorage(Storage):
+    """Records in Google Sheets, one sheet per record type.
+
+    ``sheets`` maps each record type to (spreadsheet_id, sheet_name). Appends
+    go through the write-behind ``appender``, serial numbers come from
+    ``serials`` (registered under the record type names) and headers are
+    checked by ``schemas`` at startup. Registered users are served from a
+    UserDirectory; the sheet row of each open login is remembered so a
+    logout updates it without reading the sheet.
+    """
+
+    # Columns holding formulas, so these sheets are written with USER_ENTERED
+    USER_ENTERED = {"jobs", "payment"}
+
+    def __init__(self, get_service, sheets: dict, appender, serials, schemas,
+                 user_refresh_seconds: int = 300, user_miss_reload_seconds: int = 30, user_retry_seconds: int = 30,
+                 logout_index_size: int = 10000, logout_row_wait: float = 10.0, logout_tail_rows: int = 2000):
+        self.get_service = get_service
+        self.sheets = sheets
+        self.appender = appender
+        self.serials = serials
+        self.schemas = schemas
+        self.logout_index_size = logout_index_size
+        self.logout_row_wait = logout_row_wait
+        self.logout_tail_rows = logout_tail_rows
+
+        spreadsheet_id, sheet_name = sheets["register"]
+        self.users = UserDirectory(get_service, spreadsheet_id, sheet_name,
+                                   user_refresh_seconds, user_miss_reload_seconds, user_retry_seconds)
+        self._open_logins = OrderedDict()  # {email.lower(): (Future resolving to the sheet row, login_time)}
+        self._open_logins_lock = threading.Lock()
+
+    def start(self):
+        # Header checks, the user directory and the serial counters load in parallel
+        with ThreadPoolExecutor(max_workers=3, thread_name_prefix="sheets-start") as pool:
+            for future in [pool.submit(self.schemas.ensure_all), pool.submit(self.users.refresh),
+                           pool.submit(self.serials.seed_all)]:
+                future.result()
+
+    def close(self):
+        # Write out any rows still waiting in the append queue
+        self.appender.close()
+
+    @staticmethod
+    def _last_column(kind: str) -> str:
+        return chr(ord("A") + len(RECORD_FIELDS[kind]) - 1)
+
+    def _range(self, kind: str) -> str:
+        _, sheet_name = self.sheets[kind]
+        return f"{sheet_name}!A:{self._last_column(kind)}"
+
+    @staticmethod
+    def _cell(kind: str, field: str, value):
+        if kind == "jobs" and field == "resume_link" and value:
+            # Clickable link in the sheet; quotes doubled so the value can't break out of the formula
+            return '=HYPERLINK("{}", "View Resume")'.format(str(value).replace('"', '""'))
+        return value
+
+    @staticmethod
+    def _uncell(kind: str, field: str, value):
+        if kind == "jobs" and field == "resume_link":
+            match = HYPERLINK_RE.match(str(value))
+            if match:
+                return match.group(1).replace('""', '"')
+        return value
+
+    def add(self, kind: str, record: dict) -> dict:
+        record = self._complete(kind, record)
+        record["sno"] = self.serials.next(kind)
+        spreadsheet_id, _ = self.sheets[kind]
+        row = [self._cell(kind, field, record[field]) for field in RECORD_FIELDS[kind]]
+        written = self.appender.submit(
+            spreadsheet_id, self._range(kind), row,
+            value_input_option="USER_ENTERED" if kind in self.USER_ENTERED else "RAW",
+        )
+
+        if kind == "register":
+            user = dict(record, row=None)  # row filled in once the batched append reports where it landed
+            self.users.add(user)
+            written.add_done_callback(lambda f: self._registered(user, f))
+        elif kind == "loginhistory" and not record["logout_time"]:
+            self._remember_open_login(record["email"], written, record["login_time"])
+        return record
+
+    def _registered(self, user: dict, written):
+        if written.exception():
+            # The append was given up, so the user doesn't exist in the sheet
+            print(f"⚠️ Registration of {user['email']} was not written, dropping it from the directory")
+            self.users.discard(user)
+        else:
+            user["row"] = written.result()
+
+    def add_many(self, kind: str, records: list) -> list:
+        """Reserve one block of serial numbers and write every row with a single append"""
+        if not records:
+            return []
+        # Rows still in the write-behind queue go first, so the sheet stays in S.No order
+        self.appender.flush()
+        first_sno = self.serials.next_block(kind, len(records))
+        records = [dict(self._complete(kind, record), sno=first_sno + n) for n, record in enumerate(records)]
+        spreadsheet_id, _ = self.sheets[kind]
+        result = self.get_service().spreadsheets().values().append(
+            spreadsheetId=spreadsheet_id,
+            range=self._range(kind),
+            valueInputOption="USER_ENTERED" if kind in self.USER_ENTERED else "RAW",
+            insertDataOption="INSERT_ROWS",
+            body={"values": [[self._cell(kind, field, record[field]) for field in RECORD_FIELDS[kind]]
+                             for record in records]}
+        ).execute()
+
+        if kind == "register":
+            first_row = row_from_range(result.get("updates", {}).get("updatedRange"))
+            for n, record in enumerate(records):
+                self.users.add(dict(record, row=first_row + n if first_row else None))
+        return records
+
+    def registered_emails(self) -> set:
+        """The register sheet's email column, plus users whose rows are still queued"""
+        spreadsheet_id, sheet_name = self.sheets["register"]
+        result = self.get_service().spreadsheets().values().get(
+            spreadsheetId=spreadsheet_id,
+            range=f"{sheet_name}!C2:C"
+        ).execute()
+        emails = {row[0].strip().lower() for row in result.get("values", []) if row and row[0]}
+        return emails | self.users.emails()
+
+    # ---------- register ----------
+    def get_user(self, email: str):
+        user = self.users.get(email)
+        return {field: user[field] for field in RECORD_FIELDS["register"]} if user else None
+
+    def set_password(self, email: str, password: str) -> bool:
+        """Write a new password into the user's register row (column D)"""
+        user = self.users.get(email)
+        if not user or not user["row"]:
+            return False
+
+        spreadsheet_id, sheet_name = self.sheets["register"]
+        self.get_service().spreadsheets().values().update(
+            spreadsheetId=spreadsheet_id,
+            range=f"{sheet_name}!D{user['row']}",
+            valueInputOption="RAW",
+            body={"values": [[password]]}
+        ).execute()
+        self.users.set_password(email, password)
+        return True
+
+    # ---------- login history ----------
+    def _remember_open_login(self, email: str, written, login_time: str):
+        with self._open_logins_lock:
+            self._open_logins[email.lower()] = (written, login_time)
+            self._open_logins.move_to_end(email.lower())
+            while len(self._open_logins) > self.logout_index_size:
+                self._open_logins.popitem(last=False)
+
+    def _find_open_login(self, email: str):
+        """Return (row, login_time) of the user's latest open login, or (None, None)"""
+        with self._open_logins_lock:
+            entry = self._open_logins.pop(email.lower(), None)
+        if entry:
+            written, login_time = entry
+            try:
+                row_idx = written.result(timeout=self.logout_row_wait)
+                if row_idx:
+                    return row_idx, login_time
+            except Exception as e:
+                print("⚠️ Login row not available from index:", e)
+
+        # Index miss (other worker, restart or evicted) – scan only the last logout_tail_rows rows
+        spreadsheet_id, sheet_name = self.sheets["loginhistory"]
+        last_row = self.serials.peek("loginhistory") + self.appender.max_rows
+        first_row = max(2, last_row - self.logout_tail_rows + 1)
+        result = self.get_service().spreadsheets().values().get(
+            spreadsheetId=spreadsheet_id,
+            range=f"{sheet_name}!A{first_row}:F{last_row}"
+        ).execute()
+
+        values = result.get("values", [])
+        # Search from bottom to find last login for email
+        for offset in range(len(values) - 1, -1, -1):
+            row = values[offset]
+            if len(row) >= 3 and row[2] == email:  # email matches
+                if len(row) < 5 or row[4] == "":   # no logout yet
+                    return first_row + offset, row[3]
+        return None, None
+
+    def record_logout(self, email: str, logout_time: str):
+        row_idx, login_time = self._find_open_login(email)
+        if not row_idx:
+            return None
+
+        spent = hours_spent(login_time, logout_time)
+        spreadsheet_id, sheet_name = self.sheets["loginhistory"]
+        self.get_service().spreadsheets().values().update(
+            spreadsheetId=spreadsheet_id,
+            range=f"{sheet_name}!E{row_idx}:F{row_idx}",
+            valueInputOption="RAW",
+            body={"values": [[logout_time, spent]]}
+        ).execute()
+        return {"email": email, "login_time": login_time, "logout_time": logout_time, "hours_spent": spent}
+
+    # ---------- reading back ----------
+    def records(self, kind: str, after: int = 0, limit: int = None) -> list:
+        """Rows below the header; the cursor is the row's position (sheet row - 1)"""
+        spreadsheet_id, sheet_name = self.sheets[kind]
+        first_row = after + 2
+        last_row = str(first_row + limit - 1) if limit else ""
+        result = self.get_service().spreadsheets().values().get(
+            spreadsheetId=spreadsheet_id,
+            range=f"{sheet_name}!A{first_row}:{self._last_column(kind)}{last_row}",
+            # Formulas come back as written, so the resume link is the URL rather than "View Resume"
+            valueRenderOption="FORMULA" if kind == "jobs" else "FORMATTED_VALUE",
+            dateTimeRenderOption="FORMATTED_STRING",
+        ).execute()
+
+        fields = RECORD_FIELDS[kind]
+        records = []
+        for offset, row in enumerate(result.get("values", [])):
+            if not any(row):
+                continue
+            row = row + [""] * (len(fields) - len(row))
+            record = {field: self._uncell(kind, field, value) for field, value in zip(fields, row)}
+            records.append((after + 1 + offset, record))
+        return records
+
+
+HYPERLINK_RE = re.compile(r'=HYPERLINK\("((?:[^"]|"")*)"', re.IGNORECASE)
@@ -0,0 +1,85 @@
+import fcntl
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+
+
+# ==============================
+# Local State Directory
+# ==============================
+# Shared by every worker on this host (counters, spools, sqlite files)
+STATE_DIR = os.getenv("STATE_DIR", ".state")
+
+
+def state_path(name: str) -> str:
+    """Return the path of a file inside STATE_DIR, creating the directory if needed"""
+    os.makedirs(STATE_DIR, exist_ok=True)
+    return os.path.join(STATE_DIR, name)
+
+
+@contextmanager
+def file_lock(path: str):
+    """Exclusive cross-process lock held on ``path + '.lock'``"""
+    with open(path + ".lock", "a+") as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def pid_alive(pid) -> bool:
+    """True if a process with this pid exists (used to spot spool files left by dead workers)"""
+    if not pid:
+        return False
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+class SQLiteDB:
+    """One SQLite connection per thread to a WAL-mode database file.
+
+    WAL lets every worker process read while one of them writes, which is
+    what the shared session / OTP / idempotency tables need.
+    """
+
+    def __init__(self, path: str, schema: str = ""):
+        self.path = path
+        self.schema = schema
+        self._local = threading.local()
+
+    def conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=10, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            if self.schema:
+                conn.executescript(self.schema)
+            self._local.conn = conn
+        return conn
+
+    def execute(self, sql: str, params=()):
+        return self.conn().execute(sql, params)
+
+
+def run_periodically(name: str, interval: float, fn):
+    """Call ``fn`` every ``interval`` seconds in a daemon thread, logging failures"""
+    def run():
+        while True:
+            time.sleep(interval)
+            try:
+                fn()
+            except Exception as e:
+                print(f"⚠️ Error in {name}:", e)
+
+    thread = threading.Thread(target=run, name=name, daemon=True)
+    thread.start()
+    return thread
@@ -0,0 +1,257 @@
+import sqlite3
+import threading
+from datetime import datetime
+
+from state import SQLiteDB
+
+
+# ==============================
+# Record Storage
+# ==============================
+# Fields of every record type, in sheet column order. "sno" is assigned by the storage.
+RECORD_FIELDS = {
+    "register": ["sno", "username", "email", "password", "mobile_number", "registered_time"],
+    "loginhistory": ["sno", "username", "email", "login_time", "logout_time", "hours_spent"],
+    "contactus": ["sno", "name", "phone", "email", "project_type", "project_description", "submitted_at"],
+    "jobs": ["sno", "name", "email", "keyskills", "join_us", "resume_link", "submitted_at"],
+    "payment": ["sno", "email", "project", "amount", "payment_time"],
+}
+
+TIME_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+
+def hours_spent(login_time: str, logout_time: str) -> str:
+    """Time between two timestamps as H:MM:SS"""
+    return str(datetime.strptime(logout_time, TIME_FORMAT) - datetime.strptime(login_time, TIME_FORMAT))
+
+
+class Storage:
+    """Where registrations, login history, contact requests, job applications
+    and payments are kept. Records are plain dicts keyed by RECORD_FIELDS."""
+
+    def start(self):
+        """Prepare the backend (create tables, warm caches)"""
+
+    def close(self):
+        """Flush anything still buffered"""
+
+    def add(self, kind: str, record: dict) -> dict:
+        """Store a new record, assigning its "sno"; returns the stored record"""
+        raise NotImplementedError
+
+    def add_many(self, kind: str, records: list) -> list:
+        """Store several records at once with consecutive "sno" values. Returns the
+        stored records in order, None for a registration whose email already exists"""
+        return [self.add(kind, record) for record in records]
+
+    def registered_emails(self) -> set:
+        """Lower-cased email of every registered user"""
+        raise NotImplementedError
+
+    def get_user(self, email: str):
+        """Return the register record for an email (case-insensitive), or None"""
+        raise NotImplementedError
+
+    def set_password(self, email: str, password: str) -> bool:
+        """Change a registered user's password; False if the email is unknown"""
+        raise NotImplementedError
+
+    def record_logout(self, email: str, logout_time: str):
+        """Close the user's latest open login and return it, or None if there is none"""
+        raise NotImplementedError
+
+    def records(self, kind: str, after: int = 0, limit: int = None) -> list:
+        """Records in storage order as [(cursor, record)]; pass the last cursor as
+        ``after`` to continue from there"""
+        raise NotImplementedError
+
+    @staticmethod
+    def _complete(kind: str, record: dict) -> dict:
+        """Copy of ``record`` with every field of ``kind`` present"""
+        if kind not in RECORD_FIELDS:
+            raise ValueError(f"Unknown record type {kind!r}")
+        return {field: record.get(field, "") for field in RECORD_FIELDS[kind]}
+
+
+class MemoryStorage(Storage):
+    """Records in process memory – for tests and local runs"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._records = {kind: [] for kind in RECORD_FIELDS}
+        self._users = {}        # {email.lower(): register record}
+        self._open_logins = {}  # {email.lower(): latest loginhistory record without a logout}
+
+    def add(self, kind: str, record: dict) -> dict:
+        record = self._complete(kind, record)
+        with self._lock:
+            records = self._records[kind]
+            record["sno"] = len(records) + 1
+            records.append(record)
+            key = record["email"].strip().lower()
+            if kind == "register":
+                self._users.setdefault(key, record)
+            elif kind == "loginhistory" and not record["logout_time"]:
+                self._open_logins[key] = record
+        return dict(record)
+
+    def add_many(self, kind: str, records: list) -> list:
+        stored = []
+        with self._lock:
+            for record in records:
+                if kind == "register" and record["email"].strip().lower() in self._users:
+                    stored.append(None)
+                    continue
+                record = self._complete(kind, record)
+                record["sno"] = len(self._records[kind]) + 1
+                self._records[kind].append(record)
+                if kind == "register":
+                    self._users[record["email"].strip().lower()] = record
+                stored.append(dict(record))
+        return stored
+
+    def registered_emails(self) -> set:
+        with self._lock:
+            return set(self._users)
+
+    def get_user(self, email: str):
+        with self._lock:
+            user = self._users.get(email.strip().lower())
+            return dict(user) if user else None
+
+    def set_password(self, email: str, password: str) -> bool:
+        with self._lock:
+            user = self._users.get(email.strip().lower())
+            if not user:
+                return False
+            user["password"] = password
+            return True
+
+    def record_logout(self, email: str, logout_time: str):
+        with self._lock:
+            login = self._open_logins.pop(email.strip().lower(), None)
+            if not login:
+                return None
+            login["logout_time"] = logout_time
+            login["hours_spent"] = hours_spent(login["login_time"], logout_time)
+            return dict(login)
+
+    def records(self, kind: str, after: int = 0, limit: int = None) -> list:
+        with self._lock:
+            records = self._records[kind][after:after + limit if limit else None]
+            return [(after + n, dict(record)) for n, record in enumerate(records, start=1)]
+
+
+SQLITE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS register (
+    sno INTEGER PRIMARY KEY,
+    username TEXT, email TEXT NOT NULL, password TEXT, mobile_number TEXT, registered_time TEXT
+);
+CREATE UNIQUE INDEX IF NOT EXISTS register_email ON register (email COLLATE NOCASE);
+
+CREATE TABLE IF NOT EXISTS loginhistory (
+    sno INTEGER PRIMARY KEY,
+    username TEXT, email TEXT NOT NULL, login_time TEXT, logout_time TEXT, hours_spent TEXT
+);
+CREATE INDEX IF NOT EXISTS loginhistory_open ON loginhistory (email COLLATE NOCASE, sno) WHERE logout_time = '';
+
+CREATE TABLE IF NOT EXISTS contactus (
+    sno INTEGER PRIMARY KEY,
+    name TEXT, phone TEXT, email TEXT, project_type TEXT, project_description TEXT, submitted_at TEXT
+);
+
+CREATE TABLE IF NOT EXISTS jobs (
+    sno INTEGER PRIMARY KEY,
+    name TEXT, email TEXT, keyskills TEXT, join_us TEXT, resume_link TEXT, submitted_at TEXT
+);
+
+CREATE TABLE IF NOT EXISTS payment (
+    sno INTEGER PRIMARY KEY,
+    email TEXT, project TEXT, amount TEXT, payment_time TEXT
+);
+"""
+
+
+class SQLiteStorage(Storage):
+    """Records in a local SQLite file (WAL mode), shared by every worker on the host"""
+
+    def __init__(self, path: str):
+        self.db = SQLiteDB(path, SQLITE_SCHEMA)
+
+    def start(self):
+        self.db.conn()
+
+    def add(self, kind: str, record: dict) -> dict:
+        record = self._complete(kind, record)
+        fields = RECORD_FIELDS[kind][1:]
+        cursor = self.db.execute(
+            f"INSERT INTO {kind} ({', '.join(fields)}) VALUES ({', '.join('?' for _ in fields)})",
+            [str(record[field]) for field in fields],
+        )
+        record["sno"] = cursor.lastrowid
+        return record
+
+    def add_many(self, kind: str, records: list) -> list:
+        fields = RECORD_FIELDS[kind][1:]
+        sql = f"INSERT INTO {kind} ({', '.join(fields)}) VALUES ({', '.join('?' for _ in fields)})"
+        stored = []
+        conn = self.db.conn()
+        # One transaction keeps the serial numbers together and costs a single fsync
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            for record in records:
+                record = self._complete(kind, record)
+                try:
+                    cursor = conn.execute(sql, [str(record[field]) for field in fields])
+                except sqlite3.IntegrityError:
+                    stored.append(None)  # email registered meanwhile
+                    continue
+                record["sno"] = cursor.lastrowid
+                stored.append(record)
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return stored
+
+    def registered_emails(self) -> set:
+        return {email.lower() for (email,) in self.db.execute("SELECT email FROM register")}
+
+    def get_user(self, email: str):
+        row = self.db.execute(
+            "SELECT sno, username, email, password, mobile_number, registered_time "
+            "FROM register WHERE email = ? COLLATE NOCASE",
+            (email.strip(),),
+        ).fetchone()
+        return dict(zip(RECORD_FIELDS["register"], row)) if row else None
+
+    def set_password(self, email: str, password: str) -> bool:
+        cursor = self.db.execute(
+            "UPDATE register SET password = ? WHERE email = ? COLLATE NOCASE", (password, email.strip())
+        )
+        return cursor.rowcount > 0
+
+    def record_logout(self, email: str, logout_time: str):
+        row = self.db.execute(
+            "SELECT sno, username, email, login_time FROM loginhistory "
+            "WHERE email = ? COLLATE NOCASE AND logout_time = '' ORDER BY sno DESC LIMIT 1",
+            (email.strip(),),
+        ).fetchone()
+        if not row:
+            return None
+        login = dict(zip(["sno", "username", "email", "login_time"], row))
+        login["logout_time"] = logout_time
+        login["hours_spent"] = hours_spent(login["login_time"], logout_time)
+        cursor = self.db.execute(
+            "UPDATE loginhistory SET logout_time = ?, hours_spent = ? WHERE sno = ? AND logout_time = ''",
+            (logout_time, login["hours_spent"], login["sno"]),
+        )
+        return login if cursor.rowcount else None
+
+    def records(self, kind: str, after: int = 0, limit: int = None) -> list:
+        fields = RECORD_FIELDS[kind]
+        rows = self.db.execute(
+            f"SELECT {', '.join(fields)} FROM {kind} WHERE sno > ? ORDER BY sno LIMIT ?",
+            (after, limit or -1),
+        ).fetchall()
+        return [(row[0], dict(zip(fields, row))) for row in rows]
@@ -0,0 +1,29 @@
+import os
+import sys
+
+import pytest
+
+# The app's modules live at the repository root
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+@pytest.fixture(scope="session")
+def main_module(tmp_path_factory):
+    """main.py imported once with offline backends; the lifespan is not run"""
+    pytest.importorskip("httpx")
+    env = {"SMTP_SERVER": "localhost", "SMTP_PORT": "2525", "USERNAME": "admin@example.com", "PASSWORD": "x",
+           "STORAGE_BACKEND": "memory", "IDEMPOTENCY_BACKEND": "memory", "SESSION_BACKEND": "memory",
+           "STATE_DIR": str(tmp_path_factory.mktemp("state")), "ADMIN_API_KEY": "test",
+           "PUBLIC_BASE_URL": "https://portal.example.com"}
+    saved = {name: os.environ.get(name) for name in env}
+    os.environ.update(env)
+    try:
+        import main
+    finally:
+        for name, value in saved.items():
+            if value is None:
+                os.environ.pop(name, None)
+            else:
+                os.environ[name] = value
+    yield main
+    sys.modules.pop("main", None)
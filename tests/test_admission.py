@@ -0,0 +1,115 @@
+import asyncio
+
+import pytest
+
+from admission import AdmissionControl, Overloaded
+
+
+async def request(admission, route, hold, log=None, tag=None):
+    try:
+        async with admission.slot(route):
+            if log is not None:
+                log.append(tag)
+            await asyncio.sleep(hold)
+        return "ok"
+    except Overloaded as e:
+        return e.reason
+
+
+def test_route_limit_queues_then_admits():
+    admission = AdmissionControl(10)
+    admission.limit("/pay", 2, queue=5, max_wait=2)
+
+    async def main():
+        return await asyncio.gather(*[request(admission, "/pay", 0.1) for _ in range(4)])
+
+    assert asyncio.run(main()) == ["ok"] * 4
+    assert admission.in_flight == 0
+    assert admission.stats()["/pay"]["in_flight"] == 0
+
+
+def test_full_queue_is_turned_away_at_once():
+    admission = AdmissionControl(10)
+    admission.limit("/pay", 1, queue=1, max_wait=2)
+
+    async def main():
+        return await asyncio.gather(*[request(admission, "/pay", 0.1) for _ in range(3)])
+
+    assert asyncio.run(main()) == ["ok", "ok", "queue_full"]
+
+
+def test_wait_times_out_with_retry_after():
+    admission = AdmissionControl(10)
+    admission.limit("/pay", 1, queue=5, max_wait=0.05)
+
+    async def main():
+        holder = asyncio.create_task(request(admission, "/pay", 0.3))
+        await asyncio.sleep(0.01)
+        with pytest.raises(Overloaded) as e:
+            async with admission.slot("/pay"):
+                pass
+        await holder
+        return e.value
+
+    error = asyncio.run(main())
+    assert error.reason == "timeout"
+    assert error.retry_after >= 1
+    assert admission.stats()["/pay"]["waiting"] == 0
+
+
+def test_reserve_keeps_slots_for_priority_routes():
+    admission = AdmissionControl(3, reserve=1)
+    admission.limit("/pay", 5, queue=5, max_wait=0.05)
+    admission.limit("/login", 5, queue=5, max_wait=0.05, priority=True)
+
+    async def main():
+        pays = [asyncio.create_task(request(admission, "/pay", 0.2)) for _ in range(3)]
+        await asyncio.sleep(0.01)
+        login = await request(admission, "/login", 0)
+        return await asyncio.gather(*pays), login
+
+    pays, login = asyncio.run(main())
+    assert pays == ["ok", "ok", "timeout"]
+    assert login == "ok"
+
+
+def test_freed_slot_goes_to_priority_waiter_first():
+    admission = AdmissionControl(1)
+    admission.limit("/pay", 1, queue=5, max_wait=2)
+    admission.limit("/login", 1, queue=5, max_wait=2, priority=True)
+    log = []
+
+    async def main():
+        holder = asyncio.create_task(request(admission, "/pay", 0.1, log, "holder"))
+        await asyncio.sleep(0.01)
+        pay = asyncio.create_task(request(admission, "/pay", 0, log, "pay"))
+        await asyncio.sleep(0.01)
+        login = asyncio.create_task(request(admission, "/login", 0, log, "login"))
+        await asyncio.gather(holder, pay, login)
+
+    asyncio.run(main())
+    assert log == ["holder", "login", "pay"]
+
+
+def test_cancelled_waiter_gives_up_its_place():
+    admission = AdmissionControl(1)
+    admission.limit("/x", 1, queue=5, max_wait=5)
+
+    async def main():
+        holder = asyncio.create_task(request(admission, "/x", 0.1))
+        await asyncio.sleep(0.01)
+        waiter = asyncio.create_task(request(admission, "/x", 0))
+        await asyncio.sleep(0.01)
+        waiter.cancel()
+        await holder
+        with pytest.raises(asyncio.CancelledError):
+            await waiter
+
+    asyncio.run(main())
+    assert admission.in_flight == 0
+    assert admission.stats()["/x"] == {"limit": 1, "in_flight": 0, "waiting": 0, "queue": 5, "priority": False}
+
+
+def test_unlimited_route_passes_through():
+    admission = AdmissionControl(0)
+    assert asyncio.run(request(admission, "/", 0)) == "ok"
@@ -0,0 +1,60 @@
+import time
+
+import pytest
+
+from aggregates import MemoryAggregates, SQLiteAggregates, session_seconds
+from storage import MemoryStorage
+
+
+def login(email, logout_time):
+    return {"username": email.split("@")[0], "email": email, "login_time": "2024-01-01 10:00:00",
+            "logout_time": logout_time, "hours_spent": ""}
+
+
+@pytest.fixture(params=["memory", "sqlite"])
+def stats(request, tmp_path):
+    return MemoryAggregates() if request.param == "memory" else SQLiteAggregates(str(tmp_path / "stats.db"))
+
+
+def test_bootstrap_then_increments(stats):
+    storage = MemoryStorage()
+    storage.add("loginhistory", login("a@x.com", "2024-01-01 11:00:00"))
+    storage.add("loginhistory", login("a@x.com", ""))  # still open: not counted
+    storage.add("payment", {"email": "a@x.com", "project": "Website", "amount": "100",
+                            "payment_time": "2024-01-01 10:00:00"})
+    stats.bootstrap(storage)
+
+    stats.add_session(login("A@x.com", "2024-01-01 10:30:00"))
+    stats.add_payment({"project": "Website", "amount": 50, "payment_time": "2024-01-02 10:00:00"})
+
+    logins, payments = stats.logins(), stats.payments()
+    assert logins["per_user"]["a@x.com"]["sessions"] == 2
+    assert logins["hours"] == 1.5
+    assert payments["per_project"]["Website"] == {"payments": 2, "revenue": 150.0, "last_payment": "2024-01-02 10:00:00"}
+
+
+class FlakyStorage(MemoryStorage):
+    def __init__(self, failures):
+        super().__init__()
+        self.failures = failures
+
+    def records(self, kind, after=0, limit=None):
+        if self.failures:
+            self.failures -= 1
+            raise OSError("sheets unavailable")
+        return super().records(kind, after, limit)
+
+
+def test_failed_bootstrap_is_retried(stats):
+    storage = FlakyStorage(failures=2)
+    storage.add("payment", {"email": "a@x.com", "project": "App", "amount": "10", "payment_time": "2024-01-01"})
+    with pytest.raises(OSError):
+        stats.bootstrap(storage)
+
+    stats.retry_bootstrap(storage, 0.05).join(timeout=5)
+    assert stats.payments()["revenue"] == 10.0
+    assert stats.payments()["bootstrapped_at"] <= time.time()
+
+
+def test_session_seconds_falls_back_to_hours_spent():
+    assert session_seconds({"logout_time": "", "hours_spent": "1 day, 1:00:00"}) == 90000
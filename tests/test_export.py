@@ -0,0 +1,126 @@
+import asyncio
+import json
+
+import pytest
+
+from export import ExportIndex, export_stream, parse_since
+
+
+def contacts(times):
+    return [(cursor, {"sno": cursor, "name": f"c{cursor}", "phone": "", "email": f"c{cursor}@x.com",
+                      "project_type": "", "project_description": "", "submitted_at": at})
+            for cursor, at in enumerate(times, start=1)]
+
+
+class Sheet:
+    """records() over a fixed list, remembering where each window started"""
+
+    def __init__(self, rows):
+        self.rows = rows
+        self.reads = []
+
+    async def read_window(self, after, limit):
+        self.reads.append(after)
+        return [row for row in self.rows if row[0] > after][:limit]
+
+
+def export(sheet, since="", index=None, window=2):
+    after, not_before = parse_since(since)
+
+    async def collect():
+        return [chunk async for chunk in export_stream(sheet.read_window, "contactus", "ndjson", after=after,
+                                                       not_before=not_before, window=window, index=index)]
+
+    lines = b"".join(asyncio.run(collect())).decode().splitlines()
+    return [json.loads(line)["cursor"] for line in lines]
+
+
+DAYS = ["2024-01-01 09:00:00", "2024-01-02 09:00:00", "2024-01-03 09:00:00", "2024-01-04 09:00:00",
+        "2024-01-05 09:00:00", "2024-01-06 09:00:00", "2024-01-07 09:00:00"]
+
+
+def test_parse_since():
+    assert parse_since("") == (0, None)
+    assert parse_since("42") == (42, None)
+    assert parse_since("2024-01-03") == (0, "2024-01-03 00:00:00")
+    with pytest.raises(ValueError):
+        parse_since("yesterday")
+
+
+def test_cursor_since_returns_only_newer_rows():
+    sheet = Sheet(contacts(DAYS))
+    assert export(sheet, "5") == [6, 7]
+    assert sheet.reads[0] == 5
+
+
+def test_timestamp_since_keeps_rows_at_or_after_it():
+    sheet = Sheet(contacts(DAYS))
+    assert export(sheet, "2024-01-05 09:00:00") == [5, 6, 7]
+    assert sheet.reads[0] == 0
+
+
+def test_timestamp_since_seeks_past_rows_seen_before():
+    sheet = Sheet(contacts(DAYS))
+    index = ExportIndex()
+    assert export(sheet, index=index) == [1, 2, 3, 4, 5, 6, 7]
+
+    sheet.reads.clear()
+    assert export(sheet, "2024-01-06", index=index) == [6, 7]
+    assert sheet.reads[0] == 4
+
+    # Rows appended later are picked up, and their windows become checkpoints too
+    sheet.rows += contacts(DAYS + ["2024-01-08 09:00:00", "2024-01-09 09:00:00"])[7:]
+    assert export(sheet, "2024-01-06", index=index) == [6, 7, 8, 9]
+    sheet.reads.clear()
+    assert export(sheet, "2024-01-09", index=index) == [9]
+    assert sheet.reads[0] == 8
+
+
+def test_out_of_order_rows_are_not_skipped():
+    # Rows 3-5 were appended after row 2 but carry earlier times
+    times = ["2024-01-01 09:00:00", "2024-01-06 09:00:00", "2024-01-02 09:00:00", "2024-01-03 09:00:00",
+             "2024-01-01 12:00:00", "2024-01-07 09:00:00"]
+    sheet = Sheet(contacts(times))
+    index = ExportIndex()
+    export(sheet, index=index)
+    assert export(sheet, "2024-01-03", index=index) == [2, 4, 6]
+    assert export(sheet, "2024-01-01 10:00:00", index=index) == [2, 3, 4, 5, 6]
+
+
+def test_cursor_exports_do_not_add_checkpoints():
+    sheet = Sheet(contacts(DAYS))
+    index = ExportIndex()
+    export(sheet, "3", index=index)
+    assert index.seek("contactus", "2024-01-07") == (0, "")
+
+
+def test_cleared_index_reads_from_the_top():
+    sheet = Sheet(contacts(DAYS))
+    index = ExportIndex()
+    export(sheet, index=index)
+    index.clear()
+    sheet.reads.clear()
+    assert export(sheet, "2024-01-06", index=index) == [6, 7]
+    assert sheet.reads[0] == 0
+
+
+def test_export_endpoint_with_since(main_module):
+    from fastapi.testclient import TestClient
+    main = main_module
+    main.export_index.clear()
+    for n, at in enumerate(DAYS[:3]):
+        main.storage.add("payment", {"email": f"p{n}@x.com", "project": "web", "amount": 10,
+                                     "payment_time": at})
+    client = TestClient(main.app)
+    headers = {"X-Admin-Key": "test"}
+    full = client.get("/admin/export/payment", params={"format": "ndjson"}, headers=headers)
+    cursors = [json.loads(line)["cursor"] for line in full.text.splitlines()]
+    assert len(cursors) >= 3
+
+    newer = client.get("/admin/export/payment", params={"format": "ndjson", "since": "2024-01-02"},
+                       headers=headers)
+    assert [json.loads(line)["email"] for line in newer.text.splitlines()][-2:] == ["p1@x.com", "p2@x.com"]
+    after = client.get("/admin/export/payment", params={"format": "ndjson", "since": str(cursors[-2])},
+                       headers=headers)
+    assert [json.loads(line)["cursor"] for line in after.text.splitlines()] == cursors[-1:]
+    assert client.get("/admin/export/payment", params={"since": "soon"}, headers=headers).status_code == 400
@@ -0,0 +1,85 @@
+import asyncio
+import threading
+import time
+
+import pytest
+
+from blocking import BlockingExecutor
+from fanout import Step, fan_out, failed
+
+
+@pytest.fixture
+def executor():
+    executor = BlockingExecutor("test", 4)
+    yield executor
+    executor.shutdown(wait=False)
+
+
+def boom():
+    raise RuntimeError("sheet down")
+
+
+def test_failure_is_reported_without_cancelling_the_others(executor):
+    done = []
+    outcomes = asyncio.run(fan_out([
+        Step("sheet", executor, boom),
+        Step("mail", executor, lambda: done.append("mail") or "m1"),
+    ]))
+    assert failed(outcomes) == ["sheet"]
+    assert outcomes["sheet"].error == "RuntimeError: sheet down"
+    assert outcomes["mail"].value == "m1"
+    assert done == ["mail"]
+
+
+def test_falsy_result_counts_as_failure(executor):
+    outcomes = asyncio.run(fan_out([Step("mail", executor, lambda: False)]))
+    assert failed(outcomes) == ["mail"]
+    assert outcomes["mail"].error is None
+
+
+def test_dependent_step_is_skipped_when_its_dependency_fails(executor):
+    ran = []
+    outcomes = asyncio.run(fan_out([
+        Step("register", executor, boom),
+        Step("mail", executor, lambda: ran.append("mail") or True, after=["register"]),
+    ]))
+    assert failed(outcomes) == ["register", "mail"]
+    assert outcomes["mail"].error == "skipped because 'register' failed"
+    assert ran == []
+
+
+def test_dependent_step_runs_after_its_dependency(executor):
+    order = []
+    outcomes = asyncio.run(fan_out([
+        Step("mail", executor, lambda: order.append("mail") or True, after=["register"]),
+        Step("register", executor, lambda: time.sleep(0.05) or order.append("register") or True),
+    ]))
+    assert failed(outcomes) == []
+    assert order == ["register", "mail"]
+
+
+def test_slow_step_times_out(executor):
+    release = threading.Event()
+    start = time.perf_counter()
+    outcomes = asyncio.run(fan_out([
+        Step("slow", executor, release.wait, 5, timeout=0.05),
+        Step("fast", executor, lambda: True),
+    ], timeout=5))
+    release.set()
+    assert time.perf_counter() - start < 1
+    assert failed(outcomes) == ["slow"]
+    assert outcomes["slow"].error == "timed out after 0.05s"
+
+
+def test_contactus_reports_the_failed_step(main_module, monkeypatch):
+    from fastapi.testclient import TestClient
+    main = main_module
+    stored = []
+    monkeypatch.setattr(main, "append_user_details", lambda *args: stored.append(args) or True)
+    monkeypatch.setattr(main, "send_thankyou_email", lambda *args: "m1")
+    monkeypatch.setattr(main, "send_admin_notification", lambda *args: False)
+    response = TestClient(main.app).post("/contactus", data={
+        "name": "Ann", "phone": "1", "email": "ann@x.com", "project_type": "web", "project_description": "site"})
+    assert response.status_code == 500
+    assert response.json()["detail"] == "Failed to process the request: admin_mail"
+    assert len(stored) == 1
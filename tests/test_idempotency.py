@@ -0,0 +1,160 @@
+import asyncio
+import itertools
+
+import pytest
+
+from idempotency import BodyFingerprint, MemoryIdempotencyStore, SQLiteIdempotencyStore
+
+
+@pytest.fixture(params=["memory", "sqlite"])
+def store(request, tmp_path):
+    if request.param == "memory":
+        return MemoryIdempotencyStore(60, lease=30)
+    return SQLiteIdempotencyStore(str(tmp_path / "idempotency.db"), 60, lease=30)
+
+
+def test_duplicate_waits_then_replays(store):
+    assert store.begin("k", "fp") == ("run", None)
+    assert store.begin("k", "fp") == ("running", None)
+    store.complete("k", {"status": 200, "body": "ok", "headers": []})
+    assert store.begin("k", "fp") == ("done", {"status": 200, "body": "ok", "headers": []})
+
+
+def test_key_reused_for_another_request_is_a_mismatch(store):
+    store.begin("k", "fp")
+    assert store.begin("k", "other") == ("mismatch", None)
+    store.complete("k", {"status": 200, "body": "ok", "headers": []})
+    assert store.begin("k", "other") == ("mismatch", None)
+
+
+def test_released_key_runs_again(store):
+    store.begin("k", "fp")
+    store.release("k")
+    assert store.begin("k", "other") == ("run", None)
+
+
+def test_sqlite_store_migrates_old_table(tmp_path):
+    import sqlite3
+    path = str(tmp_path / "idempotency.db")
+    conn = sqlite3.connect(path)
+    conn.execute("CREATE TABLE idempotency (key TEXT PRIMARY KEY, response TEXT, "
+                 "expires_at REAL NOT NULL, used_at REAL NOT NULL)")
+    conn.commit()
+    conn.close()
+    store = SQLiteIdempotencyStore(path, 60, lease=30)
+    assert store.begin("k", "fp") == ("run", None)
+
+
+def multipart(boundary: str, content: bytes) -> bytes:
+    return (f"--{boundary}\r\nContent-Disposition: form-data; name=\"file\"; filename=\"cv.pdf\"\r\n"
+            f"Content-Type: application/pdf\r\n\r\n").encode() + content + f"\r\n--{boundary}--\r\n".encode()
+
+
+def fingerprint(body: bytes, content_type: str, chunk_size: int) -> str:
+    messages = [{"type": "http.request", "body": body[i:i + chunk_size], "more_body": i + chunk_size < len(body)}
+                for i in range(0, len(body), chunk_size)]
+
+    async def receive():
+        return messages.pop(0)
+
+    body_hash = BodyFingerprint(receive, content_type)
+    asyncio.run(body_hash.drain())
+    return body_hash.hexdigest()
+
+
+def test_body_fingerprint_ignores_the_multipart_boundary():
+    first = fingerprint(multipart("aaaa1111", b"resume"), "multipart/form-data; boundary=aaaa1111", 1000)
+    retry = fingerprint(multipart("bbbb2222", b"resume"), "multipart/form-data; boundary=bbbb2222", 3)
+    other = fingerprint(multipart("cccc3333", b"resumf"), "multipart/form-data; boundary=cccc3333", 7)
+    assert first == retry
+    assert other != first
+
+
+# ==============================
+# Middleware
+# ==============================
+@pytest.fixture(scope="module")
+def app_module(main_module):
+    main = main_module
+    calls = itertools.count(1)
+
+    @main.app.post("/_test/order")
+    async def order(payload: dict):
+        return {"call": next(calls), "payload": payload}
+
+    @main.app.post("/_test/session")
+    async def session():
+        response = main.JSONResponse({"session_id": f"s{next(calls)}"})
+        response.set_cookie("session_id", "secret")
+        return response
+
+    @main.app.post("/_test/upload")
+    async def upload(request: main.Request):
+        form = await request.form()
+        return {"call": next(calls), "size": len(await form["file"].read())}
+
+    @main.app.post("/_test/raw")
+    async def raw(request: main.Request):
+        return {"call": next(calls), "size": len(await request.body())}
+
+    main.IDEMPOTENT_ROUTES = main.IDEMPOTENT_ROUTES | {"/_test/order", "/_test/session", "/_test/upload", "/_test/raw"}
+    return main
+
+
+@pytest.fixture
+def client(app_module):
+    from fastapi.testclient import TestClient
+    app_module.idempotency = MemoryIdempotencyStore(60, lease=30)
+    return TestClient(app_module.app)
+
+
+def test_retry_gets_the_stored_response(client):
+    first = client.post("/_test/order", json={"n": 1}, headers={"Idempotency-Key": "a"})
+    again = client.post("/_test/order", json={"n": 1}, headers={"Idempotency-Key": "a"})
+    assert again.json() == first.json()
+    assert again.headers["Idempotent-Replayed"] == "true"
+
+
+def test_changed_payload_is_rejected(client):
+    client.post("/_test/order", json={"n": 1}, headers={"Idempotency-Key": "a"})
+    changed = client.post("/_test/order", json={"n": 2}, headers={"Idempotency-Key": "a"})
+    assert changed.status_code == 422
+
+
+def test_anonymous_key_is_not_shared_between_clients(client):
+    first = client.post("/_test/order", json={"n": 1}, headers={"Idempotency-Key": "a", "User-Agent": "victim"})
+    other = client.post("/_test/order", json={"n": 1}, headers={"Idempotency-Key": "a", "User-Agent": "attacker"})
+    assert other.status_code == 200
+    assert "Idempotent-Replayed" not in other.headers
+    assert other.json()["call"] != first.json()["call"]
+
+
+def test_session_responses_are_never_replayed(client):
+    first = client.post("/_test/session", headers={"Idempotency-Key": "a"})
+    again = client.post("/_test/session", headers={"Idempotency-Key": "a"})
+    assert "Idempotent-Replayed" not in again.headers
+    assert again.json() != first.json()
+
+
+def test_upload_retry_with_a_new_boundary_is_replayed(client):
+    def post(boundary, content):
+        return client.post("/_test/upload", content=multipart(boundary, content), headers={
+            "Idempotency-Key": "a", "Content-Type": f"multipart/form-data; boundary={boundary}"})
+
+    first = post("aaaa1111", b"%PDF-1" * 1000)
+    again = post("bbbb2222", b"%PDF-1" * 1000)
+    assert again.headers["Idempotent-Replayed"] == "true"
+    assert again.json() == first.json()
+    assert post("cccc3333", b"%PDF-2" * 1000).status_code == 422
+
+
+def test_chunked_body_is_covered(client):
+    def post(chunks):
+        return client.post("/_test/raw", content=iter(chunks), headers={"Idempotency-Key": "a"})
+
+    first = post([b"one", b"two"])
+    assert "content-length" not in first.request.headers
+    again = post([b"onetwo"])
+    assert again.headers["Idempotent-Replayed"] == "true"
+    assert again.json() == first.json()
+    assert post([b"one", b"three"]).status_code == 422
@@ -0,0 +1,121 @@
+import os
+import smtplib
+import time
+
+import pytest
+
+from bench import smtp_sink
+from mail import MailQueue, SMTPPool
+
+
+class FakeServer:
+    def __init__(self, error=None):
+        self.error = error
+        self.sent = []
+        self.closed = False
+
+    def noop(self):
+        return (250, b"OK")
+
+    def sendmail(self, from_addr, to_addrs, msg):
+        if self.error:
+            raise self.error
+        self.sent.append(msg)
+        return {}
+
+    def quit(self):
+        self.closed = True
+
+
+def pool_with(servers):
+    """An SMTPPool whose connections are taken from ``servers`` in order"""
+    pool = SMTPPool("smtp.test", 25, "user", "pw")
+    connects = iter(servers)
+    pool._connect = lambda: next(connects)
+    return pool
+
+
+def test_sessions_are_reused():
+    server = FakeServer()
+    pool = pool_with([server])
+    pool.sendmail("a@x.com", ["b@x.com"], "one")
+    pool.sendmail("a@x.com", ["b@x.com"], "two")
+    assert server.sent == ["one", "two"]
+
+
+def test_dropped_session_is_retried_on_a_new_one():
+    stale, fresh = FakeServer(), FakeServer()
+    pool = pool_with([stale, fresh])
+    pool.sendmail("a@x.com", ["b@x.com"], "one")
+    stale.error = smtplib.SMTPServerDisconnected("gone")
+
+    pool.sendmail("a@x.com", ["b@x.com"], "two")
+    assert fresh.sent == ["two"]
+    assert stale.closed
+
+
+def test_rejected_message_is_not_resent():
+    server, spare = FakeServer(), FakeServer()
+    pool = pool_with([server, spare])
+    pool.sendmail("a@x.com", ["b@x.com"], "one")
+    server.error = smtplib.SMTPRecipientsRefused({"b@x.com": (550, b"no such user")})
+
+    with pytest.raises(smtplib.SMTPRecipientsRefused):
+        pool.sendmail("a@x.com", ["b@x.com"], "two")
+    assert spare.sent == []
+    assert server.closed
+
+
+class FakePool:
+    def __init__(self):
+        self.sent = []
+
+    def sendmail(self, from_addr, to_addrs, msg):
+        self.sent.append(msg)
+
+
+def wait_for_status(queue, message_id, status, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        state = queue.status(message_id)
+        if state and state["status"] == status:
+            return state
+        time.sleep(0.01)
+    raise AssertionError(f"{message_id} never reached {status}")
+
+
+def test_queued_mail_is_delivered(tmp_path):
+    pool = FakePool()
+    queue = MailQueue(pool, str(tmp_path), workers=1)
+    queue.start()
+    message_id = queue.enqueue("a@x.com", "b@x.com", "Subject: hi\r\n\r\nbody")
+    wait_for_status(queue, message_id, "sent")
+    queue.stop()
+    assert pool.sent == [b"Subject: hi\r\n\r\nbody"]
+
+
+def test_sweep_removes_finished_mail_after_keep_seconds(tmp_path):
+    queue = MailQueue(FakePool(), str(tmp_path), workers=1, keep_seconds=0.2)
+    queue.start()
+    message_id = queue.enqueue("a@x.com", "b@x.com", "body")
+    wait_for_status(queue, message_id, "sent")
+
+    assert queue.sweep() == 0  # still reported by /mail-status for a while
+    time.sleep(0.3)
+    assert queue.sweep() == 1
+    assert queue.status(message_id) is None
+    assert not [name for name in os.listdir(tmp_path) if name.endswith((".json", ".eml"))]
+    queue.stop()
+
+
+def test_spooled_mail_goes_through_smtplib(tmp_path):
+    server, sink = smtp_sink.serve()
+    pool = SMTPPool("127.0.0.1", server.server_address[1], "u", "p", starttls=False)
+    queue = MailQueue(pool, str(tmp_path), workers=1)
+    queue.start()
+    message_id = queue.enqueue("a@x.com", "b@x.com", "Subject: hi\r\n\r\n.leading dot\r\nbody\r\n")
+    wait_for_status(queue, message_id, "sent")
+    queue.stop()
+    pool.close()
+    server.shutdown()
+    assert sink.last_message_to("b@x.com") == b"Subject: hi\r\n\r\n.leading dot\r\nbody\r\n"
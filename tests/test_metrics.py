@@ -0,0 +1,65 @@
+import pytest
+
+import metrics
+
+
+@pytest.fixture(scope="module")
+def client(main_module):
+    from fastapi.testclient import TestClient
+    main = main_module
+
+    @main.app.get("/_test/sheet/{row}")
+    async def read_row(row: int):
+        def call():
+            with metrics.timed_call("sheets", "sheet-id", "values.get"):
+                return row
+        return {"row": await main.sheets_io.run(call)}
+
+    metrics.label_spreadsheet("sheet-id", "register")
+    return TestClient(main.app)
+
+
+def count(metric, *labels):
+    return metric._values.get(labels, 0)
+
+
+def requests_seen(*labels):
+    series = metrics.http_request_duration._series.get(labels)
+    return series[-1] if series else 0
+
+
+def test_route_template_is_the_label(client):
+    before = count(metrics.http_requests, "GET", "/mail-status/{message_id}", "404")
+    for message_id in ("a1", "b2", "c3"):
+        assert client.get(f"/mail-status/{message_id}").status_code == 404
+    assert count(metrics.http_requests, "GET", "/mail-status/{message_id}", "404") == before + 3
+    assert not any("a1" in labels[1] for labels in metrics.http_requests._values)
+
+
+def test_unknown_paths_share_one_label(client):
+    before = count(metrics.http_requests, "GET", "unmatched", "404")
+    client.get("/no/such/page")
+    client.get("/another/missing/page")
+    assert count(metrics.http_requests, "GET", "unmatched", "404") == before + 2
+
+
+def test_duration_is_observed_per_route(client):
+    before = requests_seen("GET", "/_test/sheet/{row}")
+    client.get("/_test/sheet/1")
+    assert requests_seen("GET", "/_test/sheet/{row}") == before + 1
+
+
+def test_downstream_calls_are_attributed_to_the_route(client):
+    labels = ("sheets", "/_test/sheet/{row}", "register", "values.get", "ok")
+    before = count(metrics.downstream_calls, *labels)
+    response = client.get("/_test/sheet/7")
+    assert response.json() == {"row": 7}
+    assert count(metrics.downstream_calls, *labels) == before + 1
+    assert response.headers["Server-Timing"].startswith('sheets;dur=')
+    assert 'desc="1 calls"' in response.headers["Server-Timing"]
+
+
+def test_rendered_labels_are_escaped():
+    counter = metrics.Counter("test_total", "Test", ("route",))
+    counter.inc('/a"b\\c\nd')
+    assert list(counter.render())[-1] == 'test_total{route="/a\\"b\\\\c\\nd"} 1.0'
@@ -0,0 +1,87 @@
+import time
+
+import pytest
+
+from otp_store import MemoryOTPStore, SQLiteOTPStore
+
+
+@pytest.fixture(params=["memory", "sqlite"])
+def store(request, tmp_path):
+    if request.param == "memory":
+        return MemoryOTPStore(verified_ttl=60)
+    return SQLiteOTPStore(str(tmp_path / "otp.db"), verified_ttl=60)
+
+
+def test_verify_hands_out_a_reset_token(store):
+    assert store.issue("u1@x", "111111", 60)
+    assert store.verify("000000") == ("invalid", None, None)
+    status, email, token = store.verify("111111")
+    assert (status, email) == ("ok", "u1@x")
+    assert store.verified_email("u1@x", token) == "u1@x"
+    assert store.verified_email("u1@x", "guess") is None
+
+
+def test_reset_is_bound_to_the_verified_email(store):
+    store.issue("u1@x", "111111", 60)
+    store.issue("u2@x", "222222", 60)
+    _, _, token1 = store.verify("111111")
+    _, _, token2 = store.verify("222222")
+
+    # u2 can neither use u1's email with their own token nor consume u1's entry
+    assert store.verified_email("u1@x", token2) is None
+    assert not store.consume_verified("u1@x", token2)
+    assert store.consume_verified("u2@x", token2)
+    assert store.verified_email("u1@x", token1) == "u1@x"
+
+
+def test_unverified_email_cannot_reset(store):
+    store.issue("u1@x", "111111", 60)
+    assert store.verified_email("u1@x", None) is None
+    assert not store.consume_verified("u1@x", "")
+
+
+def test_reset_token_works_once(store):
+    store.issue("u1@x", "111111", 60)
+    _, _, token = store.verify("111111")
+    assert store.consume_verified("u1@x", token)
+    assert not store.consume_verified("u1@x", token)
+
+
+def test_expired_otp(store):
+    store.issue("u1@x", "111111", 0.05)
+    time.sleep(0.1)
+    assert store.verify("111111") == ("expired", "u1@x", None)
+
+
+def test_sqlite_store_migrates_old_table(tmp_path):
+    import sqlite3
+    path = str(tmp_path / "otp.db")
+    conn = sqlite3.connect(path)
+    conn.execute("CREATE TABLE otps (email TEXT PRIMARY KEY, otp TEXT NOT NULL UNIQUE, "
+                 "expires_at REAL NOT NULL, verified INTEGER NOT NULL DEFAULT 0)")
+    conn.commit()
+    conn.close()
+    store = SQLiteOTPStore(path)
+    store.issue("u1@x", "111111", 60)
+    _, _, token = store.verify("111111")
+    assert store.consume_verified("u1@x", token)
+
+
+def test_reset_password_changes_only_the_verifying_users_password(main_module):
+    from fastapi.testclient import TestClient
+    main = main_module
+    for n in (1, 2):
+        main.storage.add("register", {"username": f"u{n}", "email": f"u{n}@x", "password": "old"})
+        main.otp_store.issue(f"u{n}@x", f"{n}" * 6, 60)
+    first, second = TestClient(main.app), TestClient(main.app)
+    assert first.post("/verify-forgot-password", data={"otp": "111111"}).json()["status"] == "success"
+    verified = second.post("/verify-forgot-password", data={"otp": "222222"}).json()
+
+    # Claiming the other user's email with one's own token is refused
+    hijack = second.post("/reset-password", data={"new_password": "pwned", "email": "u1@x",
+                                                  "reset_token": verified["reset_token"]})
+    assert hijack.json()["status"] == "error"
+    # The cookies from /verify-forgot-password bind the reset to u2
+    assert second.post("/reset-password", data={"new_password": "new"}).json()["status"] == "success"
+    assert main.storage.get_user("u2@x")["password"] == "new"
+    assert main.storage.get_user("u1@x")["password"] == "old"
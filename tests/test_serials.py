@@ -0,0 +1,101 @@
+import threading
+import time
+
+import pytest
+
+import serials
+from serials import SerialAllocator
+
+
+class FakeSheet:
+    """Answers the S.No column read with ``rows`` filled rows"""
+
+    def __init__(self, rows, delay=0.0):
+        self.rows = rows
+        self.delay = delay
+        self.fail = False
+        self.calls = 0
+
+    def spreadsheets(self):
+        return self
+
+    def values(self):
+        return self
+
+    def get(self, **kwargs):
+        return self
+
+    def execute(self):
+        self.calls += 1
+        time.sleep(self.delay)
+        if self.fail:
+            raise OSError("quota exhausted")
+        return {"values": [[str(n)] for n in range(1, self.rows + 1)]}
+
+
+@pytest.fixture(autouse=True)
+def state_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(serials, "state_path", lambda name: str(tmp_path / name))
+
+
+def allocator(sheet, **kwargs):
+    allocator = SerialAllocator(lambda: sheet, **kwargs)
+    allocator.register("jobs", "id", "jobs")
+    return allocator
+
+
+def test_numbers_continue_after_the_sheet():
+    serial = allocator(FakeSheet(rows=3))
+    assert serial.next("jobs") == 4
+    assert serial.next_block("jobs", 3) == 5
+    assert serial.next("jobs") == 8
+
+
+def test_concurrent_allocations_are_unique():
+    serial = allocator(FakeSheet(rows=0))
+    numbers = []
+
+    def take():
+        for _ in range(20):
+            numbers.append(serial.next("jobs"))
+
+    threads = [threading.Thread(target=take) for _ in range(5)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert sorted(numbers) == list(range(1, 101))
+
+
+def test_stale_counter_is_resynced_once():
+    sheet = FakeSheet(rows=0, delay=0.1)
+    serial = allocator(sheet, resync_seconds=0.5)
+    serial.next("jobs")
+    time.sleep(0.6)
+    sheet.calls = 0
+
+    threads = [threading.Thread(target=serial.next, args=("jobs",)) for _ in range(5)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    # Callers that waited for the re-sync use its result
+    assert sheet.calls == 1
+
+
+def test_failed_resync_falls_back_to_local_counter():
+    sheet = FakeSheet(rows=2)
+    serial = allocator(sheet, resync_seconds=0, retry_seconds=60)
+    assert serial.next("jobs") == 3
+
+    sheet.fail = True
+    sheet.calls = 0
+    assert [serial.next("jobs") for _ in range(3)] == [4, 5, 6]
+    assert sheet.calls == 1
+
+
+def test_first_seed_failure_is_raised():
+    sheet = FakeSheet(rows=0)
+    sheet.fail = True
+    with pytest.raises(OSError):
+        allocator(sheet).next("jobs")
@@ -0,0 +1,113 @@
+import json
+import threading
+import time
+
+import pytest
+
+from sheets_batch import AppendCoalescer, row_from_range
+
+
+class FakeSheet:
+    """Records values().append calls and reports the rows they landed on"""
+
+    def __init__(self, fail_times=0):
+        self.calls = []
+        self.fail_times = fail_times
+        self.next_row = 2
+        self.lock = threading.Lock()
+
+    def spreadsheets(self):
+        return self
+
+    def values(self):
+        return self
+
+    def append(self, **kwargs):
+        self.kwargs = kwargs
+        return self
+
+    def execute(self):
+        with self.lock:
+            if self.fail_times:
+                self.fail_times -= 1
+                raise OSError("503")
+            rows = self.kwargs["body"]["values"]
+            self.calls.append(rows)
+            first = self.next_row
+            self.next_row += len(rows)
+        return {"updates": {"updatedRange": f"sheet!A{first}:C{first + len(rows) - 1}"}}
+
+
+def test_rows_are_written_in_one_append():
+    sheet = FakeSheet()
+    appender = AppendCoalescer(lambda: sheet, flush_seconds=0.2)
+    futures = [appender.submit("id", "sheet!A:C", [n]) for n in range(5)]
+    assert [f.result(timeout=5) for f in futures] == [2, 3, 4, 5, 6]
+    assert sheet.calls == [[[0], [1], [2], [3], [4]]]
+    appender.close()
+
+
+def test_batches_are_capped_at_max_rows():
+    sheet = FakeSheet()
+    appender = AppendCoalescer(lambda: sheet, flush_seconds=10, max_rows=2)
+    futures = [appender.submit("id", "sheet!A:C", [n]) for n in range(4)]
+    for future in futures:
+        future.result(timeout=5)
+    assert [len(rows) for rows in sheet.calls] == [2, 2]
+    appender.close()
+
+
+def test_failed_appends_are_retried_then_reported():
+    sheet = FakeSheet(fail_times=1)
+    appender = AppendCoalescer(lambda: sheet, flush_seconds=0.05, max_attempts=3, backoff=lambda attempt, _: 0.01)
+    assert appender.submit("id", "sheet!A:C", ["a"]).result(timeout=5) == 2
+
+    sheet.fail_times = 3
+    future = appender.submit("id", "sheet!A:C", ["b"])
+    with pytest.raises(OSError):
+        future.result(timeout=5)
+    appender.close()
+
+
+def test_retries_back_off():
+    sheet = FakeSheet(fail_times=2)
+    attempts = []
+
+    def backoff(attempt, retry_after):
+        attempts.append(attempt)
+        return 0.2 * 2 ** attempt
+
+    appender = AppendCoalescer(lambda: sheet, flush_seconds=0.01, max_attempts=3, backoff=backoff)
+    start = time.monotonic()
+    assert appender.submit("id", "sheet!A:C", ["a"]).result(timeout=5) == 2
+    assert time.monotonic() - start >= 0.6
+    assert attempts == [0, 1]
+    appender.close()
+
+
+def test_dropped_rows_are_dead_lettered(tmp_path):
+    sheet = FakeSheet(fail_times=2)
+    path = tmp_path / "dead-letter.jsonl"
+    appender = AppendCoalescer(lambda: sheet, flush_seconds=0.01, max_attempts=2, backoff=lambda attempt, _: 0.01,
+                               dead_letter_path=str(path))
+    future = appender.submit("id", "payment!A:E", ["a@x", 100])
+    with pytest.raises(OSError):
+        future.result(timeout=5)
+    appender.close()
+    [entry] = [json.loads(line) for line in path.read_text().splitlines()]
+    assert entry["range"] == "payment!A:E"
+    assert entry["row"] == ["a@x", 100]
+    assert entry["error"] == "503"
+
+
+def test_close_flushes_queued_rows():
+    sheet = FakeSheet()
+    appender = AppendCoalescer(lambda: sheet, flush_seconds=60)
+    future = appender.submit("id", "sheet!A:C", ["a"])
+    appender.close()
+    assert future.result(timeout=0) == 2
+
+
+def test_row_from_range():
+    assert row_from_range("register!A12:F12") == 12
+    assert row_from_range(None) is None
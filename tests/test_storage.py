@@ -0,0 +1,130 @@
+import pytest
+
+import serials
+from bench.fake_sheets import FakeSheets
+from sheets_batch import AppendCoalescer
+from sheets_storage import RECORD_FIELDS, SheetsStorage
+from storage import MemoryStorage, SQLiteStorage
+
+
+class Call:
+    def __init__(self, run):
+        self.run = run
+
+    def execute(self):
+        return self.run()
+
+
+class FakeService:
+    """spreadsheets().values() calls answered in-process by bench/fake_sheets.py"""
+
+    def __init__(self):
+        self.fake = FakeSheets()
+
+    def spreadsheets(self):
+        return self
+
+    def values(self):
+        return self
+
+    def get(self, spreadsheetId, range, **kwargs):
+        return Call(lambda: self.fake.get(spreadsheetId, range))
+
+    def update(self, spreadsheetId, range, body, **kwargs):
+        return Call(lambda: self.fake.update(spreadsheetId, range, body["values"]))
+
+    def append(self, spreadsheetId, range, body, **kwargs):
+        return Call(lambda: self.fake.append(spreadsheetId, range, body["values"]))
+
+
+SHEETS = {kind: (f"{kind}-id", kind) for kind in ("register", "loginhistory", "contactus", "jobs", "payment")}
+
+
+@pytest.fixture(params=["memory", "sqlite", "sheets"])
+def storage(request, tmp_path, monkeypatch):
+    if request.param == "memory":
+        yield MemoryStorage()
+        return
+    if request.param == "sqlite":
+        storage = SQLiteStorage(str(tmp_path / "portal.db"))
+        storage.start()
+        yield storage
+        return
+
+    monkeypatch.setattr(serials, "state_path", lambda name: str(tmp_path / name))
+    service = FakeService()
+    for kind, (spreadsheet_id, sheet_name) in SHEETS.items():
+        service.fake.update(spreadsheet_id, f"{sheet_name}!A1", [RECORD_FIELDS[kind]])
+    allocator = serials.SerialAllocator(lambda: service)
+    for kind, (spreadsheet_id, sheet_name) in SHEETS.items():
+        allocator.register(kind, spreadsheet_id, sheet_name)
+    storage = SheetsStorage(lambda: service, SHEETS, AppendCoalescer(lambda: service, flush_seconds=0.01),
+                            allocator, None, user_miss_reload_seconds=0)
+    storage.users.load()
+    yield storage
+    storage.close()
+
+
+ANN = {"username": "ann", "email": "Ann@x.com", "password": "pw", "mobile_number": "1",
+       "registered_time": "2024-01-01 10:00:00"}
+
+
+def test_registered_user_round_trip(storage):
+    stored = storage.add("register", ANN)
+    assert stored["sno"] == 1
+    assert storage.get_user("ann@X.com")["username"] == "ann"
+    assert "ann@x.com" in storage.registered_emails()
+    assert storage.get_user("bob@x.com") is None
+
+
+def test_set_password(storage):
+    storage.add("register", ANN)
+    if isinstance(storage, SheetsStorage):
+        storage.appender.flush()  # the row number is known once the append is written
+    assert storage.set_password("ann@x.com", "new")
+    assert storage.get_user("ann@x.com")["password"] == "new"
+    assert not storage.set_password("bob@x.com", "new")
+
+
+def test_logout_closes_the_latest_open_login(storage):
+    storage.add("loginhistory", {"username": "ann", "email": "ann@x.com", "login_time": "2024-01-01 10:00:00"})
+    login = storage.record_logout("ann@x.com", "2024-01-01 11:30:15")
+    assert login["hours_spent"] == "1:30:15"
+    assert storage.record_logout("ann@x.com", "2024-01-01 12:00:00") is None
+
+
+def test_records_page_with_cursors(storage):
+    for n in range(5):
+        storage.add("contactus", {"name": f"c{n}", "email": f"c{n}@x.com", "submitted_at": "2024-01-01 10:00:00"})
+    if isinstance(storage, SheetsStorage):
+        storage.appender.flush()
+    first = storage.records("contactus", limit=2)
+    assert [record["name"] for _, record in first] == ["c0", "c1"]
+    rest = storage.records("contactus", after=first[-1][0])
+    assert [record["name"] for _, record in rest] == ["c2", "c3", "c4"]
+    assert [record["sno"] for _, record in first + rest] == ["1", "2", "3", "4", "5"] \
+        if isinstance(storage, SheetsStorage) else [1, 2, 3, 4, 5]
+
+
+def test_resume_link_reads_back_as_the_url(storage):
+    link = "https://portal.example.com/resumes/" + "0" * 64
+    storage.add("jobs", {"name": "ann", "email": "ann@x.com", "resume_link": link})
+    if isinstance(storage, SheetsStorage):
+        storage.appender.flush()
+    [(_, record)] = storage.records("jobs")
+    assert record["resume_link"] == link
+
+
+def test_add_many_numbers_records_consecutively(storage):
+    storage.add("register", ANN)
+    stored = storage.add_many("register", [dict(ANN, email=f"u{n}@x.com") for n in range(3)])
+    assert [int(record["sno"]) for record in stored] == [2, 3, 4]
+    assert storage.get_user("u2@x.com")["username"] == "ann"
+
+
+def test_add_many_skips_emails_registered_meanwhile():
+    for storage in (MemoryStorage(), SQLiteStorage(":memory:")):
+        storage.add("register", ANN)
+        stored = storage.add_many("register", [dict(ANN, email="ANN@x.com"), dict(ANN, email="bob@x.com")])
+        assert stored[0] is None
+        assert stored[1]["email"] == "bob@x.com"
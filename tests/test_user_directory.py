@@ -0,0 +1,152 @@
+import threading
+import time
+from concurrent.futures import Future
+
+import pytest
+
+from sheets_quota import SheetsQuotaExhausted
+from sheets_storage import SheetsStorage, UserDirectory
+
+
+class FakeSheet:
+    """Stands in for service.spreadsheets().values().get(...).execute()"""
+
+    def __init__(self, rows, delay=0.0):
+        self.rows = rows
+        self.delay = delay
+        self.fail = None  # exception raised by execute()
+        self.calls = 0
+
+    def spreadsheets(self):
+        return self
+
+    def values(self):
+        return self
+
+    def get(self, **kwargs):
+        return self
+
+    def execute(self):
+        self.calls += 1
+        time.sleep(self.delay)
+        if self.fail:
+            raise self.fail
+        return {"values": [list(row) for row in self.rows]}
+
+
+def directory(sheet, miss_reload_seconds=0, retry_seconds=30):
+    return UserDirectory(lambda: sheet, "id", "register", refresh_seconds=300,
+                         miss_reload_seconds=miss_reload_seconds, retry_seconds=retry_seconds)
+
+
+ALICE = ["1", "alice", "Alice@x.com", "pw", "1", "2024-01-01 00:00:00"]
+
+
+def test_lookup_is_case_insensitive():
+    users = directory(FakeSheet([ALICE]))
+    users.load()
+    assert users.get("alice@X.com")["row"] == 2
+
+
+def test_concurrent_misses_share_one_download():
+    sheet = FakeSheet([ALICE], delay=0.2)
+    users = directory(sheet)
+    users.load()
+    sheet.calls = 0
+
+    threads = [threading.Thread(target=users.get, args=(f"new{i}@x.com",)) for i in range(10)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert sheet.calls == 1
+
+
+def test_failed_load_backs_off():
+    sheet = FakeSheet([ALICE])
+    sheet.fail = OSError("sheets unavailable")
+    users = directory(sheet, retry_seconds=60)
+    for _ in range(5):
+        assert users.get("alice@x.com") is None
+    assert sheet.calls == 1
+
+
+def test_missing_email_is_remembered():
+    sheet = FakeSheet([ALICE])
+    users = directory(sheet, miss_reload_seconds=0.2)
+    users.load()
+    time.sleep(0.25)
+
+    assert users.get("bob@x.com") is None
+    assert users.get("bob@x.com") is None
+    assert sheet.calls == 2
+
+    users.add({"row": None, "email": "bob@x.com", "username": "bob"})
+    assert users.get("bob@x.com")["username"] == "bob"
+
+
+def test_reload_keeps_users_whose_rows_are_still_queued():
+    sheet = FakeSheet([ALICE])
+    users = directory(sheet)
+    users.load()
+    users.add({"row": None, "email": "bob@x.com", "username": "bob"})
+
+    users.load()
+    assert users.get("bob@x.com")["username"] == "bob"
+
+    # Once the row is in the sheet the downloaded copy takes over
+    sheet.rows = [ALICE, ["2", "bob", "bob@x.com", "pw", "2", "2024-01-01 00:00:00"]]
+    users.load()
+    assert users.get("bob@x.com")["row"] == 3
+
+
+def test_quota_exhaustion_reaches_the_request():
+    sheet = FakeSheet([ALICE])
+    sheet.fail = SheetsQuotaExhausted("read", 7)
+    users = directory(sheet)
+    users.refresh()  # startup / background: logged only
+
+    users._retry_at = 0
+    with pytest.raises(SheetsQuotaExhausted):
+        users.get("alice@x.com")
+
+
+class QueuedAppends:
+    """Write-behind appender whose futures the test resolves"""
+
+    def __init__(self):
+        self.futures = []
+
+    def submit(self, *args, **kwargs):
+        self.futures.append(Future())
+        return self.futures[-1]
+
+
+class Serials:
+    def next(self, kind):
+        return 2
+
+
+def test_registration_that_never_reaches_the_sheet_is_dropped():
+    sheet = FakeSheet([ALICE])
+    appends = QueuedAppends()
+    storage = SheetsStorage(lambda: sheet, {"register": ("id", "register")}, appends, Serials(), None,
+                            user_miss_reload_seconds=0)
+    storage.users.load()
+    storage.add("register", {"username": "bob", "email": "bob@x.com", "password": "pw"})
+    assert storage.get_user("bob@x.com")["username"] == "bob"
+
+    appends.futures[0].set_exception(OSError("503"))
+    assert storage.get_user("bob@x.com") is None
+    assert "bob@x.com" not in storage.registered_emails()
+    assert not storage.set_password("bob@x.com", "new")
+
+
+def test_written_registration_gets_its_row():
+    sheet = FakeSheet([ALICE])
+    appends = QueuedAppends()
+    storage = SheetsStorage(lambda: sheet, {"register": ("id", "register")}, appends, Serials(), None)
+    storage.users.load()
+    storage.add("register", {"username": "bob", "email": "bob@x.com", "password": "pw"})
+    appends.futures[0].set_result(3)
+    assert storage.users.get("bob@x.com")["row"] == 3
@@ -0,0 +1,60 @@
+import os
+
+
+# ==============================
+# Streaming Upload Helpers
+# ==============================
+CHUNK_SIZE = 64 * 1024  # bytes read from an upload at a time
+
+# (magic bytes, allowed extensions, MIME type)
+UPLOAD_SIGNATURES = [
+    (b"%PDF-", (".pdf",), "application/pdf"),
+    (b"\xd0\xcf\x11\xe0\xa1\xb1\x1a\xe1", (".doc",), "application/msword"),
+    (b"PK\x03\x04", (".docx",), "application/vnd.openxmlformats-officedocument.wordprocessingml.document"),
+]
+
+
+class UploadRejected(Exception):
+    """Raised when an upload is too large or not one of the allowed file types"""
+
+    def __init__(self, status_code: int, detail: str):
+        super().__init__(detail)
+        self.status_code = status_code
+        self.detail = detail
+
+
+def sniff_content_type(filename: str, head: bytes) -> str:
+    """Return the MIME type if the file's magic bytes match its extension"""
+    ext = os.path.splitext(filename or "")[1].lower()
+    for magic, extensions, content_type in UPLOAD_SIGNATURES:
+        if ext in extensions and head.startswith(magic):
+            return content_type
+    raise UploadRejected(400, "Only PDF, DOC, DOCX files are allowed")
+
+
+def inspect_upload(upload, max_bytes: int) -> str:
+    """Check size and file type of an UploadFile without reading it into memory"""
+    f = upload.file
+    f.seek(0, os.SEEK_END)
+    size = f.tell()
+    f.seek(0)
+    if size > max_bytes:
+        raise UploadRejected(413, f"File too large (max {max_bytes // (1024 * 1024)} MB)")
+    head = f.read(16)
+    f.seek(0)
+    return sniff_content_type(upload.filename, head)
+
+
+def iter_upload(upload, max_bytes: int, chunk_size: int = CHUNK_SIZE):
+    """Yield the upload in chunks, stopping if it grows past max_bytes"""
+    f = upload.file
+    f.seek(0)
+    total = 0
+    while True:
+        chunk = f.read(chunk_size)
+        if not chunk:
+            break
+        total += len(chunk)
+        if total > max_bytes:
+            raise UploadRejected(413, f"File too large (max {max_bytes // (1024 * 1024)} MB)")
+        yield chunk